@@ -2,6 +2,15 @@
 import subprocess
 import os
 import glob
+import csv
+import time
+from fold_cache import FoldCache, read_fasta, register_colabfold_results
+
+# Commands run before colabfold_batch in every job script
+setup_commands = ["source /dtu/projects/RFdiffusion/setup.sh", "module load colabfold"]
+
+# Command of one job, a local stand-in such as "sleep 1 && touch {output_dir}/done" can be used for testing
+colabfold_command = "colabfold_batch {input_fasta} {output_dir}"
 
 def run_colabfold(input_fasta, output_dir):
     try:
@@ -38,7 +47,161 @@ def create_folder(directory_path):
     else:
         print(f"Folder already exists: {directory_path}")
 
-def process_fastas(input_fasta_dir, output_base_dir):
+def write_job_script(job, command=colabfold_command, setup=setup_commands):
+    """
+    Write the bash script of one job into its output folder, so concurrent jobs never share a script.
+
+    Args:
+        job (dict): Job with 'input_fasta' and 'output_dir'.
+        command (str): Command template formatted with the absolute input_fasta and output_dir.
+        setup (list): Commands run before the command.
+
+    Returns:
+        str: Path of the script.
+    """
+    script_path = os.path.join(job['output_dir'], "run_colabfold.sh")
+    lines = ["#!/bin/bash", "set -e"] + list(setup) + [
+        command.format(input_fasta=os.path.abspath(job['input_fasta']), output_dir=os.path.abspath(job['output_dir']))
+    ]
+    with open(script_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    os.chmod(script_path, 0o755)
+    return script_path
+
+def run_jobs(jobs, n_slots=1, max_retries=1, command=colabfold_command, setup=setup_commands,
+             devices=None, poll_interval=5, summary_path=None, next_job=None, on_finish=None):
+    """
+    Run ColabFold jobs concurrently, at most n_slots at a time.
+
+    Every job runs in its own output folder with its own script and log (colabfold.log). The
+    running processes are polled without blocking, a free slot starts the next queued job and
+    failed jobs are queued again until they have been tried max_retries + 1 times.
+
+    Args:
+        jobs (list): Jobs as dicts with 'name', 'input_fasta' and 'output_dir'.
+        n_slots (int): Number of jobs running at the same time, e.g. the number of GPUs.
+        max_retries (int): Number of times a failed job is started again.
+        command (str): Command template, see write_job_script.
+        setup (list): Commands run before the command.
+        devices (list): Device ids, slot i runs with CUDA_VISIBLE_DEVICES=devices[i % len(devices)].
+            Default None, the environment is not changed.
+        poll_interval (float): Seconds between checks of the running processes.
+        summary_path (str): CSV file the per-job summary is saved to. Default None.
+        next_job (callable): Called without arguments when a slot is free and the queue is empty,
+            returns the next job or None when there are no more. Default None, only jobs are run.
+        on_finish (callable): Called with every finished job (after its last attempt), before
+            the free slot is refilled. Default None.
+
+    Returns:
+        list: One dict per job with status ('done' or 'failed'), attempts, return code, slot,
+            seconds queued and seconds running (of the last attempt).
+    """
+    start_time = time.time()
+    queue = [dict(job, attempts=0, queued_at=start_time) for job in jobs]
+    running = {}
+    finished = []
+    free_slots = list(range(n_slots))
+
+    while queue or running or next_job is not None:
+        # Ask for new jobs while slots would stay free
+        while next_job is not None and len(queue) < len(free_slots):
+            job = next_job()
+            if job is None:
+                next_job = None
+            else:
+                queue.append(dict(job, attempts=0, queued_at=time.time()))
+
+        # Start queued jobs on the free slots
+        while queue and free_slots:
+            job = queue.pop(0)
+            slot = free_slots.pop(0)
+            os.makedirs(job['output_dir'], exist_ok=True)
+            script_path = write_job_script(job, command=command, setup=setup)
+            env = dict(os.environ)
+            if devices:
+                env['CUDA_VISIBLE_DEVICES'] = str(devices[slot % len(devices)])
+            job['attempts'] += 1
+            log = open(os.path.join(job['output_dir'], "colabfold.log"), "a")
+            log.write(f"# Attempt {job['attempts']} on slot {slot}\n")
+            log.flush()
+            job.update(slot=slot, started_at=time.time(), log=log)
+            process = subprocess.Popen(["bash", os.path.abspath(script_path)], cwd=job['output_dir'], env=env,
+                                       stdout=log, stderr=subprocess.STDOUT)
+            running[process] = job
+            print(f"Started {job['name']} on slot {slot} (attempt {job['attempts']})")
+
+        time.sleep(poll_interval if running else 0)
+
+        # Collect finished processes
+        for process in [process for process in running if process.poll() is not None]:
+            job = running.pop(process)
+            job['log'].close()
+            free_slots.append(job['slot'])
+            job.update(returncode=process.returncode, finished_at=time.time())
+            if process.returncode == 0:
+                job['status'] = 'done'
+            elif job['attempts'] <= max_retries:
+                print(f"{job['name']} failed with code {process.returncode}, retrying")
+                job['queued_at'] = time.time()
+                queue.append(job)
+                continue
+            else:
+                job['status'] = 'failed'
+                print(f"{job['name']} failed with code {process.returncode}, see {job['output_dir']}/colabfold.log")
+            finished.append(job)
+            if on_finish is not None:
+                on_finish(job)
+
+    summary = [{
+        'name': job['name'], 'input_fasta': job['input_fasta'], 'output_dir': job['output_dir'],
+        'status': job['status'], 'attempts': job['attempts'], 'returncode': job['returncode'], 'slot': job['slot'],
+        'queue_seconds': round(job['started_at'] - job['queued_at'], 3),
+        'run_seconds': round(job['finished_at'] - job['started_at'], 3)
+    } for job in finished]
+    n_done = sum(job['status'] == 'done' for job in summary)
+    print(f"Folded {n_done} of {len(summary)} jobs on {n_slots} slots in {time.time() - start_time:.2f} seconds.")
+
+    if summary_path is not None and summary:
+        with open(summary_path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(summary[0]))
+            writer.writeheader()
+            writer.writerows(summary)
+    return summary
+
+def uncached_fasta(fasta_file, output_dir, cache):
+    """
+    FASTA file with only the queries that are not in the fold cache.
+
+    Returns:
+        str: fasta_file if nothing is cached, a reduced copy in output_dir if some queries are cached,
+            None if all of them are.
+    """
+    records = read_fasta(fasta_file)
+    uncached = cache.uncached_records(records)
+    if len(uncached) == len(records):
+        return fasta_file
+    print(f"{len(records) - len(uncached)} of {len(records)} queries of {fasta_file} are already folded")
+    if not uncached:
+        return None
+    create_folder(output_dir)
+    reduced_fasta = os.path.join(output_dir, "uncached.fasta")
+    with open(reduced_fasta, "w") as file:
+        file.write("".join(f">{name}\n{sequence}\n" for name, sequence in uncached))
+    return reduced_fasta
+
+def process_fastas(input_fasta_dir, output_base_dir, n_slots=None, cache=None, target_name=None, **kwargs):
+    """
+    Fold every FASTA file of a folder into its own output folder.
+
+    With n_slots set the files are folded concurrently by run_jobs (keyword arguments are passed on)
+    and a colabfold_summary.csv is written to output_base_dir, otherwise one after the other.
+    With a FoldCache, queries folded before are left out and the results of every job are added to
+    the cache (stored with target_name if given) as soon as it finishes. Outputs an interrupted
+    earlier run left in the output folders are added first, so a rerun only folds what is missing.
+
+    Returns:
+        list: Summary of run_jobs with n_slots set, otherwise empty.
+    """
     # Get all the FASTA files in the input directory
     fasta_files = glob.glob(os.path.join(input_fasta_dir, "*.fasta"))
     
@@ -46,17 +209,51 @@ def process_fastas(input_fasta_dir, output_base_dir):
         print(f"No FASTA files found in {input_fasta_dir}")
         return
 
-    # Iterate through each FASTA file and create an output folder for it
-    for fasta_file in fasta_files:
+    metadata = {'target_name': target_name} if target_name is not None else {}
+
+    def register(job, **register_kwargs):
+        n_stored = register_colabfold_results(cache, job['input_fasta'], job['output_dir'],
+                                              **register_kwargs, **metadata)
+        if n_stored:
+            print(f"Added {n_stored} folds of {job['name']} to the fold cache {cache.root}")
+
+    # Input file and output folder of every FASTA file that still has queries to fold
+    jobs = []
+    for fasta_file in sorted(fasta_files):
         # Extract the base name of the FASTA file (without the path and extension)
         fasta_basename = os.path.basename(fasta_file).replace(".fasta", "")
-
-        # Create a corresponding output folder for this FASTA file
         output_dir = os.path.join(output_base_dir, fasta_basename)
-        create_folder(output_dir)
+        if cache is not None:
+            # Results of an interrupted run of this file, older outputs belong to an earlier file
+            register({'name': fasta_basename, 'input_fasta': fasta_file, 'output_dir': output_dir},
+                     since=os.path.getmtime(fasta_file))
+        input_fasta = fasta_file if cache is None else uncached_fasta(fasta_file, output_dir, cache)
+        if input_fasta is not None:
+            jobs.append({'name': fasta_basename, 'input_fasta': input_fasta, 'output_dir': output_dir})
+
+    if n_slots is not None:
+        kwargs.setdefault('summary_path', os.path.join(output_base_dir, "colabfold_summary.csv"))
+        if cache is not None:
+            # Failed jobs may still have folded some of their queries
+            on_finish = kwargs.pop('on_finish', None)
+            def finish(job):
+                register(job)
+                if on_finish is not None:
+                    on_finish(job)
+            kwargs['on_finish'] = finish
+        summary = run_jobs(jobs, n_slots=n_slots, **kwargs)
+    else:
+        summary = []
+        # Iterate through each FASTA file and create an output folder for it
+        for job in jobs:
+            # Create a corresponding output folder for this FASTA file
+            create_folder(job['output_dir'])
 
-        # Run the colabfold for this specific FASTA file
-        run_colabfold(fasta_file, output_dir)
+            # Run the colabfold for this specific FASTA file
+            run_colabfold(job['input_fasta'], job['output_dir'])
+            if cache is not None:
+                register(job)
+    return summary
 
 
 # Example usage
@@ -70,6 +267,10 @@ if __name__ == "__main__":
 
     # Process each FASTA file and create an output folder for each
     process_fastas(input_fasta_dir, output_base_dir)
+    # Or fold several files at the same time, one per GPU of the node
+    # process_fastas(input_fasta_dir, output_base_dir, n_slots=2, devices=[0, 1], max_retries=1)
+    # Skip binder/target pairs folded before and keep the new results
+    # process_fastas(input_fasta_dir, output_base_dir, cache=FoldCache("fold_cache", settings={'model': 'alphafold2_ptm'}))
 
 
 
@@ -0,0 +1,235 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+# Bump when the key or the entry layout changes, old entries are then no longer found
+CACHE_VERSION = 1
+
+
+def read_fasta(path):
+    """(name, sequence) records of a FASTA file."""
+    records = []
+    name, lines = None, []
+    with open(path, 'r') as fasta_file:
+        for line in fasta_file:
+            line = line.strip()
+            if line.startswith('>'):
+                if name is not None:
+                    records.append((name, ''.join(lines)))
+                name, lines = line[1:], []
+            elif line:
+                lines.append(line)
+    if name is not None:
+        records.append((name, ''.join(lines)))
+    return records
+
+
+def safe_filename(name):
+    """File name ColabFold uses for a query, every character other than letters, digits, '_', '.' and '-' becomes '_'."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def split_complex(sequence):
+    """Binder and target of a ColabFold query 'binder:target', the target is '' for a binder alone."""
+    binder, _, target = sequence.partition(':')
+    return binder, target
+
+
+class FoldCache:
+    def __init__(self, root, settings=None):
+        """
+        Content-addressed store of fold results, so no binder/target pair is folded twice.
+
+        Every entry is a JSON file named after the SHA-256 of the binder sequence, the target and
+        the model settings, in a folder named after the first two characters of the hash. Entries
+        are written atomically, so concurrent jobs can share one cache.
+
+        Args:
+            root (str): Folder of the cache.
+            settings (dict): Model settings that change the result, e.g. {'model': 'alphafold2_ptm', 'num_recycle': 3}.
+        """
+        self.root = root
+        self.settings = dict(settings or {})
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, sequence, target=''):
+        """Hash of a binder sequence, a target (sequence or name) and the settings of the cache."""
+        content = json.dumps({'version': CACHE_VERSION, 'sequence': sequence, 'target': target,
+                              'settings': self.settings}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, sequence, target=''):
+        """Cached entry of a binder/target pair, None if it was not folded yet."""
+        path = self.path(self.key(sequence, target))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable fold cache entry {path}: {e}")
+            return None
+
+    def __contains__(self, pair):
+        sequence, target = pair
+        return os.path.exists(self.path(self.key(sequence, target)))
+
+    def put(self, sequence, target='', scores=None, structure_path=None, **metadata):
+        """
+        Store the result of a fold.
+
+        Args:
+            sequence (str): Binder sequence.
+            target (str): Target sequence or name.
+            scores (dict): Scores of the fold, e.g. pLDDT, ipTM or ipAE.
+            structure_path (str): Path to the predicted structure.
+            **metadata: Other fields to keep, e.g. name or target_name.
+
+        Returns:
+            str: Key of the entry.
+        """
+        key = self.key(sequence, target)
+        entry = dict(metadata, key=key, sequence=sequence, target=target, settings=self.settings,
+                     scores=scores or {}, structure_path=structure_path, created=time.time())
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(entry, file)
+        os.replace(tmp_path, path)
+        return key
+
+    def entries(self):
+        """Yield every entry of the cache."""
+        for path in glob.glob(os.path.join(self.root, '??', '*.json')):
+            try:
+                with open(path, 'r') as file:
+                    yield json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable fold cache entry {path}: {e}")
+
+    def to_frame(self):
+        """All entries as a DataFrame, one column per score."""
+        import pandas as pd
+        rows = []
+        for entry in self.entries():
+            row = {field: value for field, value in entry.items() if field not in ('scores', 'settings')}
+            row.update(entry['scores'])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def uncached_records(self, records):
+        """FASTA records whose binder/target pair is not in the cache."""
+        return [(name, sequence) for name, sequence in records if split_complex(sequence) not in self]
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+# Suffixes of the rank 1 files after '<query>_', rank_001 in newer ColabFold versions and rank_1 in older ones
+rank1_score_pattern = re.compile(r'_(?:scores_rank_001_.*|unrelaxed_rank_1_.*_scores)\.json$')
+rank1_structure_pattern = re.compile(r'_(?P<kind>relaxed|unrelaxed)_rank_(?:001|1)_.*\.pdb$')
+
+
+def colabfold_outputs(output_dir):
+    """
+    Rank 1 score file and structure of every query in a ColabFold output folder.
+
+    The query name is everything before the rank 1 suffix of a file name, so a query is never
+    paired with the files of a longer query that starts with its name (binder_1 and binder_1_A12G).
+    A relaxed structure is preferred over the unrelaxed one.
+
+    Returns:
+        dict: Query name (as in the file names, see safe_filename) -> [score_path, structure_path],
+            None for a missing file.
+    """
+    outputs = {}
+    relaxed = set()
+    for file_name in sorted(os.listdir(output_dir)) if os.path.isdir(output_dir) else []:
+        path = os.path.join(output_dir, file_name)
+        match = rank1_score_pattern.search(file_name)
+        if match:
+            outputs.setdefault(file_name[:match.start()], [None, None])[0] = path
+            continue
+        match = rank1_structure_pattern.search(file_name)
+        if match:
+            name = file_name[:match.start()]
+            if name not in relaxed:
+                outputs.setdefault(name, [None, None])[1] = path
+            if match.group('kind') == 'relaxed':
+                relaxed.add(name)
+    return outputs
+
+
+def colabfold_result(output_dir, name, binder_length=None, outputs=None):
+    """
+    Best ranked structure and scores of one ColabFold query.
+
+    Args:
+        output_dir (str): ColabFold output folder.
+        name (str): FASTA header of the query.
+        binder_length (int): Number of binder residues, the first chain. Default None, no interface scores.
+        outputs (dict): colabfold_outputs of the folder, to list it once for many queries. Default None.
+
+    Returns:
+        tuple: Path of the rank 1 structure and its scores (mean pLDDT, pTM and ipTM if present, with a
+            binder length also plddt_binder and pae_interaction), (None, None) if the query has no result.
+    """
+    if outputs is None:
+        outputs = colabfold_outputs(output_dir)
+    # ColabFold names the output files after the header with unsafe characters replaced
+    score_path, structure_path = outputs.get(safe_filename(name), (None, None))
+    if score_path is None or structure_path is None:
+        return None, None
+    with open(score_path, 'r') as file:
+        data = json.load(file)
+    plddt = data.get('plddt', [])
+    scores = {'plddt': _mean(plddt)}
+    for field in ('ptm', 'iptm'):
+        if field in data:
+            scores[field] = data[field]
+
+    # Same definitions as interface_metrics_batch in local/interface_metrics.py
+    pae = data.get('pae', data.get('predicted_aligned_error'))
+    L = binder_length
+    if L and len(plddt) > L:
+        scores['plddt_binder'] = _mean(plddt[:L])
+        if pae is not None and len(pae) == len(plddt):
+            binder_to_target = _mean([value for row in pae[:L] for value in row[L:]])
+            target_to_binder = _mean([value for row in pae[L:] for value in row[:L]])
+            scores['pae_interaction'] = (binder_to_target + target_to_binder) / 2
+    return structure_path, scores
+
+
+def register_colabfold_results(cache, fasta_file, output_dir, since=None, **metadata):
+    """
+    Store the results of every query of a folded FASTA file that has output files.
+
+    Args:
+        cache (FoldCache): Cache to add the results to.
+        fasta_file (str): Folded FASTA file, queries 'binder:target'.
+        output_dir (str): ColabFold output folder of the file.
+        since (float): Only structures written after this time (seconds since the epoch), e.g. to skip
+            the outputs of an earlier FASTA file with the same query names. Default None, all of them.
+        **metadata: Fields stored with every entry, e.g. target_name so create_dataset_mod.py finds the scores.
+
+    Returns:
+        int: Number of stored results.
+    """
+    n_stored = 0
+    outputs = colabfold_outputs(output_dir)
+    for name, sequence in read_fasta(fasta_file):
+        binder, target = split_complex(sequence)
+        structure_path, scores = colabfold_result(output_dir, name, binder_length=len(binder) if target else None,
+                                                  outputs=outputs)
+        if structure_path is not None and (since is None or os.path.getmtime(structure_path) >= since):
+            cache.put(binder, target, scores=scores, structure_path=os.path.abspath(structure_path), name=name, **metadata)
+            n_stored += 1
+    return n_stored
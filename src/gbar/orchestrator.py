@@ -0,0 +1,486 @@
+# Description: Runs the rounds of the optimisation loop as a graph of checkpointed stages
+# predict -> uncertainty selection -> FASTA batching -> ColabFold -> interface metrics -> create dataset,
+# finished stages are skipped on a rerun, so a job killed at its wall time resumes where it stopped
+
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Bump when the stage key or the manifest layout changes, every stage then runs again
+MANIFEST_VERSION = 1
+
+# Folders of the pipeline modules used by the stages of bo_round
+studentmachine_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'studentmachine')
+local_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'local')
+sys.path.extend([studentmachine_dir, local_dir])
+
+
+class Stage:
+    def __init__(self, name, action, inputs=(), outputs=(), params=None, after=()):
+        """
+        One step of a round.
+
+        Args:
+            name (str): Unique name of the stage, e.g. 'round_2/colabfold'.
+            action: A function called with **params, a command list run with subprocess, or a
+                Script to run with config overrides.
+            inputs (list): Files and folders the stage reads, their content decides if it runs again.
+            outputs (list): Files and folders the stage writes. Stages reading them run after it.
+            params (dict): Keyword arguments of a function action, part of the stage key.
+            after (list): Names of stages that have to finish first without sharing a file.
+        """
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.after = list(after)
+
+    def signature(self):
+        """What the stage runs, without its inputs."""
+        if callable(self.action) and not isinstance(self.action, Script):
+            action = f"{self.action.__module__}.{self.action.__qualname__}"
+        elif isinstance(self.action, Script):
+            action = {'script': os.path.abspath(self.action.path), 'overrides': self.action.overrides}
+        else:
+            action = list(self.action)
+        return {'action': action, 'params': self.params}
+
+    def run(self):
+        if isinstance(self.action, Script):
+            self.action.run()
+        elif callable(self.action):
+            self.action(**self.params)
+        else:
+            subprocess.run(list(self.action), check=True)
+
+
+class Script:
+    def __init__(self, path, overrides=None, cwd=None):
+        """
+        A pipeline script run in its own process, with some of its top-level settings replaced.
+
+        The scripts of this repository are configured by assignments at the top of the file, e.g.
+        dataset_path in predict.py. Assignments to the names in overrides are replaced by the
+        given values before the script runs, so the paths of a round are set without editing it.
+
+        Args:
+            path (str): Path to the Python script.
+            overrides (dict): Setting name to new value, values have to be JSON serialisable.
+            cwd (str): Working directory of the script. Default None, the current one.
+        """
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.cwd = cwd
+
+    def run(self):
+        if self.cwd is not None:
+            os.makedirs(self.cwd, exist_ok=True)
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        code = (f"import sys; sys.path.insert(0, {script_dir!r}); "
+                f"from orchestrator import exec_script; exec_script(sys.argv[1], sys.argv[2])")
+        subprocess.run([sys.executable, '-c', code, os.path.abspath(self.path), json.dumps(self.overrides)],
+                       cwd=self.cwd, check=True)
+
+
+def exec_script(path, overrides_json):
+    """Execute a script as __main__ with its top-level assignments replaced, see Script."""
+    overrides = json.loads(overrides_json)
+    with open(path, 'r') as file:
+        tree = ast.parse(file.read(), filename=path)
+    missing = set(overrides)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in overrides:
+            node.value = ast.parse(repr(overrides[node.targets[0].id]), mode='eval').body
+            missing.discard(node.targets[0].id)
+    if missing:
+        raise ValueError(f"{path} has no top-level setting {', '.join(sorted(missing))}")
+    ast.fix_missing_locations(tree)
+    # Run like 'python path', so the script finds the modules next to it
+    sys.path.insert(0, os.path.dirname(path))
+    sys.argv = [path]
+    exec(compile(tree, path, 'exec'), {'__name__': '__main__', '__file__': path})
+
+
+class Orchestrator:
+    def __init__(self, manifest_path='pipeline_manifest.json'):
+        """
+        Runs stages in dependency order and skips the ones that already ran on the same inputs.
+
+        Every finished stage is recorded in a JSON manifest with the SHA-256 of its key (what it
+        runs and the content of its inputs) and of its outputs. A stage is skipped when its key is
+        unchanged and its outputs are still on disk with the recorded content. The manifest is
+        written after every stage and replaced atomically, so a crash or a killed job only loses
+        the stage that was running. File hashes are reused while a file's modification time and
+        size are unchanged, large fold outputs are not read again on every run.
+
+        Args:
+            manifest_path (str): Path to the manifest file.
+        """
+        self.manifest_path = manifest_path
+        self.manifest = {'version': MANIFEST_VERSION, 'stages': {}, 'files': {}}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as file:
+                    manifest = json.load(file)
+                if manifest.get('version') == MANIFEST_VERSION:
+                    self.manifest = manifest
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.manifest_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.manifest, file, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_hash(self, path):
+        """SHA-256 of a file, cached in the manifest by modification time and size."""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        cached = self.manifest['files'].get(path)
+        if cached is not None and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+            return cached['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        self.manifest['files'][path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def content_hash(self, path):
+        """
+        SHA-256 of a file or of every file of a folder (names and contents), None if it does not exist.
+
+        Hidden files and folders are left out, they hold caches written by later stages (e.g. the
+        .pae_cache of interface_metrics.py in the ColabFold output folders).
+        """
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+            for file_name in sorted(name for name in files if not name.startswith('.')):
+                file_path = os.path.join(root, file_name)
+                digest.update(os.path.relpath(file_path, path).encode() + b'\0')
+                digest.update(self.file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        """Hash of what a stage runs and the content of its inputs."""
+        content = json.dumps({'signature': stage.signature(),
+                              'inputs': {path: self.content_hash(path) for path in stage.inputs}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def is_done(self, stage, key):
+        """True if the stage finished before with the same key and its outputs are unchanged."""
+        entry = self.manifest['stages'].get(stage.name)
+        if entry is None or entry.get('status') != 'done' or entry.get('key') != key:
+            return False
+        return all(self.content_hash(path) == entry['outputs'].get(path) for path in stage.outputs)
+
+    def order(self, stages):
+        """Stages sorted so that every stage runs after the stages writing its inputs and those in after."""
+        by_name = {stage.name: stage for stage in stages}
+        if len(by_name) != len(stages):
+            raise ValueError("Stage names have to be unique")
+        writers = {}
+        for stage in stages:
+            for path in stage.outputs:
+                writers[os.path.abspath(path)] = stage.name
+        depends = {stage.name: {writers[os.path.abspath(path)] for path in stage.inputs
+                                if os.path.abspath(path) in writers} | set(stage.after) for stage in stages}
+        for name, names in depends.items():
+            names.discard(name)
+            unknown = names - set(by_name)
+            if unknown:
+                raise ValueError(f"Stage {name} runs after unknown stages {', '.join(sorted(unknown))}")
+
+        ordered = []
+        visiting = set()
+        done = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            # Dependencies first, ties keep the order the stages were given in
+            for dependency in sorted(depends[name], key=list(by_name).index):
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(by_name[name])
+
+        for stage in stages:
+            visit(stage.name)
+        return ordered
+
+    def run(self, stages, force=()):
+        """
+        Run the stages that are not up to date.
+
+        Args:
+            stages (list): Stages of one or more rounds.
+            force (list): Names of stages to run even if they are up to date.
+
+        Returns:
+            list: One dict per stage with name, status ('skipped' or 'done') and seconds.
+        """
+        summary = []
+        for stage in self.order(stages):
+            key = self.stage_key(stage)
+            if stage.name not in force and self.is_done(stage, key):
+                print(f"Skipping {stage.name}, inputs and outputs are unchanged")
+                summary.append({'name': stage.name, 'status': 'skipped', 'seconds': 0.0})
+                continue
+
+            print(f"Running {stage.name}")
+            self.manifest['stages'][stage.name] = {'status': 'running', 'key': key, 'started': time.time()}
+            self.save()
+            start_time = time.time()
+            try:
+                stage.run()
+            except BaseException:
+                # Keyboard interrupts and wall time signals leave the stage to run again on resume
+                self.manifest['stages'][stage.name]['status'] = 'failed'
+                self.save()
+                raise
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            if missing:
+                self.manifest['stages'][stage.name]['status'] = 'failed'
+                self.save()
+                raise RuntimeError(f"Stage {stage.name} did not write {', '.join(missing)}")
+
+            elapsed = time.time() - start_time
+            self.manifest['stages'][stage.name] = {
+                'status': 'done', 'key': key, 'seconds': round(elapsed, 3), 'finished': time.time(),
+                'outputs': {path: self.content_hash(path) for path in stage.outputs}
+            }
+            self.save()
+            print(f"Finished {stage.name} in {elapsed:.2f} seconds")
+            summary.append({'name': stage.name, 'status': 'done', 'seconds': round(elapsed, 3)})
+
+        n_done = sum(item['status'] == 'done' for item in summary)
+        print(f"Ran {n_done} stages, skipped {len(summary) - n_done} up to date.")
+        return summary
+
+
+def bo_round(k, targets, root='runs', x_type='esm2', model_type='ridge', acq_fn='ucb', n_slots=1):
+    """
+    Stages of round k of the optimisation loop, reading the master dataset of round k - 1.
+
+    Paths follow <root>/round_<k>/..., round 0 is the initial master dataset at
+    <root>/round_0/master_dataset.csv. predict.py runs in the round folder with its dataset and
+    output paths replaced (see Script), the embedding cache in <root>/data/embedding_cache is
+    shared by all rounds. The selected binders are folded against every target and the interface metrics of
+    the folds are added to the master dataset. ColabFold folds the complexes directly, so no
+    alignment of binder-only designs is needed.
+
+    Args:
+        k (int): Round number, starting at 1.
+        targets (dict): Target name (as in the master dataset columns) to target sequence, chains joined with ':'.
+        root (str): Folder of all rounds.
+        x_type (str): Representation used by predict.py.
+        model_type (str): Surrogate model used by predict.py.
+        acq_fn (str): Acquisition function used by predict.py.
+        n_slots (int): Number of ColabFold jobs running at the same time.
+
+    Returns:
+        list: Stages of the round.
+    """
+    root = os.path.abspath(root)
+    round_dir = os.path.join(root, f'round_{k}')
+    previous = os.path.join(root, f'round_{k - 1}', 'master_dataset.csv')
+    run_name = f'{x_type}_{model_type}_{acq_fn}'
+    output_dir = os.path.join(round_dir, 'bo_results', run_name)
+    predictions = os.path.join(output_dir, f'proteus_{run_name}_25_1.csv')
+    selected = os.path.join(output_dir, 'highest_uncertainty', f'proteus_sigma_100_{run_name}_25_1.csv')
+    master = os.path.join(round_dir, 'master_dataset.csv')
+
+    # predict.py also picks the highest uncertainty binders with UncertaintyAnalyzer
+    stages = [Stage(f'round_{k}/predict',
+                    Script(os.path.join(studentmachine_dir, 'predict.py'), cwd=round_dir,
+                           overrides={'dataset_path': previous, 'x_type': x_type, 'model_type': model_type,
+                                      'acq_fn': acq_fn, 'output_dir': output_dir + os.sep,
+                                      'embedding_cache_dir': os.path.join(root, 'data', 'embedding_cache')}),
+                    inputs=[previous], outputs=[predictions, selected])]
+    metrics_files = []
+    for target_name, target_sequence in targets.items():
+        shards = os.path.join(round_dir, 'shards', target_name)
+        fold_dir = os.path.join(round_dir, 'fold', target_name)
+        metrics = os.path.join(round_dir, 'metrics', f'{target_name}.csv')
+        metrics_files.append(metrics)
+        stages += [
+            Stage(f'round_{k}/batch/{target_name}', batch_shards, inputs=[selected], outputs=[shards],
+                  params={'candidate_file': selected, 'output_dir': shards, 'folded_file': previous,
+                          'target_sequence': target_sequence}),
+            Stage(f'round_{k}/colabfold/{target_name}', fold_shards, inputs=[shards], outputs=[fold_dir],
+                  params={'input_fasta_dir': shards, 'output_base_dir': fold_dir, 'n_slots': n_slots,
+                          'fold_cache_dir': os.path.join(root, 'data', 'fold_cache')}),
+            Stage(f'round_{k}/metrics/{target_name}', collect_metrics, inputs=[fold_dir], outputs=[metrics],
+                  params={'fold_dir': fold_dir, 'target_name': target_name, 'output_csv': metrics}),
+        ]
+    stages.append(Stage(f'round_{k}/create_dataset', merge_master_dataset, inputs=[previous] + metrics_files,
+                        outputs=[master], params={'previous_csv': previous, 'metrics_csvs': metrics_files,
+                                                  'output_csv': master}))
+    return stages
+
+
+def batch_shards(candidate_file, output_dir, folded_file, target_sequence):
+    """FASTA shards of the selected binders that were not folded before, see fasta_batching.batch_candidates."""
+    from fasta_batching import batch_candidates
+    os.makedirs(output_dir, exist_ok=True)
+    batch_candidates([candidate_file], output_dir, folded_files=[folded_file], target_sequence=target_sequence)
+
+
+def fold_shards(input_fasta_dir, output_base_dir, n_slots, fold_cache_dir=None):
+    """
+    Fold every shard, see colabfold.process_fastas.
+
+    Folds are added to the fold cache as their jobs finish, so a rerun after an interruption or a
+    failed job only folds the missing queries. Raises if a job still failed after its retries,
+    so the stage is not marked done with part of the binders missing.
+    """
+    from colabfold import colabfold_command, process_fastas
+    from fold_cache import FoldCache
+    os.makedirs(output_base_dir, exist_ok=True)
+    cache = None
+    if fold_cache_dir is not None:
+        # Results of other ColabFold options are not reused
+        cache = FoldCache(fold_cache_dir, settings={'command': colabfold_command})
+    summary = process_fastas(input_fasta_dir, output_base_dir, n_slots=n_slots, cache=cache) or []
+    failed = [job['name'] for job in summary if job['status'] == 'failed']
+    if failed:
+        raise RuntimeError(f"ColabFold failed for {len(failed)} of {len(summary)} shards: {', '.join(failed)}")
+
+
+def collect_metrics(fold_dir, target_name, output_csv):
+    """Interface metrics of every ColabFold output folder of a target in one CSV file."""
+    import pandas as pd
+    from interface_metrics import colabfold_metrics
+    frames = [colabfold_metrics(os.path.join(fold_dir, name), target_name) for name in sorted(os.listdir(fold_dir))
+              if os.path.isdir(os.path.join(fold_dir, name))]
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    metrics = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['binder_name', 'binder_seq'])
+    metrics.to_csv(output_csv, index=False)
+
+
+def merge_master_dataset(previous_csv, metrics_csvs, output_csv):
+    """
+    Master dataset of the last round with the newly folded binders added.
+
+    Only the columns of the last master dataset are kept, binders folded again get the new scores.
+    Without metrics files the last master dataset is copied unchanged.
+    """
+    if not metrics_csvs:
+        shutil.copyfile(previous_csv, output_csv)
+        print(f"No new binders, copied the master dataset {previous_csv} to {output_csv}")
+        return
+
+    import pandas as pd
+    master = pd.read_csv(previous_csv)
+    name_column = 'name' if 'name' in master.columns else 'binder_name'
+    new = None
+    for metrics_csv in metrics_csvs:
+        metrics = pd.read_csv(metrics_csv).rename(columns={'binder_name': name_column})
+        new = metrics if new is None else new.merge(metrics, on=[name_column, 'binder_seq'], how='outer')
+    new = new.reindex(columns=master.columns)
+    master = pd.concat([new, master], ignore_index=True).drop_duplicates(subset='binder_seq')
+    master.to_csv(output_csv, index=False)
+    print(f"Added {len(new)} binders, {len(master)} in the master dataset {output_csv}")
+
+
+def async_bo(proposer, targets, y_cols, output_dir, n_slots=1, batch_size=4, max_evaluations=100, **kwargs):
+    """
+    Asynchronous rounds: every free folding slot gets a new batch of candidates straight away.
+
+    Instead of waiting for all folds of a round before predicting again, each finished ColabFold
+    job is scored, its results go into the proposer (see async_proposer.AsyncProposer) and the
+    freed slot is refilled with candidates proposed around the still pending ones. Every batch
+    is folded against all targets in one job.
+
+    Args:
+        proposer (AsyncProposer): Proposer trained on the master dataset.
+        targets (dict): Target name to target sequence, chains joined with ':'.
+        y_cols (list): Objective columns of the proposer, in the master dataset format, e.g.
+            'pae_interaction_HLA_B_0801_NLFRRVWEL'.
+        output_dir (str): Folder of the batches, the fold results are appended to observations.csv in it.
+        n_slots (int): Number of ColabFold jobs running at the same time.
+        batch_size (int): Number of candidates folded per job.
+        max_evaluations (int): Number of candidates proposed in total.
+        **kwargs: Passed on to colabfold.run_jobs, e.g. devices or command.
+
+    Returns:
+        pd.DataFrame: The fold results in the master dataset format.
+    """
+    import pandas as pd
+    from colabfold import run_jobs
+    from interface_metrics import complex_metrics, find_colabfold_results, to_master_format
+
+    os.makedirs(output_dir, exist_ok=True)
+    observations_csv = os.path.join(output_dir, 'observations.csv')
+    target_names = list(targets)
+    state = {'n_proposed': 0, 'n_jobs': 0}
+    observations = []
+
+    def next_job():
+        n = min(batch_size, max_evaluations - state['n_proposed'])
+        batch = proposer.propose(n) if n > 0 else None
+        if batch is None or len(batch) == 0:
+            return None
+        state['n_proposed'] += len(batch)
+        name = f"batch_{state['n_jobs']:04d}"
+        state['n_jobs'] += 1
+        job_dir = os.path.join(output_dir, name)
+        os.makedirs(job_dir, exist_ok=True)
+        input_fasta = os.path.join(job_dir, f'{name}.fasta')
+        # Short query names, ColabFold uses them in its file names
+        with open(input_fasta, 'w') as file:
+            for i, sequence in enumerate(batch['sequence']):
+                for t, target_name in enumerate(target_names):
+                    file.write(f">c{i}_t{t}\n{sequence}:{targets[target_name]}\n")
+        return {'name': name, 'input_fasta': input_fasta, 'output_dir': job_dir, 'candidates': batch}
+
+    def on_finish(job):
+        batch = job['candidates']
+        if job['status'] != 'done':
+            proposer.discard(batch['name'])
+            return
+        metrics = complex_metrics(find_colabfold_results(job['output_dir']))
+        result = pd.DataFrame({'binder_name': batch['name'], 'binder_seq': batch['sequence']})
+        for t, target_name in enumerate(target_names):
+            rows = metrics[metrics['name'].str.endswith(f'_t{t}')]
+            rows = rows.assign(name=rows['name'].str.split('_').str[0].str[1:].astype(int))
+            master = to_master_format(rows, target_name).drop(columns='binder_seq')
+            result = result.join(master.set_index('binder_name'))
+        result = result.reindex(columns=['binder_name', 'binder_seq'] + y_cols)
+        result.to_csv(observations_csv, mode='a', header=not os.path.exists(observations_csv), index=False)
+        observations.append(result)
+        proposer.observe(result['binder_name'], result['binder_seq'], result[y_cols].to_numpy())
+        print(f"Observed {len(result)} candidates of {job['name']}, {len(proposer.pending)} pending")
+
+    run_jobs([], n_slots=n_slots, next_job=next_job, on_finish=on_finish,
+             summary_path=os.path.join(output_dir, 'colabfold_summary.csv'), **kwargs)
+    return pd.concat(observations, ignore_index=True) if observations else pd.DataFrame(columns=['binder_name', 'binder_seq'] + y_cols)
+
+
+# Example usage
+if __name__ == "__main__":
+    # Three rounds from runs/round_0/master_dataset.csv, submit the same command again after a wall time kill
+    targets = {'HLA_B_0801_NLFRRVWEL': 'path/to/target/sequence'}
+    orchestrator = Orchestrator('runs/pipeline_manifest.json')
+    for k in range(1, 4):
+        orchestrator.run(bo_round(k, targets, n_slots=4))
@@ -0,0 +1,186 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from structure_io import is_up_to_date
+
+# Largest number of shared inputs prepared in every worker before the first pair, the size of the
+# load_prepared cache in superpose.py
+preload_limit = 128
+
+
+def pymol_binder_complex(binder_path, complex_path, output_path):
+    """
+    PyMOL version of superpose.assemble_binder_complex, put a folded binder in place of chain A of a complex.
+
+    Returns:
+        float: RMSD reported by cmd.align.
+    """
+    from pymol import cmd
+    combined_name = os.path.splitext(os.path.basename(output_path))[0]
+
+    # Reinitialize PyMOL session to clear old data
+    cmd.reinitialize()
+
+    # Load both structures
+    cmd.load(binder_path, "structure2")
+    cmd.load(complex_path, "structure1")
+
+    # Remove water molecules and ligands from both structures
+    cmd.remove("resn HOH")
+    cmd.remove("hetatm")
+
+    # Calculate offset for continuous residue numbering from the last residue of chain A in structure 1
+    last_resi_structure1 = cmd.get_model("structure1 and chain A").atom[-1].resi
+    offset = int(last_resi_structure1) + 1
+
+    # Alter chain ID of all residues in structure 2 to 'A' and renumber structure 1
+    cmd.alter("structure2", "chain='A'")
+    cmd.sort()
+    cmd.alter("structure1", f'resi=str(int(resi)+{offset}-1)')
+    cmd.sort()
+
+    # Align and replace chain A
+    rmsd = cmd.align("structure2", "structure1 and chain A")[0]
+    cmd.remove("structure1 and chain A")
+    cmd.sort()
+
+    cmd.create(combined_name, "structure1 or structure2")
+    cmd.save(output_path, combined_name)
+    return rmsd
+
+
+def pymol_target_complex(complex_path, target_path, output_path):
+    """
+    PyMOL version of superpose.assemble_target_complex, put a new target in place of chain B of a complex.
+
+    Returns:
+        float: RMSD reported by cmd.align.
+    """
+    from pymol import cmd
+    combined_name = os.path.splitext(os.path.basename(output_path))[0]
+
+    # Reinitialize PyMOL session
+    cmd.reinitialize()
+
+    # Load structures
+    cmd.load(complex_path, "structure1")
+    cmd.load(target_path, "structure2")
+
+    # Remove unwanted molecules
+    cmd.remove("resn HOH")
+    cmd.remove("hetatm")
+
+    # Get last residue number from structure1
+    atoms = cmd.get_model("structure1 and chain A").atom
+    if not atoms:
+        raise ValueError(f"No atoms found in chain A of {complex_path}.")
+    offset = int(atoms[-1].resi) + 1
+
+    # Adjust chain ID and residue numbering for structure2
+    cmd.alter("structure2", "chain='B'")
+    cmd.alter("structure2", f"resi=str(int(resi)+{offset}-1)")
+    cmd.sort()
+
+    # Align and replace chain B
+    rmsd = cmd.align("structure2", "structure1 and chain B")[0]
+    cmd.remove("structure1 and chain B")
+    cmd.sort()
+
+    cmd.create(combined_name, "structure1 or structure2")
+    cmd.save(output_path, combined_name)
+    return rmsd
+
+
+def get_aligner(mode, engine):
+    """
+    Function aligning one pair, called as aligner(first_path, second_path, output_path).
+
+    Args:
+        mode (str): 'binder' puts a folded binder into an initial complex (first path is the binder),
+            'target' puts a new target into a binder complex (first path is the complex).
+        engine (str): 'numpy' or 'pymol'.
+    """
+    if engine == 'pymol':
+        return {'binder': pymol_binder_complex, 'target': pymol_target_complex}[mode]
+    from superpose import assemble_binder_complex, assemble_target_complex
+    return {'binder': assemble_binder_complex, 'target': assemble_target_complex}[mode]
+
+
+def _preload(paths):
+    # Pool initializer, prepares the inputs shared by many pairs once per worker before the first task
+    from superpose import load_prepared
+    for path in paths:
+        try:
+            load_prepared(path)
+        except Exception:
+            # The pairs of this input fail again in _align_pair and are reported in the summary
+            pass
+
+
+def _align_pair(task):
+    # Runs in a worker process, each worker loads its own engine (and PyMOL instance)
+    mode, engine, first_path, second_path, output_path = task
+    start_time = time.time()
+    try:
+        rmsd = get_aligner(mode, engine)(first_path, second_path, output_path)
+        status, error = 'done', ''
+    except Exception as e:
+        rmsd, status, error = None, 'failed', f"{type(e).__name__}: {e}"
+    return {'first': first_path, 'second': second_path, 'output': output_path, 'status': status,
+            'rmsd': rmsd, 'error': error, 'Worker': os.getpid(), 'Time (seconds)': time.time() - start_time}
+
+
+def run_alignments(pairs, mode, engine='numpy', n_workers=None, overwrite=False, summary_path=None):
+    """
+    Align all pairs in a process pool and report every pair in a summary table.
+
+    Pairs whose output is newer than both inputs are skipped unless overwrite is set. The
+    remaining pairs are sorted by their second path (the shared complex or target) and split into
+    chunks across the workers, so a chunk mostly works on one shared input. With the numpy engine
+    every worker prepares the shared inputs once when it starts.
+
+    Args:
+        pairs (list): (first_path, second_path, output_path) tuples, see get_aligner for the order.
+        mode (str): 'binder' or 'target'.
+        engine (str): 'numpy' or 'pymol'.
+        n_workers (int): Number of worker processes. Default None, one per CPU.
+        overwrite (bool): Align pairs with an up to date output again.
+        summary_path (str): CSV file the summary is saved to. Default None.
+
+    Returns:
+        pd.DataFrame: One row per pair with status ('done', 'skipped' or 'failed'), RMSD, error and time.
+    """
+    start_time = time.time()
+    rows = []
+    tasks = []
+    for first_path, second_path, output_path in pairs:
+        if not overwrite and is_up_to_date(output_path, [first_path, second_path]):
+            rows.append({'first': first_path, 'second': second_path, 'output': output_path, 'status': 'skipped'})
+        else:
+            tasks.append((mode, engine, first_path, second_path, output_path))
+
+    if tasks:
+        # Pairs sharing an input follow each other, so they end up in the same chunks
+        tasks.sort(key=lambda task: task[3])
+        shared_paths = list(dict.fromkeys(task[3] for task in tasks))
+        initializer, initargs = None, ()
+        if engine == 'numpy' and len(shared_paths) <= preload_limit:
+            initializer, initargs = _preload, (shared_paths,)
+
+        n_workers = min(n_workers or os.cpu_count() or 1, len(tasks))
+        # A few chunks per worker balances the load without one inter-process call per pair
+        chunksize = max(1, len(tasks) // (n_workers * 4))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=initializer, initargs=initargs) as executor:
+            rows.extend(executor.map(_align_pair, tasks, chunksize=chunksize))
+
+    summary = pd.DataFrame(rows, columns=['first', 'second', 'output', 'status', 'rmsd', 'error', 'Worker', 'Time (seconds)'])
+    counts = summary['status'].value_counts()
+    print(f"Aligned {counts.get('done', 0)} pairs, skipped {counts.get('skipped', 0)} up to date, "
+          f"{counts.get('failed', 0)} failed in {time.time() - start_time:.2f} seconds.")
+    for _, row in summary[summary['status'] == 'failed'].iterrows():
+        print(f"Failed: {row['first']} + {row['second']}: {row['error']}")
+
+    if summary_path is not None:
+        summary.to_csv(summary_path, index=False)
+    return summary
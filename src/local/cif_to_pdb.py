@@ -1,6 +1,103 @@
+import gzip
 import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import biotite.structure.io.pdbx as pdbx
 import biotite.structure.io.pdb as pdb
+from structure_io import Structure, is_up_to_date, parse_cif_atoms
+
+# Input files the converter picks up, gzipped or not
+cif_suffixes = ('.cif', '.cif.gz', '.bcif', '.bcif.gz')
+
+
+def strip_cif_suffix(file_name):
+    """File name without its (gzipped) mmCIF or BinaryCIF extension."""
+    for suffix in sorted(cif_suffixes, key=len, reverse=True):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def is_binary_cif(path):
+    """True for BinaryCIF files (.bcif or .bcif.gz)."""
+    return path.endswith(('.bcif', '.bcif.gz'))
+
+
+def read_cif(input_cif, model=None):
+    """
+    Read a structure from an mmCIF or BinaryCIF file, optionally gzipped.
+
+    Args:
+        input_cif (str): Path to a .cif, .cif.gz, .bcif or .bcif.gz file.
+        model (int): Model to read. Default None, all models as an AtomArrayStack.
+
+    Returns:
+        AtomArray or AtomArrayStack: Structure with B-factors.
+    """
+    binary = is_binary_cif(input_cif)
+    opener = gzip.open if input_cif.endswith('.gz') else open
+    with opener(input_cif, 'rb' if binary else 'rt') as handle:
+        if binary:
+            cif_file = pdbx.BinaryCIFFile.read(handle)
+        else:
+            # CIFFile replaced PDBxFile in newer biotite releases
+            cif_reader = getattr(pdbx, 'CIFFile', None) or pdbx.PDBxFile
+            cif_file = cif_reader.read(handle)
+    return pdbx.get_structure(cif_file, model=model, extra_fields=['b_factor'])
+
+
+def atom_array_to_structure(atoms):
+    """Convert a biotite AtomArray to a structure_io.Structure."""
+    return Structure(
+        hetero=np.asarray(atoms.hetero, dtype=bool),
+        atom_name=np.asarray(atoms.atom_name, dtype=str),
+        resn=np.asarray(atoms.res_name, dtype=str),
+        chain=np.asarray(atoms.chain_id, dtype=str),
+        resi=np.asarray(atoms.res_id, dtype=int),
+        icode=np.asarray(atoms.ins_code, dtype=str),
+        xyz=np.asarray(atoms.coord, dtype=np.float32),
+        b_factor=np.asarray(atoms.b_factor, dtype=np.float32),
+        element=np.asarray(atoms.element, dtype=str)
+    )
+
+
+def convert_structure(input_cif, output_path):
+    """
+    Convert one mmCIF/BinaryCIF file to a PDB file, or to the compact .npz array format of
+    structure_io if output_path ends with '.npz'.
+
+    Args:
+        input_cif (str): Path to the input file.
+        output_path (str): Path to save the output file.
+    """
+    # Written to a temporary file first, a killed job must not leave a truncated file that is newer
+    # than its input and would be skipped as up to date on the next run
+    tmp_path = output_path + f'.{os.getpid()}.tmp' + os.path.splitext(output_path)[1]
+    if output_path.endswith('.npz'):
+        if not is_binary_cif(input_cif):
+            # Text mmCIF goes straight through the fixed-width parser, no AtomArray needed
+            structure = parse_cif_atoms(input_cif)
+        else:
+            structure = atom_array_to_structure(read_cif(input_cif, model=1))
+        structure.save_npz(tmp_path)
+    else:
+        structure = read_cif(input_cif)
+        # Save the structure as a PDB file
+        pdb_file = pdb.PDBFile()
+        pdb_file.set_structure(structure)
+        pdb_file.write(tmp_path)
+    os.replace(tmp_path, output_path)
+
+
+def _convert(task):
+    # Runs in a worker process, failures are reported instead of stopping the batch
+    input_cif, output_path = task
+    try:
+        convert_structure(input_cif, output_path)
+        return input_cif, output_path, ''
+    except Exception as e:
+        return input_cif, output_path, f"{type(e).__name__}: {e}"
+
 
 class CifToPdb:
     def __init__(self, input_folder, output_folder):
@@ -23,35 +120,58 @@ class CifToPdb:
         Convert a CIF file to a PDB file.
 
         Args:
-            input_cif (str): Path to the input CIF file.
-            output_pdb (str): Path to save the output PDB file.
+            input_cif (str): Path to the input CIF file (.cif, .bcif, optionally gzipped).
+            output_pdb (str): Path to save the output PDB file, or .npz file for the array format.
         """
-        if input_cif.endswith(".cif"):
-            cif_file = pdbx.PDBxFile.read(input_cif)
-            structure = pdbx.get_structure(cif_file)
-            
-            # Save the structure as a PDB file
-            pdb_file = pdb.PDBFile()
-            pdb_file.set_structure(structure)
-            pdb_file.write(output_pdb)
+        if input_cif.endswith(cif_suffixes):
+            convert_structure(input_cif, output_pdb)
             print(f"Converted {input_cif} to {output_pdb}")
         else:
             print(f"Skipped {input_cif} - does not match '.cif' pattern.")
 
-    def convert_all_cifs(self):
+    def convert_all_cifs(self, n_workers=None, overwrite=False, output_format='pdb'):
         """
-        Convert all CIF files ending with '.cif' in the input folder
+        Convert all CIF files in the input folder (.cif, .bcif, optionally gzipped)
         to PDB files, saving them in the output folder.
+
+        Files whose output is newer than the input are skipped unless overwrite is set,
+        the remaining files are converted in a process pool.
+
+        Args:
+            n_workers (int): Number of worker processes. Default None, one per CPU.
+            overwrite (bool): Convert files with an up to date output again.
+            output_format (str): 'pdb' for text PDB files or 'npz' for the compact array format
+                read by structure_io.read_structure.
+
+        Returns:
+            list: (input, output, error) of every failed conversion.
         """
+        tasks = []
+        n_skipped = 0
         # Iterate over files in the input folder
         for file_name in os.listdir(self.input_folder):
-            if file_name.endswith(".cif"):
+            if file_name.endswith(cif_suffixes):
                 input_cif = os.path.join(self.input_folder, file_name)
-                output_pdb = os.path.join(self.output_folder, file_name.replace(".cif", ".pdb"))
-                self.cif_to_pdb(input_cif, output_pdb)
+                output_path = os.path.join(self.output_folder, f"{strip_cif_suffix(file_name)}.{output_format}")
+                if not overwrite and is_up_to_date(output_path, [input_cif]):
+                    n_skipped += 1
+                else:
+                    tasks.append((input_cif, output_path))
+
+        failed = []
+        if tasks:
+            n_workers = min(n_workers or os.cpu_count() or 1, len(tasks))
+            chunksize = max(1, len(tasks) // (n_workers * 4))
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                for input_cif, output_path, error in executor.map(_convert, tasks, chunksize=chunksize):
+                    if error:
+                        failed.append((input_cif, output_path, error))
+                        print(f"Failed to convert {input_cif}: {error}")
+
+        print(f"Converted {len(tasks) - len(failed)} files, skipped {n_skipped} up to date, {len(failed)} failed.")
+        return failed
 
 # Usage Example:
 # if __name__ == "__main__":
-#     converter = CifToPdbConverter(input_folder="data/NLFR_target", output_folder="data/NLFR_target/pdb")
-#     converter.convert_all_superimposed_cifs()
-
+#     converter = CifToPdb(input_folder="data/NLFR_target", output_folder="data/NLFR_target/pdb")
+#     converter.convert_all_cifs(n_workers=8, output_format='pdb')
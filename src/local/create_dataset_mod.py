@@ -1,128 +1,182 @@
-import pandas as pd
-import os
-
-# Dictionary to map three-letter amino acid codes to one-letter codes
-aa_dict = {
-    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C',
-    'GLU': 'E', 'GLN': 'Q', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I',
-    'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P',
-    'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
-    'SEC': 'U'  # Selenocysteine, sometimes present in proteins
-}
-
-# Directory paths for the csv and pdb files
-csv_dir = 'results/af_init_results/25_samples/esm2_rf_ucb/pareto_1'
-pdb_dir = 'results/fold/25_sample/esm2_rf_ucb/pareto_1/HLA_B_0801_NLFRRVWEL'
-
-# Target order for consistent column ordering
-target_order = ['HLA_B_0801_NLFRRVWEL','HLA_B_0801_NLSRRVWEL','HLA_A_2402_NYFRRVWEF','HLA_A_0201_NLFRRVWEV', 'HLA_B_0801' ]
-
-# A function to parse chain A sequence from a PDB file
-def parse_pdb(pdb_file):
-    chain_A_seq = []
-    try:
-        with open(pdb_file, 'r') as file:
-            for line in file:
-                if line.startswith("ATOM") or line.startswith("HETATM"):
-                    elements = line.split()
-                    if elements[4] == 'A':
-                        three_letter_residue = elements[3]
-                        residue_number = elements[5]
-                        if three_letter_residue in aa_dict:
-                            one_letter_aa = aa_dict[three_letter_residue]
-                            if residue_number not in [res_num for res_num, _ in chain_A_seq]:
-                                chain_A_seq.append((residue_number, one_letter_aa))
-    except Exception as e:
-        print(f"Error reading PDB file {pdb_file}: {e}")
-    return ''.join(aa[1] for aa in chain_A_seq)
-
-# Function to process all files and build the master dataset
-def build_master_dataset(csv_dir, pdb_dir):
-    master_data = []
-
-    for csv_file in os.listdir(csv_dir):
-        if csv_file.endswith('.csv'):
-            # Determine target name based on target order
-            target_name = "HLA_B_0801_NLFRRVWEL"  # Default
-            for target in target_order:
-                if target in csv_file:
-                    target_name = '_'.join(csv_file.split('_')[6:])
-                    target_name = target_name.split('.')[0]
-                    print(target_name)
-                    break
-
-
-            # Read the CSV file
-            csv_data = pd.read_csv(os.path.join(csv_dir, csv_file))
-            
-            for _, row in csv_data.iterrows():
-                description = row['description']
-                    # Construct combined name based on binder mutations
-                parts = description.split('_')
-                if "HLA" in parts:  # Ensure we don't go past the `unrelaxed` keyword
-                    hla_index = parts.index("HLA")
-                    if hla_index == 3:  # Single mutation case
-                        binder_name = "_".join(parts[:3])
-                    elif hla_index == 4:  # Double mutation case
-                        binder_name = "_".join(parts[:4])
-                    elif hla_index == 5:  # Triple mutation case
-                        binder_name = "_".join(parts[:5])
-                    else:
-                        raise ValueError("Unexpected filename format for mutations.")
-                else:
-                    raise ValueError("Filename does not contain 'HLA' as expected.")
-
-                pae_interaction = row['pae_interaction']
-                plddt_binder = row['plddt_binder']
-
-                # Set up PDB file name with default `pdb_name`
-                #pdb_name = '_'.join(description.split('_')[:3])
-                #print(pdb_name)
-                pdb_file = f"{binder_name}_HLA_B_0801_NLFRRVWEL.pdb"
-                pdb_path = os.path.join(pdb_dir, pdb_file)
-                #print(pdb_path)
-
-                if os.path.exists(pdb_path):
-                    chain_A_seq = parse_pdb(pdb_path)
-                    existing_entry = next((entry for entry in master_data if entry['binder_seq'] == chain_A_seq), None)
-
-                    if existing_entry:
-                        existing_entry[f'pae_interaction_{target_name}'] = pae_interaction
-                        existing_entry[f'plddt_binder_{target_name}'] = plddt_binder
-                    else:
-                        master_data.append({
-                            'binder_name': binder_name,
-                            'binder_seq': chain_A_seq,
-                            f'pae_interaction_{target_name}': pae_interaction,
-                            f'plddt_binder_{target_name}': plddt_binder
-                        })
-                else:
-                    print(f"PDB file not found: {pdb_path}")
-
-    # Convert the master data to a DataFrame
-    master_df = pd.DataFrame(master_data)
-    print(master_df.head())
-
-    # Sort the DataFrame by the PAE interaction score for HLA_B_0801_NLFRRVWEL in ascending order
-    master_df = master_df.sort_values(by='pae_interaction_HLA_B_0801_NLFRRVWEL', ascending=True)
-
-    # Generate the column order dynamically from target_order
-    base_columns = ['binder_name', 'binder_seq']
-    target_columns = []
-    for target in target_order:
-        target_columns.append(f'pae_interaction_{target}')
-        target_columns.append(f'plddt_binder_{target}')
-    
-    # Combine base and target-specific columns to create the desired order
-    desired_order = base_columns + target_columns
-
-    # Reorder the columns in master_df to match `desired_order`
-    master_df = master_df.reindex(columns=desired_order)
-
-    return master_df
-
-# Build and save the master dataset
-master_dataset = build_master_dataset(csv_dir, pdb_dir)
-output_csv_path = 'data/NLFR_moo/25_samples/esm2_rf_ucb/pareto_1/proteus_25_esm2_rf_ucb_pareto_1.csv'
-master_dataset.to_csv(output_csv_path, index=False)
-print(f"Master dataset saved to {output_csv_path}")
+import pandas as pd
+import os
+import sys
+from functools import lru_cache
+from structure_io import read_structure
+from silent_io import SilentFile
+
+# Fold cache shared with the folding scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gbar'))
+from fold_cache import FoldCache
+
+# Dataset store shared with predict.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'studentmachine'))
+from dataset_store import DatasetStore
+
+# Directory paths for the csv and pdb files
+csv_dir = 'results/af_init_results/25_samples/esm2_rf_ucb/pareto_1'
+pdb_dir = 'results/fold/25_sample/esm2_rf_ucb/pareto_1/HLA_B_0801_NLFRRVWEL'
+
+# Parquet score dataset written by sc_to_csv.convert_directory_sc_to_dataset, used instead of the csv files if set
+score_dataset_dir = None
+round_name = 'pareto_1'
+
+# Folder with the .silent files of the folded designs, binder sequences are read from them instead of extracted PDB files if set
+silent_dir = None
+
+# Fold cache (src/gbar/fold_cache.py), its scores fill in sequences and targets missing from the score files if set
+fold_cache_dir = None
+
+# Dataset store (src/studentmachine/dataset_store.py), the master dataset is also written to its 'binders' table
+# as this iteration if set, predict.py reads it from there
+store_dir = None
+iteration = 1
+
+# Target order for consistent column ordering
+target_order = ['HLA_B_0801_NLFRRVWEL','HLA_B_0801_NLSRRVWEL','HLA_A_2402_NYFRRVWEF','HLA_A_0201_NLFRRVWEV', 'HLA_B_0801' ]
+
+# A function to parse chain A sequence from a PDB file, the parsed arrays are cached next to the file
+@lru_cache(maxsize=None)
+def parse_pdb(pdb_file):
+    try:
+        return read_structure(pdb_file).sequence('A')
+    except Exception as e:
+        print(f"Error reading PDB file {pdb_file}: {e}")
+        return ''
+
+# Function to get the binder name (parent plus mutations) from a description
+def binder_name_from_description(description):
+    parts = description.split('_')
+    if "HLA" not in parts:
+        raise ValueError("Filename does not contain 'HLA' as expected.")
+    # Single, double or triple mutation case
+    hla_index = parts.index("HLA")
+    if hla_index not in (3, 4, 5):
+        raise ValueError("Unexpected filename format for mutations.")
+    return "_".join(parts[:hla_index])
+
+# Chain A sequence of every design in the silent files, keyed by binder name, the first design of a binder wins
+@lru_cache(maxsize=None)
+def silent_sequences(silent_dir):
+    sequences = {}
+    for silent_file in sorted(os.listdir(silent_dir)):
+        if silent_file.endswith('.silent'):
+            for tag, sequence in SilentFile(os.path.join(silent_dir, silent_file)).sequences().items():
+                try:
+                    sequences.setdefault(binder_name_from_description(tag), sequence)
+                except ValueError:
+                    print(f"Skipping silent tag {tag}")
+    return sequences
+
+# Scores of the fold cache entries with a target name, one row per binder sequence and one column per score and target
+def cached_scores(fold_cache_dir):
+    entries = FoldCache(fold_cache_dir).to_frame()
+    score_names = [score for score in ['pae_interaction', 'plddt_binder'] if score in entries.columns]
+    if entries.empty or 'target_name' not in entries.columns or not score_names:
+        return pd.DataFrame(index=pd.Index([], name='binder_seq'))
+    entries = entries.dropna(subset=['target_name']).sort_values('created').rename(columns={'sequence': 'binder_seq'})
+
+    # The latest fold of a sequence and target wins
+    scores = entries.pivot_table(index='binder_seq', columns='target_name', values=score_names, aggfunc='last')
+    scores.columns = [f'{score}_{target}' for score, target in scores.columns]
+    names = entries.drop_duplicates(subset='binder_seq').set_index('binder_seq')['name'].rename('binder_name')
+    return scores.join(names)
+
+# Function to yield the target name and scores of every score file
+def score_tables(csv_dir, score_dataset_dir=None, round_name=None):
+    columns = ['description', 'pae_interaction', 'plddt_binder']
+    if score_dataset_dir is not None:
+        # Only the needed columns and the partitions of this round are read
+        scores = pd.read_parquet(score_dataset_dir, columns=columns + ['target'], filters=[('round', '==', round_name)])
+        for target_name, target_data in scores.groupby('target', sort=False, observed=True):
+            yield str(target_name), target_data[columns].reset_index(drop=True)
+        return
+
+    for csv_file in os.listdir(csv_dir):
+        if csv_file.endswith('.csv'):
+            # Determine target name based on target order
+            target_name = "HLA_B_0801_NLFRRVWEL"  # Default
+            for target in target_order:
+                if target in csv_file:
+                    target_name = '_'.join(csv_file.split('_')[6:])
+                    target_name = target_name.split('.')[0]
+                    print(target_name)
+                    break
+
+            # Read the CSV file
+            yield target_name, pd.read_csv(os.path.join(csv_dir, csv_file), usecols=columns)
+
+# Function to process all files and build the master dataset
+def build_master_dataset(csv_dir, pdb_dir):
+    # Rows of every file and of every target, in file order so later rows overwrite earlier ones like before
+    all_frames = []
+    target_frames = {}
+
+    for target_name, csv_data in score_tables(csv_dir, score_dataset_dir, round_name):
+        binder_names = csv_data['description'].map(binder_name_from_description)
+
+        # Chain A sequence of every binder, each PDB file is parsed once
+        sequences = {}
+        for binder_name in binder_names.unique():
+            if silent_dir is not None:
+                binder_sequences = silent_sequences(silent_dir)
+                if binder_name in binder_sequences:
+                    sequences[binder_name] = binder_sequences[binder_name]
+                else:
+                    print(f"Binder not found in silent files: {binder_name}")
+                continue
+            pdb_path = os.path.join(pdb_dir, f"{binder_name}_HLA_B_0801_NLFRRVWEL.pdb")
+            if os.path.exists(pdb_path):
+                sequences[binder_name] = parse_pdb(pdb_path)
+            else:
+                print(f"PDB file not found: {pdb_path}")
+
+        target_data = pd.DataFrame({
+            'binder_name': binder_names,
+            'binder_seq': binder_names.map(sequences),
+            f'pae_interaction_{target_name}': csv_data['pae_interaction'],
+            f'plddt_binder_{target_name}': csv_data['plddt_binder']
+        }).dropna(subset=['binder_seq'])
+        all_frames.append(target_data)
+        target_frames.setdefault(target_name, []).append(target_data)
+
+    # One row per unique sequence, named after the first binder folded with that sequence
+    master_df = pd.concat(all_frames)[['binder_name', 'binder_seq']].drop_duplicates(subset='binder_seq')
+
+    # Join the scores of every target on the sequence, the last row of a sequence wins
+    for frames in target_frames.values():
+        target_data = pd.concat(frames).drop(columns='binder_name').drop_duplicates(subset='binder_seq', keep='last')
+        master_df = master_df.merge(target_data, on='binder_seq', how='left')
+
+    # Fill in scores of the fold cache, the score files win where both have a value
+    if fold_cache_dir is not None:
+        master_df = master_df.set_index('binder_seq').combine_first(cached_scores(fold_cache_dir)).reset_index()
+
+    print(master_df.head())
+
+    # Sort the DataFrame by the PAE interaction score for HLA_B_0801_NLFRRVWEL in ascending order
+    master_df = master_df.sort_values(by='pae_interaction_HLA_B_0801_NLFRRVWEL', ascending=True)
+
+    # Generate the column order dynamically from target_order
+    base_columns = ['binder_name', 'binder_seq']
+    target_columns = []
+    for target in target_order:
+        target_columns.append(f'pae_interaction_{target}')
+        target_columns.append(f'plddt_binder_{target}')
+    
+    # Combine base and target-specific columns to create the desired order
+    desired_order = base_columns + target_columns
+
+    # Reorder the columns in master_df to match `desired_order`
+    master_df = master_df.reindex(columns=desired_order)
+
+    return master_df
+
+# Build and save the master dataset
+master_dataset = build_master_dataset(csv_dir, pdb_dir)
+output_csv_path = 'data/NLFR_moo/25_samples/esm2_rf_ucb/pareto_1/proteus_25_esm2_rf_ucb_pareto_1.csv'
+master_dataset.to_csv(output_csv_path, index=False)
+print(f"Master dataset saved to {output_csv_path}")
+if store_dir is not None:
+    DatasetStore(store_dir).write('binders', master_dataset, iteration, name=round_name)
+    print(f"Master dataset stored as iteration {iteration} in {store_dir}")
@@ -0,0 +1,177 @@
+# Description: Batch candidate sequences into FASTA shards for folding
+# Duplicates and already folded sequences are dropped, the rest is sorted by complex length
+# and split into shards of about the same runtime, the input of src/gbar/colabfold.py
+
+import math
+import os
+import sys
+import pandas as pd
+
+# FASTA reader shared with the folding scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gbar'))
+from fold_cache import read_fasta
+
+# ColabFold recompiles for every new padded length, sequences in one bucket share a compiled model
+bucket_size = 10
+
+# Runtime model of one prediction in seconds, base + per_residue_squared * length^2
+base_seconds = 20.0
+per_residue_squared = 2e-3
+
+
+def write_fasta(records, path):
+    """Write (name, sequence) records to a FASTA file."""
+    with open(path, 'w') as fasta_file:
+        fasta_file.write(''.join(f">{name}\n{sequence}\n" for name, sequence in records))
+
+
+def estimated_seconds(length):
+    """Estimated folding time of a complex of the given total length."""
+    return base_seconds + per_residue_squared * length ** 2
+
+
+def load_folded_sequences(paths, sequence_column='binder_seq'):
+    """
+    Binder sequences that were folded before, from master dataset CSV files or FASTA shards.
+
+    Args:
+        paths (list): .csv files with a sequence column or .fasta files.
+        sequence_column (str): Column of the binder sequences in the CSV files.
+
+    Returns:
+        set: Folded binder sequences.
+    """
+    folded = set()
+    for path in paths:
+        if path.endswith('.csv'):
+            folded.update(pd.read_csv(path, usecols=[sequence_column])[sequence_column].dropna())
+        else:
+            # Complexes are written as binder:target, the binder comes first
+            folded.update(sequence.split(':')[0] for _, sequence in read_fasta(path))
+    return folded
+
+
+def candidate_table(names, sequences, target_sequence=None, folded=(), cache=None):
+    """
+    Unique candidates that still have to be folded, sorted by total complex length.
+
+    Args:
+        names (list): Candidate names.
+        sequences (list): Binder sequences.
+        target_sequence (str): Target chain(s) folded with every binder, joined with ':'. Default None, binder only.
+        folded (set): Binder sequences that were folded before.
+        cache (FoldCache): Fold cache of src/gbar/fold_cache.py, binder/target pairs in it are dropped as well. Default None.
+
+    Returns:
+        pd.DataFrame: name, binder_seq, fasta_seq (binder:target), length, bucket and estimated seconds.
+    """
+    candidates = pd.DataFrame({'name': list(names), 'binder_seq': list(sequences)})
+    n_input = len(candidates)
+    candidates = candidates.dropna().drop_duplicates(subset='binder_seq')
+    n_unique = len(candidates)
+    candidates = candidates[~candidates['binder_seq'].isin(set(folded))]
+    if cache is not None:
+        candidates = candidates[[(sequence, target_sequence or '') not in cache for sequence in candidates['binder_seq']]]
+    print(f"{n_input} candidates, {n_input - n_unique} duplicates and {n_unique - len(candidates)} already folded dropped.")
+
+    target_length = len(target_sequence.replace(':', '')) if target_sequence else 0
+    candidates['fasta_seq'] = candidates['binder_seq'] + (f':{target_sequence}' if target_sequence else '')
+    candidates['length'] = candidates['binder_seq'].str.len() + target_length
+    candidates['bucket'] = -(-candidates['length'] // bucket_size) * bucket_size
+    candidates['seconds'] = estimated_seconds(candidates['length'])
+    return candidates.sort_values(['length', 'name'], kind='stable').reset_index(drop=True)
+
+
+def split_shards(candidates, target_seconds=3600, n_shards=None):
+    """
+    Split length-sorted candidates into shards of about the same estimated runtime.
+
+    Shards hold consecutive lengths and end at a bucket boundary once they have 80% of their
+    share of the runtime, a bucket is only split when a shard reaches its full share.
+
+    Args:
+        candidates (pd.DataFrame): Output of candidate_table.
+        target_seconds (float): Estimated runtime of one shard, used when n_shards is None.
+        n_shards (int): Number of shards, e.g. one per folding slot. Default None.
+
+    Returns:
+        list: One DataFrame per shard.
+    """
+    if len(candidates) == 0:
+        return []
+    total = candidates['seconds'].sum()
+    n_shards = n_shards or math.ceil(total / target_seconds)
+    n_shards = max(1, min(n_shards, len(candidates)))
+
+    shards = []
+    start = 0
+    cost = 0.0
+    assigned = 0.0
+    seconds = candidates['seconds'].to_numpy()
+    buckets = candidates['bucket'].to_numpy()
+    for i in range(len(candidates) - 1):
+        cost += seconds[i]
+        if len(shards) == n_shards - 1:
+            break
+        # Share of the runtime not assigned yet per remaining shard
+        share = (total - assigned) / (n_shards - len(shards))
+        if (cost >= 0.8 * share and buckets[i + 1] != buckets[i]) or cost >= share:
+            shards.append(candidates.iloc[start:i + 1])
+            start, assigned, cost = i + 1, assigned + cost, 0.0
+    shards.append(candidates.iloc[start:])
+    return shards
+
+
+def write_shards(shards, output_dir, prefix='shard'):
+    """
+    Write every shard as a FASTA file named after its length range.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i, shard in enumerate(shards):
+        path = os.path.join(output_dir, f"{prefix}_{i:03d}_len{shard['length'].min()}-{shard['length'].max()}.fasta")
+        write_fasta(zip(shard['name'], shard['fasta_seq']), path)
+        print(f"{path}: {len(shard)} sequences, {shard['bucket'].nunique()} length buckets, "
+              f"about {shard['seconds'].sum() / 60:.0f} minutes")
+        paths.append(path)
+    return paths
+
+
+def batch_candidates(candidate_files, output_dir, folded_files=(), target_sequence=None, target_seconds=3600,
+                     n_shards=None, name_column='name', sequence_column='sequence', prefix='shard', cache=None):
+    """
+    Turn predict/pareto result CSV files into FASTA shards ready for folding.
+
+    Args:
+        candidate_files (list): CSV files with a name and a sequence column.
+        output_dir (str): Folder for the shards, the input folder of colabfold.process_fastas.
+        folded_files (list): Master dataset CSV files or FASTA files of sequences folded before.
+        target_sequence (str): Target chain(s) folded with every binder. Default None, binder only.
+        target_seconds (float): Estimated runtime of one shard.
+        n_shards (int): Number of shards instead of target_seconds. Default None.
+        name_column (str): Name column of the candidate files.
+        sequence_column (str): Sequence column of the candidate files.
+        prefix (str): File name prefix of the shards.
+        cache (FoldCache): Fold cache of earlier folds, see candidate_table. Default None.
+
+    Returns:
+        list: Paths of the written shards.
+    """
+    frames = [pd.read_csv(path, usecols=[name_column, sequence_column]) for path in candidate_files]
+    candidates = pd.concat(frames, ignore_index=True)
+    table = candidate_table(candidates[name_column], candidates[sequence_column], target_sequence=target_sequence,
+                            folded=load_folded_sequences(folded_files), cache=cache)
+    return write_shards(split_shards(table, target_seconds=target_seconds, n_shards=n_shards), output_dir, prefix=prefix)
+
+
+# Example usage
+if __name__ == "__main__":
+    batch_candidates(
+        ['results/pareto_results/NLFR_100/esm2_ridge_ucb/pareto_proteus_esm2_ridge_ucb_100_2.csv'],
+        'results/pareto_results/NLFR_100/esm2_ridge_ucb/shards',
+        folded_files=['data/master_dataset_NLFR_1000.csv'],
+        n_shards=4
+    )
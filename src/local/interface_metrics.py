@@ -0,0 +1,266 @@
+# Description: Interface metrics of ColabFold/AF2 complexes
+# iPAE, binder and interface pLDDT and CA-CA contacts, computed for many complexes at once
+# and written in the master dataset format of create_dataset_mod.py
+
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from structure_io import read_structure
+
+try:
+    # Optional, parses the number lists faster than NumPy's text parser
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fold cache shared with the folding scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gbar'))
+from fold_cache import FoldCache, colabfold_outputs
+
+# CA-CA distance in Ångström below which a binder and a target residue are in contact
+contact_cutoff = 8.0
+
+# Keys of the PAE matrix in ColabFold score files and AF2 PAE files
+pae_keys = ['pae', 'predicted_aligned_error']
+
+
+def _number_array(text, key, depth):
+    # The numbers of a JSON list, read straight from the text without building Python lists
+    start = text.find(f'"{key}"')
+    if start < 0:
+        return None
+    start = text.index('[', start)
+    end = text.index(']' * depth, start) + depth
+    if orjson is not None:
+        return np.asarray(orjson.loads(text[start:end]), dtype=np.float32).ravel()
+    values = text[start:end].replace('[', ' ').replace(']', ' ')
+    return np.fromstring(values, dtype=np.float32, sep=',') if values.strip() else np.zeros(0, dtype=np.float32)
+
+
+def read_scores(path, with_pae=True):
+    """
+    pLDDT, PAE and the other scores of a ColabFold score JSON (or an AF2 PAE JSON).
+
+    The pLDDT and PAE lists are cut out of the text and parsed as flat number arrays (with orjson
+    if it is installed), only the small remaining fields go through the json module.
+
+    Args:
+        path (str): Path to the JSON file.
+        with_pae (bool): Parse the PAE matrix, see load_pae for a cached copy.
+
+    Returns:
+        dict: 'plddt' (n,), 'pae' (n, n) as float32 arrays (None if missing or not parsed) and scalar
+            scores such as ptm and iptm.
+    """
+    with open(path, 'r') as file:
+        text = file.read()
+    plddt = _number_array(text, 'plddt', 1)
+    pae = None
+    for key in pae_keys if with_pae else []:
+        pae = _number_array(text, key, 2)
+        if pae is not None:
+            break
+    if pae is not None:
+        n = int(round(np.sqrt(len(pae))))
+        pae = pae.reshape(n, n)
+
+    scores = {'plddt': plddt, 'pae': pae}
+    for key in ['ptm', 'iptm', 'max_pae', 'max_predicted_aligned_error']:
+        position = text.find(f'"{key}"')
+        if position >= 0:
+            value = text[text.index(':', position) + 1:].lstrip()
+            scores[key] = json.JSONDecoder().raw_decode(value)[0]
+    return scores
+
+
+def pae_cache_path(path):
+    """Memory-mappable .npy copy of the PAE matrix of a score file, in a .pae_cache folder next to it."""
+    return os.path.join(os.path.dirname(path), '.pae_cache', os.path.basename(path) + '.pae.npy')
+
+
+def load_pae(path):
+    """
+    PAE matrix of a score file as a read-only memory map.
+
+    The matrix is parsed once and saved as .npy, later calls map the file without parsing the
+    JSON again, as long as the .npy is newer than the JSON.
+    """
+    npy_path = pae_cache_path(path)
+    if not (os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(path)):
+        pae = read_scores(path)['pae']
+        if pae is None:
+            raise ValueError(f"No PAE matrix in {path}")
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+        tmp_path = npy_path + f'.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, pae.astype(np.float32))
+        os.replace(tmp_path, npy_path)
+    return np.load(npy_path, mmap_mode='r')
+
+
+def interface_metrics_batch(pae, plddt, ca, binder_length, cutoff=contact_cutoff):
+    """
+    Interface metrics of a batch of complexes of the same size and binder length.
+
+    The binder is the first binder_length residues, the target the rest.
+
+    Args:
+        pae (np.ndarray): PAE matrices of shape (b, n, n).
+        plddt (np.ndarray): Per-residue pLDDT of shape (b, n).
+        ca (np.ndarray): CA coordinates of shape (b, n, 3).
+        binder_length (int): Number of binder residues.
+        cutoff (float): Contact distance in Ångström.
+
+    Returns:
+        dict: Arrays of shape (b,): pae_interaction (mean of both interchain PAE blocks), plddt_binder,
+            plddt_target, interface_plddt (mean over residues with a contact) and contacts (CA-CA pairs).
+    """
+    L = binder_length
+    pae_interaction = (pae[:, :L, L:].mean(axis=(1, 2)) + pae[:, L:, :L].mean(axis=(1, 2))) / 2
+
+    differences = ca[:, :L, None, :] - ca[:, None, L:, :]
+    in_contact = np.einsum('bijk,bijk->bij', differences, differences) < cutoff ** 2
+    interface = np.concatenate([in_contact.any(axis=2), in_contact.any(axis=1)], axis=1)
+    n_interface = interface.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interface_plddt = np.where(n_interface > 0, (plddt * interface).sum(axis=1) / n_interface, np.nan)
+
+    return {
+        'pae_interaction': pae_interaction,
+        'plddt_binder': plddt[:, :L].mean(axis=1),
+        'plddt_target': plddt[:, L:].mean(axis=1),
+        'interface_plddt': interface_plddt,
+        'contacts': in_contact.sum(axis=(1, 2))
+    }
+
+
+def find_colabfold_results(output_dir):
+    """
+    Rank 1 score file and structure of every query in a ColabFold output folder.
+
+    Query names are matched exactly by fold_cache.colabfold_outputs, so a query is never paired
+    with the structure of a longer query that starts with its name.
+
+    Returns:
+        list: (name, score_path, structure_path) tuples.
+    """
+    results = []
+    for name, (score_path, structure_path) in colabfold_outputs(output_dir).items():
+        if score_path is None:
+            continue
+        if structure_path is not None:
+            results.append((name, score_path, structure_path))
+        else:
+            print(f"No rank 1 structure found for {name} in {output_dir}")
+    return results
+
+
+def complex_metrics(results, binder_chain='A', cutoff=contact_cutoff, batch_size=256):
+    """
+    Interface metrics of many complexes, computed in batches of equal size.
+
+    Args:
+        results (list): (name, score_path, structure_path) tuples, see find_colabfold_results.
+        binder_chain (str): Chain of the binder, all other chains are the target.
+        cutoff (float): Contact distance in Ångström.
+        batch_size (int): Largest number of complexes stacked into one batch.
+
+    Returns:
+        pd.DataFrame: One row per complex with name, binder_seq, target_seq (target chains joined by ':'),
+            the metrics, ptm and iptm.
+    """
+    loaded = []
+    for name, score_path, structure_path in results:
+        structure = read_structure(structure_path)
+        # The PAE matrix follows the chain order of the file, the binder has to come first
+        chains = list(dict.fromkeys(structure.chain))
+        if chains[:1] != [binder_chain]:
+            print(f"Skipping {name}: chain {binder_chain} is not the first chain of {structure_path}")
+            continue
+        ca = np.concatenate([structure.ca_coords(chain) for chain in chains])
+        scores = read_scores(score_path, with_pae=False)
+        pae = load_pae(score_path)
+        if pae.shape[0] != len(ca) or len(scores['plddt']) != len(ca):
+            print(f"Skipping {name}: {pae.shape[0]} PAE rows, {len(scores['plddt'])} pLDDT values and {len(ca)} residues")
+            continue
+        # Target chains joined like the 'binder:target' queries, so the fold cache keys match colabfold.py's
+        target_seq = ':'.join(structure.sequence(chain) for chain in chains[1:])
+        loaded.append({'name': name, 'binder_seq': structure.sequence(binder_chain), 'target_seq': target_seq, 'pae': pae,
+                       'binder_length': len(structure.ca_coords(binder_chain)), 'plddt': scores['plddt'], 'ca': ca,
+                       'ptm': scores.get('ptm'), 'iptm': scores.get('iptm')})
+
+    # Complexes with the same number of residues and binder length are stacked into batches
+    rows = []
+    groups = {}
+    for item in loaded:
+        groups.setdefault((len(item['ca']), item['binder_length']), []).append(item)
+    batches = [(binder_length, items[start:start + batch_size])
+               for (_, binder_length), items in groups.items() for start in range(0, len(items), batch_size)]
+    for binder_length, items in batches:
+        metrics = interface_metrics_batch(np.stack([item['pae'] for item in items]),
+                                          np.stack([item['plddt'] for item in items]),
+                                          np.stack([item['ca'] for item in items]), binder_length, cutoff=cutoff)
+        for i, item in enumerate(items):
+            row = {'name': item['name'], 'binder_seq': item['binder_seq'], 'target_seq': item['target_seq'],
+                   'ptm': item['ptm'], 'iptm': item['iptm']}
+            row.update({metric: values[i].item() for metric, values in metrics.items()})
+            rows.append(row)
+    return pd.DataFrame(rows, columns=['name', 'binder_seq', 'target_seq', 'pae_interaction', 'plddt_binder',
+                                       'plddt_target', 'interface_plddt', 'contacts', 'ptm', 'iptm'])
+
+
+def to_master_format(metrics, target_name, binder_name=None):
+    """
+    Metrics of one target in the master dataset format of create_dataset_mod.py.
+
+    Args:
+        metrics (pd.DataFrame): Output of complex_metrics.
+        target_name (str): Target name used in the column names, e.g. 'HLA_B_0801_NLFRRVWEL'.
+        binder_name (callable): Function from query name to binder name. Default None, the query name.
+
+    Returns:
+        pd.DataFrame: binder_name, binder_seq and one <metric>_<target_name> column per metric.
+    """
+    names = metrics['name'].map(binder_name) if binder_name is not None else metrics['name']
+    master = pd.DataFrame({'binder_name': names, 'binder_seq': metrics['binder_seq']})
+    for metric in ['pae_interaction', 'plddt_binder', 'plddt_target', 'interface_plddt', 'contacts', 'ptm', 'iptm']:
+        master[f'{metric}_{target_name}'] = metrics[metric]
+    return master
+
+
+def colabfold_metrics(output_dir, target_name, cache=None, binder_name=None, output_csv=None):
+    """
+    Interface metrics of every complex in a ColabFold output folder, in the master dataset format.
+
+    Args:
+        output_dir (str): ColabFold output folder.
+        target_name (str): Target name used in the column names.
+        cache (FoldCache): Fold cache, the metrics are stored under the binder and target sequence, with
+            target_name set so create_dataset_mod.py can read them. Default None.
+        binder_name (callable): Function from query name to binder name. Default None, the query name.
+        output_csv (str): CSV file the table is saved to. Default None.
+
+    Returns:
+        pd.DataFrame: See to_master_format.
+    """
+    results = find_colabfold_results(output_dir)
+    metrics = complex_metrics(results)
+    if cache is not None:
+        structures = {name: structure_path for name, _, structure_path in results}
+        for row in metrics.to_dict('records'):
+            scores = {metric: value for metric, value in row.items() if metric not in ('name', 'binder_seq', 'target_seq')}
+            cache.put(row['binder_seq'], row['target_seq'], scores=scores,
+                      structure_path=os.path.abspath(structures[row['name']]),
+                      name=row['name'] if binder_name is None else binder_name(row['name']), target_name=target_name)
+    master = to_master_format(metrics, target_name, binder_name=binder_name)
+    if output_csv is not None:
+        master.to_csv(output_csv, index=False)
+    print(f"Interface metrics of {len(master)} complexes in {output_dir}")
+    return master
+
+
+# Example usage
+if __name__ == "__main__":
+    colabfold_metrics('results/fold/25_sample/esm2_rf_ucb/pareto_1/HLA_B_0801_NLFRRVWEL', 'HLA_B_0801_NLFRRVWEL',
+                      cache=FoldCache('fold_cache'), output_csv='results/fold/25_sample/esm2_rf_ucb/pareto_1/metrics.csv')
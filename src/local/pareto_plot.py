@@ -2,16 +2,23 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-import torch
-from botorch.utils.multi_objective import is_non_dominated
-from botorch.utils.multi_objective.hypervolume import Hypervolume
 import matplotlib
+import os
+import sys
+
+# Shared Pareto engine from the studentmachine scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'studentmachine'))
+from pareto import non_dominated_mask
+from hypervolume import hypervolume, HypervolumeTracker
 
 # Hardcoded paths for input CSV and output files
 CSV_PATH = 'data/pareto_scatter_dataset.csv'
 PARETO_CHART_PATH = 'results/pareto_plots/pareto_chart_new_2.png'
 LINE_GRAPH_PATH = 'results/pareto_plots/line_graph_new_2.png'
 
+# Hypervolume reference point (IpAE target 2, IpAE target 1)
+REF_POINT = (3.00, 28.00)
+
 def find_pareto_front(data):
     # Dynamically find the columns that match the target patterns
     target_a_col = [col for col in data.columns if "pae_interaction_HLA_B_0801_NLFRRVWEL" in col][0]
@@ -20,23 +27,18 @@ def find_pareto_front(data):
     # Print column names for debugging
     print("Objective columns:", target_a_col, target_b_col)
 
-    # Prepare objectives tensor
-    objectives = torch.tensor(np.column_stack((-data[target_a_col].values, 
-                                               data[target_b_col].values)), dtype=torch.float)
-
-    # Debug: Print objectives
-    print("Objective values (after negation for the first objective):")
-    print(objectives)
+    # Minimize the ipAE of target A, maximize the ipAE of target B
+    objectives = np.column_stack((data[target_a_col].values, data[target_b_col].values))
 
     # Find Pareto optimal points
-    pareto_mask = is_non_dominated(objectives)
+    pareto_mask = non_dominated_mask(objectives, directions=['min', 'max'])
 
     # Debug: Print Pareto mask and summary
     print("Pareto mask:", pareto_mask)
-    print("Number of Pareto points:", pareto_mask.sum().item())
-    print("Number of non-Pareto points:", (~pareto_mask).sum().item())
+    print("Number of Pareto points:", pareto_mask.sum())
+    print("Number of non-Pareto points:", (~pareto_mask).sum())
 
-    return pareto_mask.cpu().numpy()  # Convert back to a NumPy array if needed
+    return pareto_mask
 
 
 def calculate_hypervolume(data):
@@ -44,28 +46,22 @@ def calculate_hypervolume(data):
     target_a_col = [col for col in data.columns if "pae_interaction_HLA_B_0801_NLFRRVWEL" in col][0]
     target_b_col = [col for col in data.columns if "pae_interaction_HLA_B_0801_NLSRRVWEL" in col][0]
     
-    data = data[[target_b_col, target_a_col]]
-    # Find the Pareto front
-    pareto_mask = find_pareto_front(data)
-    # Extract the Pareto front points
-    pareto_points = torch.tensor(data[pareto_mask].to_numpy(), dtype=torch.float)
-    # Invert the second objective as Hypervolume is maximized
-    pareto_points[:, 1] = -pareto_points[:, 1]
-    
-    ref_point = torch.tensor((3.00, -28.00))
-
-    hv = Hypervolume(ref_point=ref_point)
-    volume = hv.compute(pareto_points)
-    return volume
-
-def accumulate_data_by_iteration(data):
-    accumulated_data = []
-    for iteration in sorted(data['iteration'].unique()):
-        # Accumulate data up to the current iteration
-        data_up_to_iteration = data[data['iteration'] <= iteration]
-        accumulated_data.append(data_up_to_iteration)
-    
-    return accumulated_data
+    # Maximize the ipAE of target B, minimize the ipAE of target A
+    return hypervolume(data[[target_b_col, target_a_col]].to_numpy(), REF_POINT, directions=['max', 'min'])
+
+def hypervolume_by_iteration(data):
+    # Dynamically find the columns for hypervolume calculation
+    target_a_col = [col for col in data.columns if "pae_interaction_HLA_B_0801_NLFRRVWEL" in col][0]
+    target_b_col = [col for col in data.columns if "pae_interaction_HLA_B_0801_NLSRRVWEL" in col][0]
+
+    # Merge every iteration into the running Pareto front instead of recomputing it for every prefix
+    tracker = HypervolumeTracker(REF_POINT, directions=['max', 'min'])
+    queried_sequences = []
+    for _, batch in data.groupby('iteration', sort=True):
+        tracker.update(batch[[target_b_col, target_a_col]].to_numpy())
+        queried_sequences.append(tracker.n_points)
+
+    return queried_sequences, tracker.history
 
 def set_plot_font(family='serif', weight='bold', size=12):
     font = {'family' : 'serif',
@@ -127,7 +123,7 @@ def plot_pareto_chart(data, save_img_path):
                 label='Iter 0 Pareto Points')
 
     # Reference point
-    ref_point = (3.00,28.00)
+    ref_point = REF_POINT
     plt.scatter(ref_point[0], ref_point[1], color='black', label='Reference Point', s=10)
     # Shade hypervolume for Pareto front points
     for i in range(len(pareto_points)):
@@ -148,16 +144,8 @@ def plot_pareto_chart(data, save_img_path):
 
 def plot_line_graph(data, save_img_path):
     set_plot_font()
-    accumulated_data = accumulate_data_by_iteration(data)
-    
-    hypervolumes = []
-    for data_up_to_iteration in accumulated_data:
-        # Calculate hypervolume for each accumulated data set
-        hv = calculate_hypervolume(data_up_to_iteration)
-        hypervolumes.append(hv)
-    
-    # List of the number of sequences up to each iteration
-    queried_sequences = [data.shape[0] for data in accumulated_data]
+    # Hypervolume and number of sequences up to each iteration
+    queried_sequences, hypervolumes = hypervolume_by_iteration(data)
     plt.figure(figsize=(10, 6))
     plt.step(queried_sequences, hypervolumes, where="post", color = 'darkblue')
     plt.axvline(x=queried_sequences[0], color='black', linestyle='--', label='Iteration 0')
@@ -1,9 +1,14 @@
-# Description: Converts .sc files to .csv files.
+# Description: Converts .sc files to .csv files or loads them into a Parquet dataset.
 # Convert .sc files made with AF2 inital guess to .csv files
 # .csv files is used for the create_dataset_mod.py script
 
 import csv
 import os
+import pandas as pd
+
+# Targets in the order create_dataset_mod.py uses them, longer names are matched first
+target_order = ['HLA_B_0801_NLFRRVWEL', 'HLA_B_0801_NLSRRVWEL', 'HLA_A_2402_NYFRRVWEF', 'HLA_A_0201_NLFRRVWEV', 'HLA_B_0801']
+
 
 def convert_sc_to_csv(input_file, output_file):
     """
@@ -36,7 +41,108 @@ def convert_directory_sc_to_csv(directory):
             print(f"Converting {input_file} to {output_file}")
             convert_sc_to_csv(input_file, output_file)
 
+def read_sc(input_file):
+    """
+    Stream a .sc score file into a DataFrame with typed columns.
+
+    Lines are 'SCORE:' records (the prefix is optional), the first one holding the column names.
+    'SEQUENCE:' lines are skipped, and header lines repeated by runs appended to the same file are
+    dropped. A header with other columns starts a new block, missing scores of a block are NaN.
+    Rows with the wrong number of fields (e.g. from an interrupted run) are skipped.
+
+    Args:
+        input_file (str): Path to the .sc file.
+
+    Returns:
+        pd.DataFrame: One row per design, numeric columns as numbers and the rest as strings.
+    """
+    blocks = []
+    header = None
+    rows = []
+    n_bad = 0
+    with open(input_file, 'r') as sc_file:
+        for line in sc_file:
+            fields = line.split()
+            if not fields or fields[0] == 'SEQUENCE:':
+                continue
+            if fields[0] == 'SCORE:':
+                fields = fields[1:]
+            # The header is the only line naming the description column
+            if fields[-1] == 'description':
+                if fields != header:
+                    if rows:
+                        blocks.append((header, rows))
+                    header, rows = fields, []
+            elif header is None or len(fields) != len(header):
+                n_bad += 1
+            else:
+                rows.append(fields)
+    if rows or header is not None:
+        blocks.append((header, rows))
+    if n_bad:
+        print(f"Skipped {n_bad} malformed lines in {input_file}")
+
+    frames = [pd.DataFrame(rows, columns=header) for header, rows in blocks]
+    scores = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    for column in scores.columns:
+        if column != 'description':
+            try:
+                scores[column] = pd.to_numeric(scores[column])
+            except (ValueError, TypeError):
+                pass
+    return scores
+
+def target_name_from_file(file_name, default='HLA_B_0801_NLFRRVWEL'):
+    """Target of a score file, named like create_dataset_mod.py does for its CSV files."""
+    for target in target_order:
+        if target in file_name:
+            return '_'.join(file_name.split('_')[6:]).split('.')[0]
+    return default
+
+def append_sc_to_dataset(input_file, dataset_dir, round_name, target=None):
+    """
+    Load a .sc file and write it to a Parquet dataset partitioned by target and round.
+
+    Every file is stored under its own name in its partition, so loading a file again replaces
+    its earlier rows instead of duplicating them.
+
+    Args:
+        input_file (str): Path to the .sc file.
+        dataset_dir (str): Root folder of the Parquet dataset.
+        round_name (str): Design round, e.g. 'pareto_1'.
+        target (str): Target name. Default None, derived from the file name.
+
+    Returns:
+        pd.DataFrame: The loaded scores.
+    """
+    scores = read_sc(input_file)
+    target = target or target_name_from_file(os.path.basename(input_file))
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    scores.assign(target=target, round=str(round_name)).to_parquet(
+        dataset_dir, partition_cols=['target', 'round'], index=False,
+        basename_template=f"{stem}-{{i}}.parquet", existing_data_behavior='overwrite_or_ignore'
+    )
+    return scores
+
+def convert_directory_sc_to_dataset(directory, dataset_dir, round_name):
+    """
+    Loads all .sc files in a directory into a Parquet dataset, see append_sc_to_dataset.
+
+    Args:
+        directory (str): Path to the directory containing .sc files.
+        dataset_dir (str): Root folder of the Parquet dataset.
+        round_name (str): Design round, e.g. 'pareto_1'.
+    """
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.sc'):
+            input_file = os.path.join(directory, file_name)
+            scores = append_sc_to_dataset(input_file, dataset_dir, round_name)
+            print(f"Loaded {len(scores)} designs from {input_file} into {dataset_dir}")
+
 # Example usage
-# Path to directory with .sc files
-directory = 'data/AF2_init_guess_results'
-convert_directory_sc_to_csv(directory)
+if __name__ == "__main__":
+    # Path to directory with .sc files
+    directory = 'data/AF2_init_guess_results'
+    convert_directory_sc_to_csv(directory)
+    # Or skip the CSV files and load the scores into one dataset for create_dataset_mod.py
+    # convert_directory_sc_to_dataset(directory, 'data/AF2_init_guess_results/scores', round_name='pareto_1')
@@ -0,0 +1,230 @@
+import mmap
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Bump when the index layout changes, so old index files are rebuilt
+INDEX_VERSION = 1
+
+# Structure lines of a binary silent file that are not residue coordinates
+non_residue_records = {'SCORE:', 'SEQUENCE:', 'ANNOTATED_SEQUENCE:', 'FOLD_TREE', 'RT', 'REMARK', 'CHAIN_ENDINGS'}
+
+# Rosetta's 6-bit code of every character of the coordinate encoding
+_six_bit = np.full(256, 63, dtype=np.uint8)
+_six_bit[np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype=np.uint8)] = np.arange(26)
+_six_bit[np.frombuffer(b'abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)] = np.arange(26, 52)
+_six_bit[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(52, 62)
+_six_bit[ord('+')] = 62
+
+
+def decode_coordinates(encoded):
+    """
+    Atom coordinates of one residue line of a binary silent file.
+
+    Every 4 characters hold 3 bytes, packed low bits first like Rosetta's Binary_Util, and the
+    bytes are little-endian float32 x, y, z triples.
+
+    Args:
+        encoded (str): Encoded coordinates, the residue line without its residue letter and tag.
+
+    Returns:
+        np.ndarray: Coordinates of shape (n_atoms, 3), in the atom order of the Rosetta residue type.
+    """
+    codes = _six_bit[np.frombuffer(encoded.encode(), dtype=np.uint8)].astype(np.uint16)
+    codes = np.concatenate([codes, np.zeros(-len(codes) % 4, dtype=np.uint16)]).reshape(-1, 4)
+    data = np.empty((len(codes), 3), dtype=np.uint8)
+    data[:, 0] = (codes[:, 0] & 0x3F) | ((codes[:, 1] & 0x03) << 6)
+    data[:, 1] = ((codes[:, 1] & 0x3C) >> 2) | ((codes[:, 2] & 0x0F) << 4)
+    data[:, 2] = ((codes[:, 2] & 0x30) >> 4) | ((codes[:, 3] & 0x3F) << 2)
+    data = data.ravel()
+    return data[:len(data) // 12 * 12].view('<f4').reshape(-1, 3)
+
+
+def plain_sequence(annotated_sequence):
+    """One-letter sequence of an ANNOTATED_SEQUENCE, e.g. 'M[MET:NtermProteinFull]K' becomes 'MK'."""
+    return re.sub(r'\[[^\]]*\]', '', annotated_sequence)
+
+
+class SilentRecord:
+    def __init__(self, tag, lines, score_header):
+        """
+        One design of a silent file, parsed from its lines.
+
+        Args:
+            tag (str): Design tag, the last field of every line of the design.
+            lines (list): Lines of the design.
+            score_header (list): Score column names in effect for the design.
+        """
+        self.tag = tag
+        self.scores = {}
+        self.annotated_sequence = ''
+        self.chain_endings = []
+        self._residue_lines = []
+        for line in lines:
+            fields = line.split()
+            if not fields or fields[-1] != tag:
+                continue
+            if fields[0] == 'SCORE:' and len(fields) - 1 == len(score_header):
+                self.scores = dict(zip(score_header, fields[1:]))
+            elif fields[0] == 'ANNOTATED_SEQUENCE:':
+                self.annotated_sequence = fields[1]
+            elif fields[0] == 'CHAIN_ENDINGS':
+                self.chain_endings = [int(end) for end in fields[1:-1]]
+            elif len(fields) == 2 and fields[0] not in non_residue_records:
+                self._residue_lines.append(fields[0])
+
+    @property
+    def sequence(self):
+        """One-letter sequence of all chains."""
+        if self.annotated_sequence:
+            return plain_sequence(self.annotated_sequence)
+        return ''.join(line[0] for line in self._residue_lines)
+
+    def chain_sequences(self):
+        """One-letter sequence of every chain, split at CHAIN_ENDINGS (chain A is the binder)."""
+        sequence = self.sequence
+        bounds = [0] + self.chain_endings + [len(sequence)]
+        return [sequence[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    def coordinates(self):
+        """Decoded atom coordinates of every residue, a list of (n_atoms, 3) arrays."""
+        return [decode_coordinates(line[1:]) for line in self._residue_lines]
+
+    def ca_coords(self):
+        """C-alpha coordinates, the second atom of every residue in Rosetta's atom order."""
+        return np.array([coords[1] for coords in self.coordinates() if len(coords) > 1], dtype=np.float32).reshape(-1, 3)
+
+
+class SilentFile:
+    def __init__(self, path, use_index_cache=True):
+        """
+        Random access to the designs of a silent file by tag, without extracting PDB files.
+
+        The file is indexed once with a regular expression over a memory map: every design
+        starts at its SCORE: line. The byte offsets and score lines are saved next to the file
+        as <path>.idx.npz and reused while the file's modification time and size are unchanged.
+
+        Args:
+            path (str): Path to the .silent file.
+            use_index_cache (bool): Read and write the index file.
+        """
+        self.path = path
+        self.index_path = path + '.idx.npz'
+        stat = os.stat(path)
+        if not (use_index_cache and self._load_index(stat)):
+            self._build_index()
+            if use_index_cache:
+                self._save_index(stat)
+        self._positions = {tag: i for i, tag in enumerate(self.tags)}
+
+    def _build_index(self):
+        tags, starts, score_lines, headers = [], [], [], []
+        header = []
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                data = b''
+            else:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            for match in re.finditer(rb'^SCORE:[^\n]*', data, flags=re.M):
+                fields = match.group().decode().split()
+                if len(fields) < 2:
+                    continue
+                # Header lines name the columns, they repeat when runs are appended to one file
+                if fields[-1] == 'description':
+                    header = fields[1:]
+                    continue
+                tags.append(fields[-1])
+                starts.append(match.start())
+                score_lines.append(' '.join(fields[1:]))
+                headers.append(' '.join(header))
+            end = len(data)
+            if end:
+                data.close()
+        self.tags = tags
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], end).astype(np.int64)
+        self.score_lines = score_lines
+        self.score_headers = headers
+
+    def _load_index(self, stat):
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path) as data:
+                if (int(data['version']) != INDEX_VERSION or int(data['mtime_ns']) != stat.st_mtime_ns
+                        or int(data['size']) != stat.st_size):
+                    return False
+                self.tags = data['tags'].tolist()
+                self.starts = data['starts']
+                self.ends = data['ends']
+                self.score_lines = data['score_lines'].tolist()
+                self.score_headers = data['score_headers'].tolist()
+            return True
+        except Exception as e:
+            print(f"Ignoring unreadable silent index {self.index_path}: {e}")
+            return False
+
+    def _save_index(self, stat):
+        tmp_path = self.index_path + f'.{os.getpid()}.tmp.npz'
+        try:
+            np.savez(tmp_path, tags=np.array(self.tags, dtype=str), starts=self.starts, ends=self.ends,
+                     score_lines=np.array(self.score_lines, dtype=str),
+                     score_headers=np.array(self.score_headers, dtype=str),
+                     version=INDEX_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not save silent index {self.index_path}: {e}")
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, tag):
+        return tag in self._positions
+
+    def read_lines(self, tag):
+        """Raw lines of one design, read with a single seek."""
+        i = self._positions[tag]
+        with open(self.path, 'rb') as file:
+            file.seek(int(self.starts[i]))
+            return file.read(int(self.ends[i] - self.starts[i])).decode().splitlines()
+
+    def record(self, tag):
+        """SilentRecord of one design."""
+        i = self._positions[tag]
+        return SilentRecord(tag, self.read_lines(tag), self.score_headers[i].split())
+
+    def records(self, tags=None):
+        """Lazily yield the SilentRecord of every design (or of the given tags) in file order."""
+        positions = sorted(self._positions[tag] for tag in tags) if tags is not None else range(len(self.tags))
+        with open(self.path, 'rb') as file:
+            for i in positions:
+                file.seek(int(self.starts[i]))
+                lines = file.read(int(self.ends[i] - self.starts[i])).decode().splitlines()
+                yield SilentRecord(self.tags[i], lines, self.score_headers[i].split())
+
+    def sequences(self, chain=0):
+        """One-letter sequence of one chain of every design (0 is chain A), keyed by tag."""
+        sequences = {}
+        for record in self.records():
+            chains = record.chain_sequences()
+            sequences[record.tag] = chains[chain] if chain < len(chains) else ''
+        return sequences
+
+    def scores(self):
+        """
+        Scores of every design from the index, without reading the file again.
+
+        Returns:
+            pd.DataFrame: One row per design with typed score columns and the tag as 'description'.
+        """
+        rows = [dict(zip(header.split(), line.split())) for header, line in zip(self.score_headers, self.score_lines)]
+        scores = pd.DataFrame(rows)
+        scores['description'] = self.tags
+        for column in scores.columns:
+            if column != 'description':
+                try:
+                    scores[column] = pd.to_numeric(scores[column])
+                except (ValueError, TypeError):
+                    pass
+        return scores
@@ -0,0 +1,316 @@
+import gzip
+import os
+import shlex
+import numpy as np
+
+# Dictionary to map three-letter amino acid codes to one-letter codes
+aa_dict = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C',
+    'GLU': 'E', 'GLN': 'Q', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I',
+    'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P',
+    'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
+    'SEC': 'U'  # Selenocysteine, sometimes present in proteins
+}
+
+# Bump when the parsed arrays change, so old sidecar caches are ignored
+CACHE_VERSION = 1
+
+# Fixed-width columns of PDB ATOM/HETATM records
+pdb_columns = {
+    'atom_name': (12, 16), 'alt_loc': (16, 17), 'resn': (17, 20), 'chain': (21, 22), 'resi': (22, 26),
+    'icode': (26, 27), 'x': (30, 38), 'y': (38, 46), 'z': (46, 54), 'b_factor': (60, 66), 'element': (76, 78)
+}
+
+# mmCIF _atom_site fields used for every array, author numbering first like PyMOL and biotite
+cif_fields = {
+    'record': ['group_PDB'], 'atom_name': ['auth_atom_id', 'label_atom_id'], 'alt_loc': ['label_alt_id'],
+    'resn': ['auth_comp_id', 'label_comp_id'], 'chain': ['auth_asym_id', 'label_asym_id'],
+    'resi': ['auth_seq_id', 'label_seq_id'], 'icode': ['pdbx_PDB_ins_code'], 'x': ['Cartn_x'], 'y': ['Cartn_y'],
+    'z': ['Cartn_z'], 'b_factor': ['B_iso_or_equiv'], 'element': ['type_symbol'], 'model': ['pdbx_PDB_model_num']
+}
+
+
+class Structure:
+    fields = ['hetero', 'atom_name', 'resn', 'chain', 'resi', 'icode', 'xyz', 'b_factor', 'element']
+
+    def __init__(self, hetero, atom_name, resn, chain, resi, icode, xyz, b_factor, element):
+        """
+        Atoms of a structure as parallel NumPy arrays, one entry per atom.
+
+        Args:
+            hetero (np.ndarray): True for HETATM records.
+            atom_name (np.ndarray): Atom names, e.g. 'CA'.
+            resn (np.ndarray): Three-letter residue names.
+            chain (np.ndarray): Chain identifiers.
+            resi (np.ndarray): Residue numbers.
+            icode (np.ndarray): Insertion codes, '' if none.
+            xyz (np.ndarray): Coordinates of shape (n_atoms, 3).
+            b_factor (np.ndarray): B-factors, the pLDDT for AlphaFold models.
+            element (np.ndarray): Element symbols.
+        """
+        self.hetero = hetero
+        self.atom_name = atom_name
+        self.resn = resn
+        self.chain = chain
+        self.resi = resi
+        self.icode = icode
+        self.xyz = xyz
+        self.b_factor = b_factor
+        self.element = element
+
+    def __len__(self):
+        return len(self.resi)
+
+    def select(self, mask):
+        """Structure with the atoms selected by a boolean mask or index array."""
+        return Structure(**{field: getattr(self, field)[mask] for field in self.fields})
+
+    def select_chain(self, chain_id):
+        """Structure with the atoms of one chain."""
+        return self.select(self.chain == chain_id)
+
+    def residue_starts(self):
+        """Index of the first atom of every residue, residues keep their file order."""
+        keys = np.char.add(np.char.add(self.chain, '|'), np.char.add(self.resi.astype(str), self.icode))
+        _, first = np.unique(keys, return_index=True)
+        return np.sort(first)
+
+    def sequence(self, chain_id='A'):
+        """One-letter sequence of a chain, residues without a known amino acid are skipped."""
+        chain = self.select_chain(chain_id)
+        chain = chain.select(np.isin(chain.resn, list(aa_dict)))
+        return ''.join(aa_dict[resn] for resn in chain.resn[chain.residue_starts()])
+
+    def ca_coords(self, chain_id=None):
+        """C-alpha coordinates, of one chain or of all chains."""
+        mask = self.atom_name == 'CA'
+        if chain_id is not None:
+            mask &= self.chain == chain_id
+        return self.xyz[mask]
+
+    def residue_b_factors(self, chain_id=None):
+        """Mean B-factor of every residue (per-residue pLDDT for AlphaFold models)."""
+        structure = self if chain_id is None else self.select_chain(chain_id)
+        starts = structure.residue_starts()
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.float32)
+        # Atoms of a residue are contiguous in the file
+        return np.add.reduceat(structure.b_factor, starts) / np.diff(np.append(starts, len(structure)))
+
+    def save_npz(self, path, **metadata):
+        """Save the arrays and metadata to a compressed .npz file."""
+        np.savez_compressed(path, **{field: getattr(self, field) for field in self.fields}, **metadata)
+
+    @classmethod
+    def from_npz(cls, data):
+        """Structure from the arrays of a loaded .npz file."""
+        return cls(**{field: data[field] for field in cls.fields})
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def _columns(lines, width=80):
+    # All records as one (n_lines, width) byte matrix, so every field is a column slice
+    padded = b''.join(line.encode()[:width].ljust(width) for line in lines)
+    matrix = np.frombuffer(padded, dtype=np.uint8).reshape(len(lines), width)
+
+    def column(start, end):
+        values = np.ascontiguousarray(matrix[:, start:end]).view(f'S{end - start}').ravel()
+        return np.char.strip(values.astype(f'U{end - start}'))
+    return column
+
+
+def parse_pdb_atoms(path):
+    """
+    Parse the ATOM/HETATM records of the first model of a PDB file by fixed-width columns.
+
+    Args:
+        path (str): Path to a .pdb or .pdb.gz file.
+
+    Returns:
+        Structure: Parsed atoms.
+    """
+    lines = []
+    with _open_text(path) as file:
+        for line in file:
+            if line.startswith('ATOM') or line.startswith('HETATM'):
+                lines.append(line.rstrip('\n'))
+            elif line.startswith('ENDMDL'):
+                break
+
+    column = _columns(lines)
+    alt_loc = column(*pdb_columns['alt_loc'])
+    b_factor = column(*pdb_columns['b_factor'])
+    # Keep the first alternate location only
+    keep = np.isin(alt_loc, ['', 'A', '1'])
+    structure = Structure(
+        hetero=column(0, 6) == 'HETATM',
+        atom_name=column(*pdb_columns['atom_name']),
+        resn=column(*pdb_columns['resn']),
+        chain=column(*pdb_columns['chain']),
+        resi=column(*pdb_columns['resi']).astype(int),
+        icode=column(*pdb_columns['icode']),
+        xyz=np.column_stack([column(*pdb_columns[axis]).astype(np.float32) for axis in 'xyz']),
+        b_factor=np.where(b_factor == '', '0', b_factor).astype(np.float32),
+        element=column(*pdb_columns['element'])
+    )
+    return structure.select(keep)
+
+
+def parse_cif_atoms(path):
+    """
+    Parse the _atom_site loop of the first model of an mmCIF file.
+
+    Args:
+        path (str): Path to a .cif or .cif.gz file.
+
+    Returns:
+        Structure: Parsed atoms.
+    """
+    header = []
+    rows = []
+    in_loop = False
+    with _open_text(path) as file:
+        for line in file:
+            if line.startswith('_atom_site.'):
+                header.append(line.strip()[len('_atom_site.'):])
+                in_loop = True
+            elif in_loop:
+                if line.startswith('#') or line.startswith('loop_') or line.startswith('_'):
+                    break
+                if line.strip():
+                    rows.append(line)
+
+    text = ''.join(rows)
+    tokens = shlex.split(text) if '"' in text or "'" in text else text.split()
+    table = np.array(tokens, dtype=str).reshape(-1, len(header))
+
+    def field(name, default=''):
+        for key in cif_fields[name]:
+            if key in header:
+                values = table[:, header.index(key)]
+                return np.where(np.isin(values, ['?', '.']), default, values)
+        return np.full(len(table), default)
+
+    models = field('model', '1')
+    first_model = models == models[0] if len(models) else np.zeros(0, dtype=bool)
+    keep = first_model & np.isin(field('alt_loc'), ['', 'A', '1'])
+    structure = Structure(
+        hetero=field('record') == 'HETATM',
+        atom_name=field('atom_name'),
+        resn=field('resn'),
+        chain=field('chain'),
+        resi=field('resi', '0').astype(int),
+        icode=field('icode'),
+        xyz=np.column_stack([field(axis, '0').astype(np.float32) for axis in 'xyz']),
+        b_factor=field('b_factor', '0').astype(np.float32),
+        element=field('element')
+    )
+    return structure.select(keep)
+
+
+def cache_path(path, cache_dir=None):
+    """Sidecar .npz of a structure file, in a .structure_cache folder next to it by default."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), '.structure_cache')
+    return os.path.join(cache_dir, os.path.basename(path) + '.npz')
+
+
+def is_up_to_date(output_path, input_paths):
+    """True if the output exists and is newer than all of its inputs."""
+    if not os.path.exists(output_path):
+        return False
+    output_mtime = os.path.getmtime(output_path)
+    return all(os.path.getmtime(path) <= output_mtime for path in input_paths)
+
+
+def read_structure(path, cache_dir=None, use_cache=True):
+    """
+    Read a PDB or mmCIF file (optionally gzipped) or a saved .npz Structure, reusing a parsed sidecar cache.
+
+    The cache is keyed by the file's modification time and size, so an overwritten file is parsed again.
+
+    Args:
+        path (str): Path to the structure file.
+        cache_dir (str): Folder for the .npz sidecars. Default None, '.structure_cache' next to the file.
+        use_cache (bool): Read and write the sidecar cache.
+
+    Returns:
+        Structure: Parsed atoms of the first model.
+    """
+    if path.endswith('.npz'):
+        # Already in the array format, e.g. written by CifToPdb.convert_all_cifs(output_format='npz')
+        with np.load(path) as data:
+            return Structure.from_npz(data)
+
+    stat = os.stat(path)
+    sidecar = cache_path(path, cache_dir)
+    if use_cache and os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as data:
+                if (int(data['version']) == CACHE_VERSION and int(data['mtime_ns']) == stat.st_mtime_ns
+                        and int(data['size']) == stat.st_size):
+                    return Structure.from_npz(data)
+        except Exception as e:
+            print(f"Ignoring unreadable structure cache {sidecar}: {e}")
+
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.cif'):
+        structure = parse_cif_atoms(path)
+    else:
+        structure = parse_pdb_atoms(path)
+
+    if use_cache:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        tmp_path = sidecar + f'.{os.getpid()}.tmp.npz'
+        structure.save_npz(tmp_path, version=CACHE_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        os.replace(tmp_path, sidecar)
+    return structure
+
+
+def concatenate_structures(structures):
+    """One Structure with the atoms of all structures, in the given order."""
+    return Structure(**{field: np.concatenate([getattr(structure, field) for structure in structures])
+                        for field in Structure.fields})
+
+
+def sort_atoms(structure):
+    """Group atoms by chain in alphabetical order, keeping the file order within a chain."""
+    return structure.select(np.argsort(structure.chain, kind='stable'))
+
+
+def _pdb_atom_name(name, element):
+    # Four-letter names start in column 13, shorter names of one-letter elements in column 14
+    if len(name) >= 4 or len(element) == 2:
+        return f"{name:<4}"[:4]
+    return f" {name:<3}"
+
+
+def write_pdb(structure, path):
+    """
+    Write a Structure as a PDB file, with a TER record after every chain.
+
+    Args:
+        structure (Structure): Atoms to write.
+        path (str): Output .pdb path.
+    """
+    lines = []
+    serial = 1
+    for i in range(len(structure)):
+        record = 'HETATM' if structure.hetero[i] else 'ATOM'
+        x, y, z = structure.xyz[i]
+        lines.append(
+            f"{record:<6}{serial % 100000:5d} {_pdb_atom_name(structure.atom_name[i], structure.element[i])}"
+            f" {structure.resn[i]:>3} {structure.chain[i]:1}{structure.resi[i]:4d}{structure.icode[i]:1}   "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{structure.b_factor[i]:6.2f}          {structure.element[i]:>2}"
+        )
+        serial += 1
+        if i == len(structure) - 1 or structure.chain[i + 1] != structure.chain[i]:
+            lines.append(f"TER   {serial % 100000:5d}      {structure.resn[i]:>3} {structure.chain[i]:1}{structure.resi[i]:4d}")
+            serial += 1
+    lines.append('END')
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
@@ -0,0 +1,274 @@
+from functools import lru_cache
+import numpy as np
+from structure_io import aa_dict, read_structure, write_pdb, concatenate_structures, sort_atoms
+
+
+def kabsch(mobile, reference):
+    """
+    Rotation and translation that superimpose mobile onto reference with the lowest RMSD.
+
+    Works on a single pair of (n, 3) arrays or on a batch of shape (b, n, 3), in which case all
+    pairs are solved with one stacked SVD.
+
+    Args:
+        mobile (np.ndarray): Coordinates to move.
+        reference (np.ndarray): Matching reference coordinates.
+
+    Returns:
+        tuple: Rotation (3, 3), translation (3,) and RMSD, with a leading batch axis for batches.
+            Apply as mobile @ rotation.T + translation.
+    """
+    mobile = np.asarray(mobile, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    mobile_center = mobile.mean(axis=-2, keepdims=True)
+    reference_center = reference.mean(axis=-2, keepdims=True)
+    P = mobile - mobile_center
+    Q = reference - reference_center
+
+    H = np.swapaxes(P, -1, -2) @ Q
+    U, S, Vt = np.linalg.svd(H)
+    # Flip the last axis where needed so the result is a proper rotation
+    d = np.sign(np.linalg.det(np.swapaxes(Vt, -1, -2) @ np.swapaxes(U, -1, -2)))
+    D = np.zeros(H.shape)
+    D[..., 0, 0] = 1
+    D[..., 1, 1] = 1
+    D[..., 2, 2] = d
+    rotation = np.swapaxes(Vt, -1, -2) @ D @ np.swapaxes(U, -1, -2)
+    translation = reference_center[..., 0, :] - (mobile_center @ np.swapaxes(rotation, -1, -2))[..., 0, :]
+
+    moved = P @ np.swapaxes(rotation, -1, -2)
+    rmsd = np.sqrt(np.mean(np.sum((moved - Q) ** 2, axis=-1), axis=-1))
+    return rotation, translation, rmsd
+
+
+def align_sequences(seq1, seq2, match=2, mismatch=-1, gap=-2):
+    """
+    Global (Needleman-Wunsch) alignment of two sequences with a linear gap penalty.
+
+    Every row of the score matrix is computed with NumPy: the diagonal and vertical moves are
+    elementwise, the horizontal gaps are a running maximum.
+
+    Returns:
+        np.ndarray: Pairs of aligned positions (i in seq1, j in seq2) of shape (n_pairs, 2).
+    """
+    a = np.frombuffer(seq1.encode(), dtype=np.uint8)
+    b = np.frombuffer(seq2.encode(), dtype=np.uint8)
+    n, m = len(a), len(b)
+    gap_steps = gap * np.arange(m + 1)
+    scores = np.zeros((n + 1, m + 1))
+    scores[0] = gap_steps
+    for i in range(1, n + 1):
+        substitution = np.where(b == a[i - 1], match, mismatch)
+        candidate = np.empty(m + 1)
+        candidate[0] = gap * i
+        candidate[1:] = np.maximum(scores[i - 1, :-1] + substitution, scores[i - 1, 1:] + gap)
+        # Gaps in seq1: row[j] = max over k <= j of candidate[k] + gap * (j - k)
+        scores[i] = np.maximum.accumulate(candidate - gap_steps) + gap_steps
+
+    pairs = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        if scores[i, j] == scores[i - 1, j - 1] + (match if a[i - 1] == b[j - 1] else mismatch):
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+        elif scores[i, j] == scores[i - 1, j] + gap:
+            i -= 1
+        else:
+            j -= 1
+    return np.array(pairs[::-1], dtype=int).reshape(-1, 2)
+
+
+def residue_ca(structure):
+    """C-alpha coordinates and one-letter sequence of the amino acid residues of a structure."""
+    mask = (structure.atom_name == 'CA') & np.isin(structure.resn, list(aa_dict))
+    ca = structure.select(mask)
+    return ca.xyz, ''.join(aa_dict[resn] for resn in ca.resn)
+
+
+@lru_cache(maxsize=1024)
+def _residue_pairs(mobile_seq, reference_seq):
+    # The same binder and target sequences come back for many pairs, align each combination once
+    pairs = align_sequences(mobile_seq, reference_seq)
+    identical = np.array([mobile_seq[i] == reference_seq[j] for i, j in pairs], dtype=bool)
+    if identical.sum() >= 3:
+        pairs = pairs[identical]
+    return pairs
+
+
+def match_ca(mobile_ca, mobile_seq, reference_ca, reference_seq):
+    """
+    Matching C-alpha coordinates of two residue lists.
+
+    Identical sequences are matched one to one, otherwise by a global sequence alignment
+    (only identical aligned residues are used, like PyMOL's align).
+
+    Returns:
+        tuple: Mobile and reference C-alpha coordinates of the matched residues.
+    """
+    if mobile_seq == reference_seq:
+        return mobile_ca, reference_ca
+    pairs = _residue_pairs(mobile_seq, reference_seq)
+    return mobile_ca[pairs[:, 0]], reference_ca[pairs[:, 1]]
+
+
+def match_residues(mobile, reference):
+    """Matching C-alpha coordinates of two structures, see match_ca."""
+    return match_ca(*residue_ca(mobile), *residue_ca(reference))
+
+
+def fit(mobile_ca, reference_ca, cycles=5, cutoff=2.0):
+    """
+    Kabsch fit with outlier rejection, pairs further apart than cutoff times the RMSD are dropped
+    and the fit is repeated (PyMOL's align defaults).
+
+    Returns:
+        tuple: Rotation, translation, RMSD of the kept pairs and number of kept pairs.
+    """
+    keep = np.ones(len(mobile_ca), dtype=bool)
+    rotation, translation, rmsd = kabsch(mobile_ca, reference_ca)
+    for _ in range(cycles):
+        distances = np.linalg.norm(mobile_ca @ rotation.T + translation - reference_ca, axis=1)
+        new_keep = distances <= cutoff * max(rmsd, 1e-6)
+        if new_keep.all() or new_keep.sum() < 3 or (new_keep == keep).all():
+            break
+        keep = new_keep
+        rotation, translation, rmsd = kabsch(mobile_ca[keep], reference_ca[keep])
+    return rotation, translation, rmsd, int(keep.sum())
+
+
+def transform(structure, rotation, translation):
+    """Copy of a structure with rotated and translated coordinates."""
+    moved = structure.select(slice(None))
+    moved.xyz = (structure.xyz @ rotation.T + translation).astype(np.float32)
+    return moved
+
+
+def superpose(mobile, reference, cycles=5, cutoff=2.0):
+    """
+    Superimpose a structure onto a reference by their matching C-alpha atoms.
+
+    Args:
+        mobile (Structure): Structure to move, e.g. a folded binder.
+        reference (Structure): Reference atoms, e.g. one chain of a complex.
+        cycles (int): Outlier rejection cycles.
+        cutoff (float): Outlier cutoff in multiples of the RMSD.
+
+    Returns:
+        tuple: Moved copy of mobile and the RMSD of the fit.
+    """
+    return superpose_ca(mobile, residue_ca(mobile), residue_ca(reference), cycles=cycles, cutoff=cutoff)
+
+
+def superpose_ca(mobile, mobile_residues, reference_residues, cycles=5, cutoff=2.0):
+    """superpose() with the (C-alpha coordinates, sequence) of both sides already extracted."""
+    mobile_ca, reference_ca = match_ca(*mobile_residues, *reference_residues)
+    if len(mobile_ca) < 3:
+        raise ValueError("Fewer than 3 matching residues, the structures cannot be superimposed.")
+    rotation, translation, rmsd, _ = fit(mobile_ca, reference_ca, cycles=cycles, cutoff=cutoff)
+    return transform(mobile, rotation, translation), rmsd
+
+
+def remove_solvent_and_ligands(structure):
+    """Drop waters and HETATM records (PyMOL's remove resn HOH and remove hetatm)."""
+    return structure.select(~structure.hetero & (structure.resn != 'HOH'))
+
+
+def shift_residues(structure, shift):
+    """Copy of a structure with every residue number shifted."""
+    shifted = structure.select(slice(None))
+    shifted.resi = structure.resi + shift
+    return shifted
+
+
+def set_chain(structure, chain_id):
+    """Copy of a structure with every atom in one chain."""
+    renamed = structure.select(slice(None))
+    renamed.chain = np.full(len(structure), chain_id)
+    return renamed
+
+
+class PreparedStructure:
+    def __init__(self, path):
+        """
+        A structure read and cleaned once, with its chains and their C-alpha atoms prepared on first use.
+
+        Args:
+            path (str): Structure file.
+        """
+        self.path = path
+        self.structure = remove_solvent_and_ligands(read_structure(path))
+        self.residues = residue_ca(self.structure)
+        self._chains = {}
+
+    def chain(self, chain_id):
+        """Atoms, C-alpha coordinates and sequence of one chain."""
+        if chain_id not in self._chains:
+            chain = self.structure.select_chain(chain_id)
+            if len(chain) == 0:
+                raise ValueError(f"No atoms found in chain {chain_id} of {self.path}.")
+            self._chains[chain_id] = (chain, residue_ca(chain))
+        return self._chains[chain_id]
+
+    def without_chain(self, chain_id):
+        """Atoms of all other chains."""
+        return self.structure.select(self.structure.chain != chain_id)
+
+
+@lru_cache(maxsize=128)
+def load_prepared(path):
+    """PreparedStructure of a file, kept per process so targets shared by many pairs are prepared once."""
+    return PreparedStructure(path)
+
+
+def assemble_binder_complex(binder_path, complex_path, output_path):
+    """
+    Put a folded binder in place of chain A of an initial binder/target complex.
+
+    The target chains of the complex are renumbered after the binder, the binder becomes chain A
+    and is superimposed onto the old chain A, which is then removed. The complex is prepared once
+    per process and reused for every binder folded from it.
+
+    Args:
+        binder_path (str): Folded binder structure.
+        complex_path (str): Initial binder/target complex.
+        output_path (str): Combined complex to write.
+
+    Returns:
+        float: RMSD of the superposition.
+    """
+    binder = PreparedStructure(binder_path)
+    complex_structure = load_prepared(complex_path)
+    reference, reference_residues = complex_structure.chain('A')
+
+    moved, rmsd = superpose_ca(set_chain(binder.structure, 'A'), binder.residues, reference_residues)
+    targets = shift_residues(complex_structure.without_chain('A'), int(reference.resi[-1]))
+    write_pdb(sort_atoms(concatenate_structures([targets, moved])), output_path)
+    return rmsd
+
+
+def assemble_target_complex(complex_path, target_path, output_path):
+    """
+    Put a new target in place of chain B of a binder/target complex.
+
+    The new target becomes chain B, is renumbered after the binder (chain A) and superimposed onto
+    the old chain B, which is then removed. Targets are prepared once per process and reused for
+    every binder.
+
+    Args:
+        complex_path (str): Binder/target complex with the binder as chain A and the target as chain B.
+        target_path (str): New target structure.
+        output_path (str): Combined complex to write.
+
+    Returns:
+        float: RMSD of the superposition.
+    """
+    complex_structure = load_prepared(complex_path)
+    target = load_prepared(target_path)
+    binder, _ = complex_structure.chain('A')
+    _, reference_residues = complex_structure.chain('B')
+
+    mobile = shift_residues(set_chain(target.structure, 'B'), int(binder.resi[-1]))
+    moved, rmsd = superpose_ca(mobile, target.residues, reference_residues)
+    write_pdb(sort_atoms(concatenate_structures([complex_structure.without_chain('B'), moved])), output_path)
+    return rmsd
@@ -0,0 +1,147 @@
+import numpy as np
+from scipy.stats import norm
+from pareto import non_dominated_mask
+from hypervolume import hypervolume_improvement_2d
+
+
+def greedy(mean, sigma=None, y_best=None):
+    """Greedy acquisition, the predicted mean itself."""
+    return mean
+
+
+def ucb(mean, sigma, y_best=None, kappa=1.5):
+    """Upper confidence bound (same kappa as ProteusAI)."""
+    return mean + kappa * sigma
+
+
+def ei(mean, sigma, y_best, xi=0.1):
+    """Expected improvement over the best observed value (same xi as ProteusAI)."""
+    z = (mean - y_best - xi) / (sigma + 1e-9)
+    score = (mean - y_best - xi) * norm.cdf(z) + sigma * norm.pdf(z)
+    return np.where(sigma == 0, 0, score)
+
+
+acq_fns = {'greedy': greedy, 'ucb': ucb, 'ei': ei}
+
+
+def task_signs(tasks):
+    """+1 for objectives to maximize and -1 for objectives to minimize."""
+    return np.array([1.0 if task == 'max' else -1.0 for task in tasks])
+
+
+def acquisition_scores(mean, sigma, tasks, y_best, acq_fn='ucb'):
+    """
+    Per-objective acquisition scores for a whole candidate matrix.
+
+    Objectives to minimize are negated first, so a higher score is always better.
+
+    Args:
+        mean (np.ndarray): Predicted means of shape (n_candidates, n_objectives).
+        sigma (np.ndarray): Predicted sigmas of shape (n_candidates, n_objectives).
+        tasks (list): 'min' or 'max' for each objective.
+        y_best (np.ndarray): Best observed value of each objective.
+        acq_fn (str): 'ucb', 'ei' or 'greedy'.
+
+    Returns:
+        np.ndarray: Acquisition scores of shape (n_candidates, n_objectives).
+    """
+    signs = task_signs(tasks)
+    return acq_fns[acq_fn](mean * signs, sigma, np.asarray(y_best) * signs)
+
+
+class MultiObjectiveAcquisition:
+    methods = ['ehvi', 'parego']
+
+    def __init__(self, Y_observed, tasks, method='ehvi', kappa=1.5, n_samples=32, n_weights=32,
+                 n_volume_samples=2048, rho=0.05, ref_point=None, seed=42):
+        """
+        Joint acquisition over all objectives, computed vectorised from the surrogate means and sigmas.
+
+        'ehvi' is the Monte Carlo expected hypervolume improvement over the observed Pareto front
+        (exact improvement per sample for two objectives, volume sampling for more).
+        'parego' scores the optimistic (UCB) values with augmented Chebyshev scalarisations
+        for a set of random weight vectors and keeps the best one per candidate.
+
+        Args:
+            Y_observed (np.ndarray): Observed objective values of shape (n_samples, n_objectives).
+            tasks (list): 'min' or 'max' for each objective.
+            method (str): 'ehvi' or 'parego'.
+            kappa (float): Exploration parameter for ParEGO's optimistic values.
+            n_samples (int): Posterior samples per candidate for EHVI.
+            n_weights (int): Number of ParEGO weight vectors.
+            n_volume_samples (int): Uniform points used to estimate volumes for more than two objectives.
+            rho (float): Weight of the augmentation term of the Chebyshev scalarisation.
+            ref_point (np.ndarray): Reference point in the original units. Default None, 10% below
+                the worst observed value of each objective.
+            seed (int): Random seed.
+        """
+        if method not in self.methods:
+            raise ValueError(f"'{method}' is not a supported multi-objective acquisition function")
+        self.method = method
+        self.kappa = kappa
+        self.rho = rho
+        self.signs = task_signs(tasks)
+        rng = np.random.default_rng(seed)
+
+        # Work in a space where every objective is maximized
+        Y = np.asarray(Y_observed, dtype=float) * self.signs
+        self.lower = Y.min(axis=0)
+        self.upper = Y.max(axis=0)
+        span = np.where(self.upper > self.lower, self.upper - self.lower, 1.0)
+        self.span = span
+        if ref_point is None:
+            self.ref_point = self.lower - 0.1 * span
+        else:
+            self.ref_point = np.asarray(ref_point, dtype=float) * self.signs
+        self.front = Y[non_dominated_mask(Y)]
+
+        n_obj = Y.shape[1]
+        # Common random numbers, so scores are comparable between chunks
+        self.z = rng.standard_normal((n_samples, n_obj))
+        self.weights = rng.dirichlet(np.ones(n_obj), n_weights)
+        if method == 'ehvi' and n_obj > 2:
+            self.box_upper = self.upper + 0.5 * span
+            volume_points = rng.uniform(self.ref_point, self.box_upper, (n_volume_samples, n_obj))
+            dominated = np.zeros(n_volume_samples, dtype=bool)
+            for p in self.front:
+                dominated |= (volume_points <= p).all(axis=1)
+            # Only points outside the region dominated by the front can add to the hypervolume
+            self.volume_points = volume_points[~dominated]
+            self.point_volume = np.prod(self.box_upper - self.ref_point) / n_volume_samples
+
+    def _hypervolume_improvement(self, points, block_size=256):
+        if points.shape[1] == 2:
+            return hypervolume_improvement_2d(points, self.front, self.ref_point)
+        points = np.minimum(points, self.box_upper)
+        hvi = np.zeros(len(points))
+        for i in range(0, len(points), block_size):
+            block = points[i:i + block_size]
+            # Points dominated by the front cannot improve it, only count volume for the rest
+            dominated = (block[:, None, :] <= self.front[None, :, :]).all(axis=2).any(axis=1)
+            idx = np.flatnonzero(~dominated)
+            if len(idx):
+                inside = (self.volume_points[None, :, :] <= block[idx, None, :]).all(axis=2)
+                hvi[i + idx] = inside.sum(axis=1) * self.point_volume
+        return hvi
+
+    def score(self, mean, sigma):
+        """
+        Joint acquisition scores, higher is better.
+
+        Args:
+            mean (np.ndarray): Predicted means of shape (n_candidates, n_objectives).
+            sigma (np.ndarray): Predicted sigmas of shape (n_candidates, n_objectives).
+
+        Returns:
+            np.ndarray: Scores of shape (n_candidates,).
+        """
+        mean = mean * self.signs
+        if self.method == 'parego':
+            f = (mean + self.kappa * sigma - self.lower) / self.span
+            weighted = f[:, None, :] * self.weights[None, :, :]
+            scalarised = weighted.min(axis=2) + self.rho * weighted.sum(axis=2)
+            return scalarised.max(axis=1)
+
+        samples = mean[None, :, :] + sigma[None, :, :] * self.z[:, None, :]
+        hvi = self._hypervolume_improvement(samples.reshape(-1, mean.shape[1]))
+        return hvi.reshape(len(self.z), len(mean)).mean(axis=0)
@@ -0,0 +1,150 @@
+import copy
+import numpy as np
+import pandas as pd
+from surrogates import MultiObjectiveSurrogate
+from batch_scoring import score_candidates
+from acquisition import MultiObjectiveAcquisition
+from batch_selection import select_batch
+from mutant_search import random_mutants
+
+
+class AsyncProposer:
+    def __init__(self, names, seqs, Y, tasks, embedding_cache, x_type, model_type='ridge', acq_fn='ucb',
+                 mo_acq_fn=None, k_folds=5, n_candidates=10000, refit_every=1, full_refit_every=None,
+                 batch_selection='penalty', length_scale=3.0, seed=None):
+        """
+        Proposes binders one small batch at a time while earlier batches are still being folded.
+
+        Candidates that were proposed but have no fold result yet are pending. Before proposing,
+        every pending candidate is added to the surrogate at its predicted mean
+        ('kriging believer' fantasies): the predicted value does not change, but the uncertainty
+        near pending candidates shrinks, so the next batch explores elsewhere instead of
+        proposing the same region again. Fold results replace the fantasies as they arrive.
+        Neither is trained from scratch: fold results are added to the surrogate with update(),
+        the fantasies to a copy of it.
+
+        Args:
+            names (list): Names of the folded binders.
+            seqs (list): Sequences of the folded binders.
+            Y (np.ndarray): Objective values of shape (n_binders, n_objectives), rows with NaN are left out.
+            tasks (list): 'min' or 'max' for each objective.
+            embedding_cache (EmbeddingCache): Cache used to embed binders and candidates.
+            x_type (str): Representation type.
+            model_type (str): Surrogate type, see MultiObjectiveSurrogate.
+            acq_fn (str): 'ucb', 'ei' or 'greedy', the first objective's score ranks the candidates.
+            mo_acq_fn (str): 'ehvi' or 'parego' to rank by a joint acquisition instead. Default None.
+            k_folds (int): Number of cross-validation folds.
+            n_candidates (int): Number of random single mutants scored per proposal.
+            refit_every (int): Number of new fold results after which they are added to the surrogate.
+            full_refit_every (int): Number of updates after which the surrogate is trained from scratch
+                with cross-validation, see MultiObjectiveSurrogate. Default None, never.
+            batch_selection (str): 'penalty' or 'dpp' to penalise near-identical candidates, None for the plain top.
+            length_scale (float): Number of mutations over which the redundancy penalty decays.
+            seed (int): Random seed of the mutant sampling. Default None.
+        """
+        self.tasks = list(tasks)
+        self.embedding_cache = embedding_cache
+        self.x_type = x_type
+        self.model_type = model_type
+        self.acq_fn = acq_fn
+        self.mo_acq_fn = mo_acq_fn
+        self.k_folds = k_folds
+        self.n_candidates = n_candidates
+        self.refit_every = refit_every
+        self.batch_selection = batch_selection
+        self.length_scale = length_scale
+        self.rng = np.random.default_rng(seed)
+
+        Y = np.asarray(Y, dtype=float).reshape(len(seqs), -1)
+        keep = ~np.isnan(Y).any(axis=1)
+        self.names = [name for name, k in zip(names, keep) if k]
+        self.seqs = [seq for seq, k in zip(seqs, keep) if k]
+        self.Y = Y[keep]
+        self.seen = set(seqs)
+        self.pending = {}
+        # Surrogate of the fold results, and the one with the fantasies used for proposing
+        self.model = MultiObjectiveSurrogate(model_type=model_type, k_folds=k_folds, full_refit_every=full_refit_every)
+        self.model.fit(embedding_cache.get(self.seqs, x_type), self.Y)
+        self.n_fitted = len(self.seqs)
+        self.surrogate = self.model
+        self._fitted_pending = set()
+
+    @property
+    def n_unfitted(self):
+        return len(self.seqs) - self.n_fitted
+
+    def _fit(self):
+        """Add new fold results to the surrogate, then the pending candidates at their predicted means to a copy."""
+        if self.n_unfitted:
+            self.model.update(self.embedding_cache.get(self.seqs[self.n_fitted:], self.x_type), self.Y[self.n_fitted:])
+            self.n_fitted = len(self.seqs)
+        self.surrogate = self.model
+        if self.pending:
+            X_pending = self.embedding_cache.get(list(self.pending.values()), self.x_type)
+            fantasies, _ = self.model.predict(X_pending)
+            self.surrogate = copy.deepcopy(self.model)
+            self.surrogate.full_refit_every = None
+            self.surrogate.update(X_pending, fantasies)
+            # y_best and the joint acquisition only count real fold results
+            self.surrogate.Y_train = self.Y
+        self._fitted_pending = set(self.pending)
+
+    def observe(self, names, seqs, Y):
+        """
+        Add fold results. Their candidates stop being pending, they are added to the surrogate
+        once refit_every results arrived.
+
+        Args:
+            names (list): Candidate names.
+            seqs (list): Candidate sequences.
+            Y (np.ndarray): Objective values of shape (n, n_objectives), rows with NaN only end the pending state.
+        """
+        Y = np.asarray(Y, dtype=float).reshape(len(seqs), -1)
+        for name, seq, y in zip(names, seqs, Y):
+            self.pending.pop(name, None)
+            self.seen.add(seq)
+            if not np.isnan(y).any():
+                self.names.append(name)
+                self.seqs.append(seq)
+                self.Y = np.vstack([self.Y, y])
+        if self.n_unfitted >= self.refit_every:
+            self._fit()
+
+    def discard(self, names):
+        """Stop treating candidates as pending, e.g. after their fold failed."""
+        for name in names:
+            self.pending.pop(name, None)
+
+    def propose(self, n):
+        """
+        Pick the next n candidates, they are pending until observed or discarded.
+
+        Returns:
+            pd.DataFrame: name and sequence of the candidates, with the scores of score_candidates.
+        """
+        # Candidates proposed since the last fit have to be added as fantasies
+        if set(self.pending) != self._fitted_pending:
+            self._fit()
+        candidates = random_mutants(self.names, self.seqs, max_eval=self.n_candidates,
+                                    seed=int(self.rng.integers(2 ** 31)))
+        candidates = candidates[~candidates['sequence'].isin(self.seen | set(self.pending.values()))]
+        candidates = candidates.drop_duplicates(subset='sequence').reset_index(drop=True)
+        if len(candidates) == 0:
+            return candidates
+
+        y_cols = [f'objective_{j}' for j in range(self.Y.shape[1])]
+        mo_acquisition = None
+        if self.mo_acq_fn is not None:
+            mo_acquisition = MultiObjectiveAcquisition(self.Y, self.tasks, method=self.mo_acq_fn)
+        candidates = candidates.assign(**score_candidates(candidates['sequence'], self.surrogate, y_cols, self.tasks,
+                                                          self.embedding_cache, self.x_type, acq_fn=self.acq_fn,
+                                                          store=False, mo_acquisition=mo_acquisition))
+        scores = candidates['acq_score_moo' if mo_acquisition is not None else 'acq_score'].to_numpy()
+        if self.batch_selection is not None:
+            selected = select_batch(candidates['sequence'], scores, n, method=self.batch_selection,
+                                    length_scale=self.length_scale)
+        else:
+            selected = np.argsort(-scores, kind='stable')[:n]
+        batch = candidates.iloc[selected].reset_index(drop=True)
+        self.pending.update(zip(batch['name'], batch['sequence']))
+        return batch
@@ -0,0 +1,108 @@
+import numpy as np
+from acquisition import acquisition_scores
+
+
+class ProteusSurrogates:
+    def __init__(self, models):
+        """
+        Wrap trained ProteusAI models so they can be run on a shared feature matrix,
+        with the same predict() interface as MultiObjectiveSurrogate.
+
+        Args:
+            models (list): Trained pai.Model objects, one per objective column.
+        """
+        self.models = models
+
+    def _predict_model(self, model, X):
+        # Padded encodings (ohe/blosum) are cached at full padding length, ProteusAI pads
+        # to the longest library sequence, which is the leading part of the flattened matrix
+        if model.model_type == 'gp':
+            import torch
+            from proteusAI.ml_tools.torch_tools import predict_gp
+            n_features = model._model.train_inputs[0].shape[1]
+            model.likelihood.eval()
+            x = torch.tensor(X[:, :n_features], dtype=torch.float32, device=model.device)
+            y_pred, sigma_pred = predict_gp(model._model, model.likelihood, x)
+            return y_pred.cpu().numpy(), sigma_pred.cpu().numpy()
+        elif isinstance(model._model, list):
+            n_features = model._model[0].n_features_in_
+            ys = np.stack([m.predict(X[:, :n_features]) for m in model._model])
+            return ys.mean(axis=0), ys.std(axis=0)
+        else:
+            n_features = model._model.n_features_in_
+            y_pred = model._model.predict(X[:, :n_features])
+            return y_pred, np.zeros_like(y_pred)
+
+    def predict(self, X, batch_size=10000):
+        """Predict all objectives, returns means and sigmas of shape (n_samples, n_objectives)."""
+        preds = [self._predict_model(model, X) for model in self.models]
+        return np.column_stack([mean for mean, _ in preds]), np.column_stack([sigma for _, sigma in preds])
+
+    def y_best(self, tasks):
+        """Best observed value of every objective, in the direction given by tasks ('min' or 'max')."""
+        ys = [np.array([protein.y for protein in model.library.proteins], dtype=float) for model in self.models]
+        return np.array([y.max() if task == 'max' else y.min() for y, task in zip(ys, tasks)])
+
+
+def score_candidates(seqs, surrogate, y_cols, tasks, embedding_cache, x_type, acq_fn='ucb',
+                     chunk_size=10000, store=False, first_as_search=True, mo_acquisition=None):
+    """
+    Score a candidate set for all objectives in fixed-size chunks.
+
+    Every candidate is embedded once per chunk, all objective models run on that shared
+    matrix and the results are written into preallocated columns, so no per-row Python
+    objects are created.
+
+    Args:
+        seqs (list): Candidate sequences.
+        surrogate: Object with predict(X) -> (mean, sigma) and y_best(tasks), e.g.
+            MultiObjectiveSurrogate, PerObjectiveSurrogates or ProteusSurrogates.
+        y_cols (list): Objective column names, in the order of the surrogate outputs.
+        tasks (list): 'min' or 'max' for each objective.
+        embedding_cache (EmbeddingCache): Cache used to embed the candidates.
+        x_type (str): Representation type.
+        acq_fn (str): 'ucb', 'ei' or 'greedy'.
+        chunk_size (int): Number of candidates embedded and scored at once.
+        store (bool): Save candidate embeddings in the cache for later iterations. Default False, most
+            candidates are never seen again and every stored chunk adds a shard and rewrites the index.
+        first_as_search (bool): Name the first objective's columns 'y_predicted', 'y_sigma'
+            and 'acq_score' like ProteusAI's search output.
+        mo_acquisition (MultiObjectiveAcquisition): Joint acquisition over all objectives, written
+            to an 'acq_score_moo' column. Default None.
+
+    Returns:
+        dict: Column name -> np.ndarray, ready for DataFrame.assign(). Acquisition scores of 'min'
+            objectives are computed on the negated values (see acquisition_scores), so higher is
+            always better, unlike the acq_Score columns of ProteusAI's model.predict.
+    """
+    seqs = list(seqs)
+    n, m = len(seqs), len(y_cols)
+    y_pred = np.empty((n, m))
+    y_sigma = np.empty((n, m))
+    acq_score = np.empty((n, m))
+    acq_score_moo = np.empty(n) if mo_acquisition is not None else None
+    y_best = surrogate.y_best(tasks)
+
+    for i in range(0, n, chunk_size):
+        X = embedding_cache.get(seqs[i:i + chunk_size], x_type, store=store)
+        mean, sigma = surrogate.predict(X)
+        y_pred[i:i + len(X)] = mean
+        y_sigma[i:i + len(X)] = sigma
+        acq_score[i:i + len(X)] = acquisition_scores(mean, sigma, tasks, y_best, acq_fn=acq_fn)
+        if mo_acquisition is not None:
+            acq_score_moo[i:i + len(X)] = mo_acquisition.score(mean, sigma)
+        print(f"Scored {min(i + chunk_size, n)}/{n} candidates.")
+
+    columns = {}
+    for j, y_col in enumerate(y_cols):
+        if j == 0 and first_as_search:
+            columns['y_predicted'] = y_pred[:, j]
+            columns['y_sigma'] = y_sigma[:, j]
+            columns['acq_score'] = acq_score[:, j]
+        else:
+            columns[f'predicted_{y_col}'] = y_pred[:, j]
+            columns[f'uncertainty_{y_col}'] = y_sigma[:, j]
+            columns[f'acq_Score_{y_col}'] = acq_score[:, j]
+    if mo_acquisition is not None:
+        columns['acq_score_moo'] = acq_score_moo
+    return columns
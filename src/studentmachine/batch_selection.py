@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def encode_sequences(seqs):
+    """
+    Encode sequences as a uint8 matrix padded with zeros, for vectorised Hamming distances.
+
+    Returns:
+        tuple: Encoded matrix of shape (n_seqs, max_len) and the sequence lengths.
+    """
+    lengths = np.array([len(seq) for seq in seqs])
+    encoded = np.zeros((len(seqs), lengths.max() if len(seqs) else 0), dtype=np.uint8)
+    for i, seq in enumerate(seqs):
+        encoded[i, :len(seq)] = np.frombuffer(seq.encode(), dtype=np.uint8)
+    return encoded, lengths
+
+
+def hamming_to(encoded, i):
+    """Hamming distances from sequence i to all sequences, padded positions count as mismatches."""
+    return (encoded != encoded[i]).sum(axis=1)
+
+
+def normalise_scores(scores):
+    """Scale scores to [0, 1], so they can be multiplied with penalties."""
+    scores = np.asarray(scores, dtype=float)
+    span = scores.max() - scores.min()
+    if span == 0:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / span
+
+
+def select_batch(seqs, scores, q, method='penalty', length_scale=3.0):
+    """
+    Greedily select a batch of q candidates with high scores that are not near-identical.
+
+    'penalty' is local penalisation in sequence space: after each pick, the score of every
+    candidate is multiplied by 1 - exp(-(d / length_scale)^2), with d its Hamming distance to
+    the closest picked sequence, so close mutants of an already picked one drop out.
+    'dpp' greedily maximises the determinant of the quality-weighted similarity kernel
+    K_ij = s_i * exp(-d_ij / length_scale) * s_j with incremental Cholesky updates.
+
+    Both need only the distances from each picked sequence to all candidates, so the cost
+    is O(q * n * L) and the full n x n distance matrix is never built.
+
+    Args:
+        seqs (list): Candidate sequences.
+        scores (np.ndarray): Acquisition score of every candidate, higher is better.
+        q (int): Batch size.
+        method (str): 'penalty' or 'dpp'.
+        length_scale (float): Number of mutations over which the redundancy penalty decays.
+
+    Returns:
+        np.ndarray: Indices of the selected candidates, in the order they were picked.
+    """
+    if method not in ['penalty', 'dpp']:
+        raise ValueError(f"'{method}' is not a supported batch selection method")
+    seqs = list(seqs)
+    q = min(q, len(seqs))
+    encoded, _ = encode_sequences(seqs)
+    quality = normalise_scores(scores)
+    selected = []
+
+    if method == 'penalty':
+        penalised = quality.copy()
+        available = np.ones(len(seqs), dtype=bool)
+        for _ in range(q):
+            # Duplicates of a picked sequence are penalised to 0, they may still fill up the batch
+            i = int(np.argmax(np.where(available, penalised, -np.inf)))
+            selected.append(i)
+            available[i] = False
+            d = hamming_to(encoded, i)
+            penalised *= 1 - np.exp(-(d / length_scale) ** 2)
+        return np.array(selected)
+
+    # Small floor, so the lowest scoring candidates can still be picked for diversity
+    quality = quality + 1e-3
+    gains = quality ** 2
+    factors = np.zeros((q, len(seqs)))
+    for k in range(q):
+        i = int(np.argmax(gains))
+        if gains[i] <= 1e-10:
+            break
+        selected.append(i)
+        kernel_row = quality[i] * np.exp(-hamming_to(encoded, i) / length_scale) * quality
+        factors[k] = (kernel_row - factors[:k, i] @ factors[:k]) / np.sqrt(gains[i])
+        gains = gains - factors[k] ** 2
+        gains[selected] = -np.inf
+    return np.array(selected)
@@ -0,0 +1,117 @@
+import fnmatch
+import os
+import pandas as pd
+
+# Columns every table is partitioned by, a folder level each (iteration=<k>/target=<name>/)
+partition_cols = ['iteration', 'target']
+
+# Target of tables that hold all targets side by side, like the master dataset
+all_targets = 'all'
+
+
+class DatasetStore:
+    def __init__(self, root='data/store'):
+        """
+        Columnar store of the binders, mutants, predictions and fold results of every iteration.
+
+        Every table is a Parquet dataset in its own folder, partitioned by iteration and target, so
+        a read only opens the partitions that pass its filters and only decodes the requested
+        columns. Rows written under the same name into the same partition replace the earlier
+        ones, so a rerun of a step does not duplicate its results.
+
+        Args:
+            root (str): Folder of the store, one sub-folder per table.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, table):
+        return os.path.join(self.root, table)
+
+    def tables(self):
+        """Names of the tables in the store."""
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(self.path(name)))
+
+    def write(self, table, df, iteration, target=all_targets, name=None):
+        """
+        Write the rows of one iteration and target to a table.
+
+        Args:
+            table (str): Table name, e.g. 'binders', 'mutants', 'predictions' or 'folds'.
+            df (pd.DataFrame): Rows to store, without the partition columns.
+            iteration (int): Design iteration.
+            target (str): Target name. Default 'all', for tables with one column per target.
+            name (str): File name inside the partition, rows written before under the same name
+                are replaced. Default None, the table name.
+        """
+        df.assign(iteration=int(iteration), target=str(target)).to_parquet(
+            self.path(table), partition_cols=partition_cols, index=False,
+            basename_template=f"{name or table}-{{i}}.parquet", existing_data_behavior='overwrite_or_ignore'
+        )
+
+    def _dataset(self, table):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(self.path(table), format='parquet', partitioning='hive')
+        # Later iterations may add columns (e.g. a new target), the schema of the first file misses them
+        schemas = [dataset.schema] + [fragment.physical_schema for fragment in dataset.get_fragments()]
+        schema = pa.unify_schemas(schemas, promote_options='permissive')
+        return ds.dataset(self.path(table), format='parquet', partitioning='hive', schema=schema)
+
+    def columns(self, table):
+        """Column names of a table, read from the file footers only."""
+        if not os.path.isdir(self.path(table)):
+            return []
+        return self._dataset(table).schema.names
+
+    def read(self, table, columns=None, iteration=None, max_iteration=None, targets=None):
+        """
+        Read a table, only the matching partitions and columns are loaded.
+
+        Args:
+            table (str): Table name.
+            columns (list): Column names or patterns like 'pae_*'. Default None, all columns.
+            iteration (int): Only this iteration. Default None.
+            max_iteration (int): Only iterations up to and including this one. Default None.
+            targets (list): Only these targets. Default None.
+
+        Returns:
+            pd.DataFrame: The rows, with iteration and target columns when columns is None.
+        """
+        import pyarrow.dataset as ds
+        if not os.path.isdir(self.path(table)):
+            return pd.DataFrame(columns=columns if columns is not None and not _has_patterns(columns) else None)
+        dataset = self._dataset(table)
+
+        if columns is not None:
+            names = dataset.schema.names
+            columns = [name for name in names if any(fnmatch.fnmatchcase(name, pattern) for pattern in columns)] \
+                if _has_patterns(columns) else list(columns)
+            # Keep the requested order for plain names, patterns follow the order of the table
+            columns = list(dict.fromkeys(columns))
+
+        expression = None
+        for condition in [ds.field('iteration') == int(iteration) if iteration is not None else None,
+                          ds.field('iteration') <= int(max_iteration) if max_iteration is not None else None,
+                          ds.field('target').isin(list(targets)) if targets is not None else None]:
+            if condition is not None:
+                expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def import_csv(self, table, csv_path, iteration, target=all_targets):
+        """Copy a CSV file of an earlier run into a table, stored under the file's name."""
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        df = pd.read_csv(csv_path)
+        self.write(table, df, iteration, target=target, name=name)
+        return df
+
+
+def _has_patterns(columns):
+    return any(any(character in column for character in '*?[') for column in columns)
+
+
+# Example usage
+if __name__ == "__main__":
+    store = DatasetStore('data/store')
+    store.import_csv('binders', 'data/25_NLFR_esm2_ridge_ucb_1.csv', iteration=1)
+    print(store.read('binders', columns=['name', 'binder_seq', 'pae_*'], max_iteration=1).head())
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    # File locks, so processes sharing a cache folder do not overwrite each other's shards and index
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Representations the cache knows how to compute
+esm_models = {'esm2': 'esm2_t33_650M_UR50D', 'esm1v': 'esm1v_t33_650M_UR90S_1'}
+in_memory_reps = ['ohe', 'blosum62', 'blosum50']
+
+
+def sequence_hash(seq):
+    """Content address of a sequence, used as the key in the embedding cache."""
+    return hashlib.sha1(seq.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir='data/embedding_cache', max_len=150, batch_size=10, device=None):
+        """
+        Initialize an on-disk embedding store shared by every model in a run.
+
+        Embeddings are keyed by the sha1 hash of the sequence and stored per representation
+        as append-only .npy shards which are opened memory-mapped, so later iterations only
+        compute sequences that have never been seen before. Shards and the index are written
+        under a file lock, so several processes can share one cache folder.
+
+        Args:
+            cache_dir (str): Directory holding one sub-folder per representation.
+            max_len (int): Padding length used for 'ohe' and 'blosum' encodings (binders are 100-150 aa).
+            batch_size (int): Number of sequences passed through ESM at once.
+            device (str): Device for ESM ('cpu' or 'cuda'). Default None for autoselection.
+        """
+        self.cache_dir = cache_dir
+        self.max_len = max_len
+        self.batch_size = batch_size
+        self.device = device
+        self._index = {}
+        self._shards = {}
+        self._esm = {}
+        self._exported = set()
+
+    def _rep_dir(self, rep):
+        # Padded encodings depend on the padding length, so keep them apart
+        if rep in in_memory_reps:
+            rep = f"{rep}_{self.max_len}"
+        return os.path.join(self.cache_dir, rep)
+
+    @contextmanager
+    def _locked(self, rep):
+        """Hold the write lock of a representation folder, shared by all processes using the cache."""
+        os.makedirs(self._rep_dir(rep), exist_ok=True)
+        with open(os.path.join(self._rep_dir(rep), 'index.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self, rep, reload=False):
+        """Load the hash -> (shard, row) index of a representation, from disk again with reload set."""
+        if reload or rep not in self._index:
+            index_file = os.path.join(self._rep_dir(rep), 'index.json')
+            if os.path.exists(index_file):
+                with open(index_file, 'r') as file:
+                    self._index[rep] = {key: tuple(value) for key, value in json.load(file).items()}
+            else:
+                self._index[rep] = {}
+        return self._index[rep]
+
+    def _save_index(self, rep):
+        index_file = os.path.join(self._rep_dir(rep), 'index.json')
+        # Write to a temporary file first so a killed job never leaves a broken index
+        tmp_file = index_file + f'.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as file:
+            json.dump(self._index[rep], file)
+        os.replace(tmp_file, index_file)
+
+    def _shard(self, rep, shard_id):
+        """Open a shard memory-mapped, reusing already opened shards."""
+        key = (rep, shard_id)
+        if key not in self._shards:
+            shard_file = os.path.join(self._rep_dir(rep), f"shard_{shard_id:05d}.npy")
+            self._shards[key] = np.load(shard_file, mmap_mode='r')
+        return self._shards[key]
+
+    def _compute_esm(self, seqs, rep):
+        """Mean-pooled last layer ESM embeddings (same pooling as ProteusAI)."""
+        import esm
+        import torch
+
+        if rep not in self._esm:
+            model, alphabet = getattr(esm.pretrained, esm_models[rep])()
+            device = self.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+            model.eval()
+            model.to(device)
+            self._esm[rep] = (model, alphabet, device)
+        model, alphabet, device = self._esm[rep]
+        batch_converter = alphabet.get_batch_converter()
+        layer = model.num_layers
+
+        embeddings = []
+        for i in range(0, len(seqs), self.batch_size):
+            batch = [(str(j), seq) for j, seq in enumerate(seqs[i:i + self.batch_size])]
+            _, _, batch_tokens = batch_converter(batch)
+            batch_lens = (batch_tokens != alphabet.padding_idx).sum(1)
+            with torch.no_grad():
+                results = model(batch_tokens.to(device), repr_layers=[layer])
+            tokens = results['representations'][layer]
+            for j, tokens_len in enumerate(batch_lens):
+                embeddings.append(tokens[j, 1:tokens_len - 1].mean(0).cpu().numpy())
+        return np.stack(embeddings).astype(np.float32)
+
+    def _compute(self, seqs, rep):
+        """Compute embeddings for sequences that are not in the cache yet."""
+        if rep in esm_models:
+            return self._compute_esm(seqs, rep)
+        elif rep in in_memory_reps:
+            from proteusAI.ml_tools.torch_tools import torch_tools
+            if rep == 'ohe':
+                reps = torch_tools.one_hot_encoder(seqs, padding=self.max_len)
+            else:
+                reps = torch_tools.blosum_encoding(seqs, matrix=rep.upper(), padding=self.max_len)
+            return reps.reshape(len(seqs), -1).numpy().astype(np.float32)
+        else:
+            raise ValueError(f"'{rep}' is not a supported representation")
+
+    def add(self, seqs, rep):
+        """
+        Compute and store embeddings for all sequences that have never been seen.
+
+        Args:
+            seqs (list): Amino acid sequences.
+            rep (str): Representation type ('esm2', 'esm1v', 'blosum62', 'blosum50' or 'ohe').
+
+        Returns:
+            int: Number of newly computed sequences.
+        """
+        index = self._load_index(rep)
+        missing = {}
+        for seq in seqs:
+            key = sequence_hash(seq)
+            if key not in index and key not in missing:
+                missing[key] = seq
+        if not missing:
+            return 0
+        # Computed outside the lock, only the writes are serialised
+        embeddings = self._compute(list(missing.values()), rep)
+
+        rep_dir = self._rep_dir(rep)
+        with self._locked(rep):
+            # Other processes may have added shards and sequences since the index was read
+            index = self._load_index(rep, reload=True)
+            new = [row for row, key in enumerate(missing) if key not in index]
+            if not new:
+                return 0
+            shard_id = max((shard for shard, _ in index.values()), default=-1) + 1
+            # A shard left behind by a job killed before its index update is not overwritten
+            while os.path.exists(os.path.join(rep_dir, f"shard_{shard_id:05d}.npy")):
+                shard_id += 1
+
+            # Save the new shard before the index points into it
+            shard_file = os.path.join(rep_dir, f"shard_{shard_id:05d}.npy")
+            tmp_file = shard_file + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_file, embeddings[new])
+            os.replace(tmp_file, shard_file)
+            keys = list(missing)
+            for shard_row, row in enumerate(new):
+                index[keys[row]] = (shard_id, shard_row)
+            self._save_index(rep)
+        print(f"Computed {len(new)} new '{rep}' embeddings ({len(index)} cached).")
+        return len(new)
+
+    def get(self, seqs, rep, store=True):
+        """
+        Return the embedding matrix for a list of sequences, computing only unseen sequences.
+
+        Args:
+            seqs (list): Amino acid sequences.
+            rep (str): Representation type.
+            store (bool): Save newly computed embeddings in the cache. Use False for large
+                one-off candidate sets, e.g. padded encodings of exhaustive mutant scans.
+
+        Returns:
+            np.ndarray: Array of shape (len(seqs), embedding_dim) in the order of seqs.
+        """
+        seqs = list(seqs)
+        if store:
+            self.add(seqs, rep)
+        index = self._load_index(rep)
+        keys = [sequence_hash(seq) for seq in seqs]
+        cached = np.array([key in index for key in keys], dtype=bool)
+        locations = np.array([index[key] for key in keys if key in index], dtype=np.int64).reshape(-1, 2)
+
+        out = None
+        if not cached.all():
+            new = self._compute([seq for seq, hit in zip(seqs, cached) if not hit], rep)
+            out = np.empty((len(seqs), new.shape[1]), dtype=np.float32)
+            out[~cached] = new
+
+        # Gather rows shard by shard instead of row by row
+        rows = np.flatnonzero(cached)
+        for shard_id in np.unique(locations[:, 0]):
+            shard = self._shard(rep, int(shard_id))
+            if out is None:
+                out = np.empty((len(seqs), shard.shape[1]), dtype=np.float32)
+            mask = locations[:, 0] == shard_id
+            out[rows[mask]] = shard[locations[mask, 1]]
+        if out is None:
+            out = np.empty((0, 0), dtype=np.float32)
+        return out
+
+    def export(self, lib, rep):
+        """
+        Write cached embeddings into the representation folder of a ProteusAI Library,
+        so that lib.compute() finds every protein on disk and computes nothing.
+
+        Args:
+            lib (pai.Library): Library whose proteins should be served from the cache.
+            rep (str): Representation type ('esm2' or 'esm1v').
+        """
+        import torch
+
+        dest = os.path.join(lib.rep_path, rep)
+        os.makedirs(dest, exist_ok=True)
+        # Libraries built from the same source share a rep_path, only export once per run
+        if dest in self._exported:
+            return
+        X = self.get([protein.seq for protein in lib.proteins], rep)
+        # ProteusAI stores representations by protein name, so always overwrite to stay
+        # consistent with the content-addressed cache
+        for protein, x in zip(lib.proteins, X):
+            torch.save(torch.from_numpy(np.array(x)), os.path.join(dest, protein.name + '.pt'))
+        self._exported.add(dest)
+
+# Usage Example:
+# if __name__ == "__main__":
+#     cache = EmbeddingCache(cache_dir='data/embedding_cache')
+#     df = pd.read_csv('data/NLFR_master_dataset_1000.csv')
+#     X = cache.get(df['binder_seq'], 'esm2')
@@ -0,0 +1,117 @@
+import numpy as np
+from pareto import non_dominated_mask, orient
+
+
+def _hypervolume_2d(front, ref_point):
+    # Sweep in descending order of the first objective, every point adds the strip above the
+    # highest second objective seen so far
+    front = front[np.argsort(-front[:, 0])]
+    highest = np.maximum.accumulate(np.concatenate([[ref_point[1]], front[:, 1]]))
+    return float(np.sum((front[:, 0] - ref_point[0]) * np.diff(highest)))
+
+
+def _hypervolume_nd(front, ref_point):
+    if front.shape[1] == 2:
+        return _hypervolume_2d(front, ref_point)
+    # Slice along the last objective, every slab is covered by the points above it
+    front = front[np.argsort(-front[:, -1])]
+    lower = np.concatenate([front[1:, -1], [ref_point[-1]]])
+    volume = 0.0
+    for i in range(len(front)):
+        depth = front[i, -1] - lower[i]
+        if depth > 0:
+            projected = front[:i + 1, :-1]
+            projected = projected[non_dominated_mask(projected)]
+            volume += depth * _hypervolume_nd(projected, ref_point[:-1])
+    return volume
+
+
+def hypervolume(points, ref_point, directions=None):
+    """
+    Exact hypervolume dominated by a set of points and bounded by a reference point.
+
+    Two objectives use an O(n log n) sweep, more objectives slice along the last objective.
+    Points that are not better than the reference point in every objective add nothing.
+
+    Args:
+        points (np.ndarray): Objective values of shape (n_points, n_objectives).
+        ref_point (np.ndarray): Reference point of shape (n_objectives,), in the same units.
+        directions (list): 'min' or 'max' for each column. Default None, all maximized.
+
+    Returns:
+        float: Hypervolume.
+    """
+    points = orient(np.atleast_2d(points), directions)
+    ref_point = orient(np.atleast_2d(ref_point), directions)[0]
+    points = points[(points > ref_point).all(axis=1)]
+    if len(points) == 0:
+        return 0.0
+    return _hypervolume_nd(points[non_dominated_mask(points)], ref_point)
+
+
+def hypervolume_improvement_2d(points, front, ref_point):
+    """
+    Exact hypervolume improvement of every point over a 2-D front (both objectives maximized).
+
+    The dominated region of the front is a staircase; the improvement of a point is the sum over
+    the stairs of the part of its box [ref_point, point] lying above the stair.
+
+    Args:
+        points (np.ndarray): Query points of shape (n, 2).
+        front (np.ndarray): Non-dominated points of shape (k, 2).
+        ref_point (np.ndarray): Reference point of shape (2,).
+
+    Returns:
+        np.ndarray: Hypervolume improvements of shape (n,).
+    """
+    front = front[(front > ref_point).all(axis=1)]
+    front = front[np.argsort(front[:, 0])]
+    starts = np.concatenate([[ref_point[0]], front[:, 0]])
+    ends = np.concatenate([front[:, 0], [np.inf]])
+    heights = np.concatenate([front[:, 1], [ref_point[1]]])
+    widths = np.clip(np.minimum(ends[None, :], points[:, [0]]) - starts[None, :], 0, None)
+    return np.sum(widths * np.clip(points[:, [1]] - heights[None, :], 0, None), axis=1)
+
+
+class HypervolumeTracker:
+    def __init__(self, ref_point, directions=None):
+        """
+        Keep the current Pareto front and its hypervolume while batches of evaluated points arrive.
+
+        Every update only merges the new batch into the front, so a whole BO run gives its
+        hypervolume trajectory in one pass over the data.
+
+        Args:
+            ref_point (np.ndarray): Reference point in the original units.
+            directions (list): 'min' or 'max' for each column. Default None, all maximized.
+        """
+        self.directions = directions
+        self.ref_point = orient(np.atleast_2d(ref_point), directions)[0]
+        self.front = np.empty((0, len(self.ref_point)))
+        self.volume = 0.0
+        self.n_points = 0
+        self.history = []
+
+    def update(self, points):
+        """
+        Add a batch of points, e.g. one BO iteration, and return the hypervolume of everything seen so far.
+
+        Args:
+            points (np.ndarray): Objective values of shape (n_points, n_objectives), in the original units.
+
+        Returns:
+            float: Current hypervolume.
+        """
+        points = orient(np.atleast_2d(points), self.directions)
+        self.n_points += len(points)
+        # Only points better than the reference point in every objective can add volume
+        points = points[(points > self.ref_point).all(axis=1)]
+        if len(points):
+            candidates = np.concatenate([self.front, points])
+            mask = non_dominated_mask(candidates)
+            # The volume only changes if a new point made it onto the front
+            if mask[len(self.front):].any():
+                self.front = candidates[mask]
+                self.volume = _hypervolume_nd(self.front, self.ref_point)
+        self.history.append(self.volume)
+        return self.volume
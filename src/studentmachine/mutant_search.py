@@ -0,0 +1,177 @@
+import itertools
+import random
+import numpy as np
+import pandas as pd
+from batch_scoring import score_candidates
+from pareto import crowding_distance, non_dominated_mask
+
+# Canonical amino acids used for mutations
+aa_list = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def random_mutants(names, seqs, max_eval=10000, seed=None):
+    """
+    Propose random single point mutants, the same sampling ProteusAI's search uses with explore=1.0.
+
+    Args:
+        names (list): Names of the parent binders.
+        seqs (list): Sequences of the parent binders.
+        max_eval (int): Number of mutation attempts.
+        seed (int): Random seed. Default None.
+
+    Returns:
+        pd.DataFrame: Mutants with 'name' (parent+A12G) and 'sequence' columns.
+    """
+    rng = random.Random(seed)
+    parents = list(zip(names, seqs))
+    mutated_names = []
+    mutated_seqs = []
+    seen = set()
+
+    for _ in range(max_eval):
+        name, seq = rng.choice(parents)
+        pos = rng.randint(0, len(seq) - 1)
+        mut = rng.choice(aa_list)
+        mutated_name = name + f"+{seq[pos]}{pos+1}{mut}"
+
+        # Exclude mutations to the same residue and duplicates
+        if seq[pos] != mut and mutated_name not in seen:
+            seen.add(mutated_name)
+            mutated_names.append(mutated_name)
+            mutated_seqs.append(seq[:pos] + mut + seq[pos + 1:])
+
+    return pd.DataFrame({'name': mutated_names, 'sequence': mutated_seqs})
+
+
+def iter_mutants(names, seqs, max_order=1, positions=None):
+    """
+    Lazily generate every mutant with up to max_order point mutations of each parent.
+
+    Args:
+        names (list): Names of the parent binders.
+        seqs (list): Sequences of the parent binders.
+        max_order (int): Highest number of simultaneous mutations (1 single, 2 double, 3 triple).
+        positions (list): 1-based positions allowed to mutate. Default None for all positions.
+
+    Yields:
+        tuple: Mutant name (parent+A12G+L40K) and sequence.
+    """
+    for name, seq in zip(names, seqs):
+        sites = [pos - 1 for pos in positions if pos <= len(seq)] if positions else range(len(seq))
+        for order in range(1, max_order + 1):
+            for combo in itertools.combinations(sites, order):
+                choices = [[aa for aa in aa_list if aa != seq[pos]] for pos in combo]
+                for muts in itertools.product(*choices):
+                    seq_list = list(seq)
+                    mutated_name = name
+                    for pos, mut in zip(combo, muts):
+                        mutated_name += f"+{seq[pos]}{pos+1}{mut}"
+                        seq_list[pos] = mut
+                    yield mutated_name, ''.join(seq_list)
+
+
+def iter_chunks(iterable, chunk_size):
+    """Group an iterator into lists of at most chunk_size items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def prediction_columns(y_cols):
+    """Names of the predicted mean columns written by score_candidates."""
+    return ['y_predicted'] + [f'predicted_{y_col}' for y_col in y_cols[1:]]
+
+
+def streaming_search(names, seqs, surrogate, y_cols, tasks, embedding_cache, x_type, acq_fn='ucb',
+                     max_order=1, positions=None, chunk_size=10000, top_k=100, out_file=None, mo_acquisition=None,
+                     front_cols=None, max_front=None):
+    """
+    Score an exhaustive mutant scan chunk by chunk without materialising the candidate set.
+
+    Only a bounded top-K per acquisition column and the current Pareto set of predicted
+    means are kept in memory. With many objectives almost every candidate is non-dominated,
+    so the Pareto set is kept over front_cols only and cut to max_front candidates by crowding
+    distance whenever it grows beyond that: memory stays within top_k per acquisition column,
+    max_front and one chunk. After a cut the set is approximate, a later candidate dominated
+    only by a dropped one can join it. All scored candidates can be appended to a Parquet file.
+
+    Args:
+        names (list): Names of the parent binders.
+        seqs (list): Sequences of the parent binders.
+        surrogate: Trained surrogate with predict() and y_best().
+        y_cols (list): Objective column names.
+        tasks (list): 'min' or 'max' for each objective.
+        embedding_cache (EmbeddingCache): Cache used to embed the candidates.
+        x_type (str): Representation type.
+        acq_fn (str): 'ucb', 'ei' or 'greedy'.
+        max_order (int): Highest number of simultaneous mutations.
+        positions (list): 1-based positions allowed to mutate. Default None for all.
+        chunk_size (int): Number of candidates scored at once.
+        top_k (int): Number of candidates kept per acquisition column.
+        out_file (str): Parquet file all scored candidates are appended to. Default None.
+        mo_acquisition (MultiObjectiveAcquisition): Joint acquisition over all objectives. Default None.
+        front_cols (list): Objective columns of y_cols the Pareto set is computed over, e.g. the ones
+            the batch is selected on. Default None, all of them.
+        max_front (int): Largest Pareto set kept, the most crowded candidates are dropped beyond it
+            (the best candidate of every objective is always kept). Default None, top_k per front column.
+
+    Returns:
+        tuple: Dict of acquisition column -> top-K DataFrame, and the Pareto set DataFrame.
+    """
+    pred_cols = prediction_columns(y_cols)
+    front_index = [y_cols.index(col) for col in (front_cols if front_cols is not None else y_cols)]
+    front_pred_cols = [pred_cols[j] for j in front_index]
+    front_tasks = [tasks[j] for j in front_index]
+    if max_front is None:
+        max_front = top_k * len(front_index)
+    top = {}
+    front = None
+    writer = None
+    n_scored = 0
+
+    try:
+        for chunk in iter_chunks(iter_mutants(names, seqs, max_order=max_order, positions=positions), chunk_size):
+            chunk_names, chunk_seqs = zip(*chunk)
+            columns = score_candidates(chunk_seqs, surrogate, y_cols, tasks, embedding_cache, x_type,
+                                       acq_fn=acq_fn, chunk_size=chunk_size, store=False,
+                                       mo_acquisition=mo_acquisition)
+            chunk_df = pd.DataFrame({'name': chunk_names, 'sequence': chunk_seqs, **columns})
+
+            # Append to the columnar results file
+            if out_file is not None:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_file, table.schema)
+                writer.write_table(table)
+
+            # Keep the best candidates of every acquisition column
+            for acq_col in [col for col in chunk_df.columns if col.startswith('acq_')]:
+                candidates = chunk_df if acq_col not in top else pd.concat([top[acq_col], chunk_df], ignore_index=True)
+                top[acq_col] = candidates.nlargest(top_k, acq_col).reset_index(drop=True)
+
+            # Merge the chunk into the current Pareto set
+            candidates = chunk_df if front is None else pd.concat([front, chunk_df], ignore_index=True)
+            front = candidates[non_dominated_mask(candidates[front_pred_cols].to_numpy(), directions=front_tasks)]
+            if len(front) > max_front:
+                # Keep the least crowded candidates, the extremes of every objective have infinite distance
+                distance = crowding_distance(front[front_pred_cols].to_numpy(), np.zeros(len(front), dtype=int),
+                                             directions=front_tasks)
+                front = front.iloc[np.sort(np.argsort(-distance, kind='stable')[:max_front])]
+            front = front.reset_index(drop=True)
+
+            n_scored += len(chunk_df)
+            print(f"Scored {n_scored} mutants, {len(front)} on the Pareto front.")
+    finally:
+        # A failed chunk still leaves a readable file of the chunks before it
+        if writer is not None:
+            writer.close()
+
+    if front is None:
+        # No candidates, e.g. all positions filtered out
+        front = pd.DataFrame(columns=['name', 'sequence', *pred_cols])
+    return top, front
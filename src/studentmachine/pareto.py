@@ -0,0 +1,204 @@
+import bisect
+import numpy as np
+
+
+def orient(objectives, directions=None):
+    """
+    Flip the sign of the objectives to minimize, so every column is maximized.
+
+    Args:
+        objectives (np.ndarray): Objective matrix of shape (n_samples, n_objectives).
+        directions (list): 'min' or 'max' for each column. Default None, all maximized.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    if directions is None:
+        return objectives
+    return objectives * np.array([-1.0 if direction == 'min' else 1.0 for direction in directions])
+
+
+def _non_dominated_2d(objectives):
+    # Sweep in descending lexicographic order, a point is dominated if an earlier point that is
+    # not identical to it reaches at least its second objective
+    order = np.lexsort((-objectives[:, 1], -objectives[:, 0]))
+    f = objectives[order]
+    new_group = np.ones(len(f), dtype=bool)
+    new_group[1:] = (f[1:] != f[:-1]).any(axis=1)
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(f)), 0))
+    prefix_max = np.concatenate([[-np.inf], np.maximum.accumulate(f[:, 1])])
+    mask = np.empty(len(f), dtype=bool)
+    mask[order] = prefix_max[group_start] < f[:, 1]
+    return mask
+
+
+def _non_dominated_sfs(objectives, block_size):
+    # Sort-filter on the unique rows: a point can only be dominated by a point sorted before it
+    # (larger sum, ties broken lexicographically), so each block is checked against the front
+    # found so far and against itself
+    unique, inverse = np.unique(objectives, axis=0, return_inverse=True)
+    n_obj = unique.shape[1]
+    keys = [-unique[:, j] for j in reversed(range(n_obj))] + [-unique.sum(axis=1)]
+    order = np.lexsort(keys)
+    f = unique[order]
+    mask = np.zeros(len(f), dtype=bool)
+    front = np.empty((0, n_obj))
+    for i in range(0, len(f), block_size):
+        block = f[i:i + block_size]
+        keep = ~_weakly_dominated_by(block, front)
+        block = block[keep]
+        within = _weakly_dominates(block, block)
+        np.fill_diagonal(within, False)
+        keep[keep] = ~within.any(axis=0)
+        mask[i:i + block_size] = keep
+        front = np.concatenate([front, f[i:i + block_size][keep]])
+    unique_mask = np.empty(len(f), dtype=bool)
+    unique_mask[order] = mask
+    return unique_mask[inverse.ravel()]
+
+
+def _weakly_dominates(others, points):
+    # (n_others, n_points) matrix of others >= points in every objective, built one column at a time
+    geq = others[:, [0]] >= points[:, 0]
+    for j in range(1, points.shape[1]):
+        geq &= others[:, [j]] >= points[:, j]
+    return geq
+
+
+def _weakly_dominated_by(points, others, block_size=1024):
+    # Whether each point is reached by any of the others, which for distinct rows means dominated
+    dominated = np.zeros(len(points), dtype=bool)
+    for i in range(0, len(others), block_size):
+        dominated |= _weakly_dominates(others[i:i + block_size], points).any(axis=0)
+    return dominated
+
+
+def non_dominated_mask(objectives, directions=None, block_size=256):
+    """
+    Boolean mask of the non-dominated rows of an objective matrix.
+
+    Two objectives use an exact O(n log n) sweep. More objectives are sorted by their sum and
+    filtered block by block against the growing front, so the cost is O(n * front size) and
+    memory stays at block_size x 1024 booleans.
+
+    Args:
+        objectives (np.ndarray): Objective matrix of shape (n_samples, n_objectives).
+        directions (list): 'min' or 'max' for each column. Default None, all maximized.
+        block_size (int): Rows compared at once.
+
+    Returns:
+        np.ndarray: Boolean mask of shape (n_samples,).
+    """
+    objectives = orient(objectives, directions)
+    if len(objectives) == 0:
+        return np.zeros(0, dtype=bool)
+    if objectives.shape[1] == 1:
+        return objectives[:, 0] == objectives[:, 0].max()
+    if objectives.shape[1] == 2:
+        return _non_dominated_2d(objectives)
+    return _non_dominated_sfs(objectives, block_size)
+
+
+def _ranks_2d(objectives):
+    # One sweep in descending lexicographic order: every front is a staircase whose last point has
+    # its highest second objective, so a point joins the first front whose last point is below it
+    order = np.lexsort((-objectives[:, 1], -objectives[:, 0]))
+    f = objectives[order].tolist()
+    ranks = [0] * len(f)
+    # Negated second objective of the last point of every front, increasing with the rank
+    tails = []
+    for i, (f0, f1) in enumerate(f):
+        if i and f[i - 1] == [f0, f1]:
+            ranks[i] = ranks[i - 1]
+            continue
+        k = bisect.bisect_right(tails, -f1)
+        if k == len(tails):
+            tails.append(-f1)
+        else:
+            tails[k] = -f1
+        ranks[i] = k
+    result = np.empty(len(f), dtype=int)
+    result[order] = ranks
+    return result
+
+
+def non_dominated_ranks(objectives, directions=None, max_rank=None, block_size=256):
+    """
+    Non-dominated sorting rank of every row, 0 for the Pareto front, 1 for the front of the rest and so on.
+
+    Args:
+        objectives (np.ndarray): Objective matrix of shape (n_samples, n_objectives).
+        directions (list): 'min' or 'max' for each column. Default None, all maximized.
+        max_rank (int): Stop after this rank, the remaining rows get rank max_rank + 1. Default None.
+        block_size (int): Rows compared at once.
+
+    Returns:
+        np.ndarray: Integer ranks of shape (n_samples,).
+    """
+    objectives = orient(objectives, directions)
+    if len(objectives) and objectives.shape[1] == 2:
+        ranks = _ranks_2d(objectives)
+        return ranks if max_rank is None else np.minimum(ranks, max_rank + 1)
+    ranks = np.full(len(objectives), -1, dtype=int)
+    remaining = np.arange(len(objectives))
+    rank = 0
+    while len(remaining):
+        if max_rank is not None and rank > max_rank:
+            ranks[remaining] = rank
+            break
+        mask = non_dominated_mask(objectives[remaining], block_size=block_size)
+        ranks[remaining[mask]] = rank
+        remaining = remaining[~mask]
+        rank += 1
+    return ranks
+
+
+def crowding_distance(objectives, ranks, directions=None):
+    """
+    NSGA-II crowding distance of every row within its front, computed for all fronts at once.
+
+    The boundary points of every front get an infinite distance.
+
+    Args:
+        objectives (np.ndarray): Objective matrix of shape (n_samples, n_objectives).
+        ranks (np.ndarray): Front of every row, from non_dominated_ranks.
+        directions (list): 'min' or 'max' for each column. Default None, all maximized.
+
+    Returns:
+        np.ndarray: Crowding distances of shape (n_samples,).
+    """
+    objectives = orient(objectives, directions)
+    ranks = np.asarray(ranks)
+    distance = np.zeros(len(objectives))
+    for j in range(objectives.shape[1]):
+        order = np.lexsort((objectives[:, j], ranks))
+        f = objectives[order, j]
+        r = ranks[order]
+        is_first = np.ones(len(f), dtype=bool)
+        is_first[1:] = r[1:] != r[:-1]
+        is_last = np.ones(len(f), dtype=bool)
+        is_last[:-1] = r[1:] != r[:-1]
+
+        # Normalise by the span of the objective within each front
+        front_start = np.maximum.accumulate(np.where(is_first, np.arange(len(f)), 0))
+        front_end = np.minimum.accumulate(np.where(is_last, np.arange(len(f)), len(f))[::-1])[::-1]
+        span = f[front_end] - f[front_start]
+
+        gap = np.zeros(len(f))
+        interior = ~(is_first | is_last)
+        gap[1:-1] = f[2:] - f[:-2]
+        gap = np.where(interior, gap / np.where(span > 0, span, 1), np.inf)
+        distance[order] += gap
+    return distance
+
+
+def pareto_sort(objectives, directions=None, max_rank=None, block_size=256):
+    """
+    Non-dominated ranks and crowding distances in one call.
+
+    Sorting rows by (rank, -crowding distance) gives the NSGA-II selection order.
+
+    Returns:
+        tuple: Ranks and crowding distances, both of shape (n_samples,).
+    """
+    objectives = orient(objectives, directions)
+    ranks = non_dominated_ranks(objectives, max_rank=max_rank, block_size=block_size)
+    return ranks, crowding_distance(objectives, ranks)
@@ -1,11 +1,11 @@
 import pandas as pd
-import torch
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.cm as cm
 import matplotlib.colors as mcolors
 import matplotlib
-from botorch.utils.multi_objective.pareto import is_non_dominated
+from pareto import pareto_sort, orient
+from batch_selection import select_batch
 import os
 
 # Function to set the font of the plots
@@ -21,26 +21,14 @@ df_old = pd.read_csv('bo_results/test.csv')
 # Filter columns related to pae (all columns containing 'pae' as objectives)
 old_pAE_cols = [col for col in df_old.columns if 'y_predicted' in col or 'pae' in col and 'uncertainty' not in col and 'acq_Score' not in col]
 
-# List to hold indices of Pareto optimal points for each objective
-pareto_indices_sets = []
+# Minimize the ipAE of target A, maximize the ipAE of the off-targets
+directions = ['min'] + ['max'] * (len(old_pAE_cols) - 1)
 
-# Identify Pareto optimal points for each column, treating it as the main objective
-for i in range(len(old_pAE_cols)):
-    # Prepare objectives
-    objectives = torch.tensor(df_old[old_pAE_cols].values, dtype=torch.float32)
-    
-    objectives[:, 0] *= -1
-    
-    if i != 0:
-        objectives[:, i] *= 1
-
-    # Find Pareto optimal points for the current main objective
-    pareto_mask = is_non_dominated(objectives)
-    pareto_indices_sets.append(set(np.where(pareto_mask.numpy())[0]))
-
-# Find common Pareto optimal points across all objectives
-common_pareto_indices = set.intersection(*pareto_indices_sets)
-pareto_df_old = df_old.iloc[list(common_pareto_indices)]
+# Non-dominated rank and crowding distance of every binder in one pass, rank 0 is the Pareto front
+ranks, crowding = pareto_sort(df_old[old_pAE_cols].to_numpy(), directions=directions)
+df_old['pareto_rank'] = ranks
+df_old['crowding_distance'] = crowding
+pareto_df_old = df_old[df_old['pareto_rank'] == 0]
 
 # Calculate and print the number of new Pareto-optimal binders
 num_old_pareto_optimal = len(pareto_df_old)
@@ -48,6 +36,17 @@ print(f"Number of new Pareto-optimal binders: {num_old_pareto_optimal}")
 
 
 
+# Pick at most 100 Pareto-optimal binders for folding, penalising near-identical sequences
+# ('penalty' or 'dpp'), None keeps the first 100 after sorting
+batch_selection = None
+if batch_selection is not None and 'sequence' in pareto_df_old.columns:
+    # Score every point by its mean normalised objective value, target A is minimized
+    signed = orient(pareto_df_old[old_pAE_cols].to_numpy(), directions)
+    span = np.ptp(signed, axis=0)
+    scores = ((signed - signed.min(axis=0)) / np.where(span > 0, span, 1)).mean(axis=1)
+    selected = select_batch(pareto_df_old['sequence'], scores, 100, method=batch_selection)
+    pareto_df_old = pareto_df_old.iloc[selected]
+
 # Plotting section (optional, if you want to visualize the results as well)
 # Sort Pareto-optimal points to get the top 20 based on the objectives
 sorted_pareto_df_old = pareto_df_old.sort_values(by=old_pAE_cols, ascending=[True] + ([False] * (len(old_pAE_cols) - 1)))
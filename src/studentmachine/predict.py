@@ -2,7 +2,14 @@ import proteusAI as pai
 import pandas as pd
 import time
 from uncertainty_analysis import UncertaintyAnalyzer
+from embedding_cache import EmbeddingCache
+from surrogates import MultiObjectiveSurrogate, PerObjectiveSurrogates
+from batch_scoring import score_candidates, ProteusSurrogates
+from acquisition import MultiObjectiveAcquisition
+from mutant_search import random_mutants, streaming_search
+from dataset_store import DatasetStore
 import os
+import pickle
 
 # Start total execution timer
 total_start_time = time.time()
@@ -10,9 +17,23 @@ total_start_time = time.time()
 # Initialize a list to store timepoints
 timepoints = []
 
+# Path to the dataset
+dataset_path = 'data/25_NLFR_esm2_ridge_ucb_1.csv'
+
+# Dataset store of dataset_store.py, if set the training data is read from its 'binders' table
+# instead of dataset_path: only the name, sequence, pae and plddt columns up to this iteration
+store_dir = None
+iteration = 1
+
 # Load the dataset
 start_time = time.time()
-df = pd.read_csv('data/25_NLFR_esm2_ridge_ucb_1.csv')
+if store_dir is not None:
+    store = DatasetStore(store_dir)
+    df = store.read('binders', columns=['name', 'binder_name', 'binder_seq', '*pae*', '*plddt*'], max_iteration=iteration)
+    if 'name' not in df.columns:
+        df = df.rename(columns={'binder_name': 'name'})
+else:
+    df = pd.read_csv(dataset_path)
 elapsed = time.time() - start_time
 timepoints.append({'Step': 'Load Dataset', 'Time (seconds)': elapsed})
 print(f"Dataset loaded in {elapsed:.2f} seconds.")
@@ -47,66 +68,193 @@ models = {}
 # Define the representation type
 x_type = 'esm2'
 
-# Train models for each target column
-for i, y_col in enumerate(y_cols):
-    start_time = time.time()
-    # Create a library and model for each target column
-    lib = pai.Library(source='data/25_NLFR_esm2_ridge_ucb_1.csv', names_col='name', seqs_col='binder_seq', y_col=y_col, y_type='num')
-    if x_type in ['esm2', 'esm1v']:
-        lib.compute(method='esm2')
-    libraries[y_col] = lib
-    model = pai.Model(library=lib, x=x_type, model_type='ridge', k_folds=5)
-    models[y_col] = model
-    model.train()  # Train the model
-    elapsed = time.time() - start_time
-    timepoints.append({'Step': f'Train Model for each target', 'Time (seconds)': elapsed})
-    print(f"Model trained in {elapsed:.2f} seconds.")
+# Define the surrogate model type and acquisition function
+model_type = 'ridge'
+acq_fn = 'ucb'
+
+# Joint acquisition over all target columns ('ehvi' or 'parego') used to rank the mutants
+# in 'multi' and 'parallel' mode. None ranks by the first target column's acquisition score
+mo_acq_fn = None
+
+# 'multi' fits all target columns against one shared feature matrix in a single pass,
+# 'parallel' trains one surrogate per target column concurrently in a process pool (e.g. mixed 'rf' and 'gp'),
+# 'per_objective' trains one ProteusAI model per target column
+training_mode = 'per_objective'
+
+# Surrogate type per target column in 'parallel' mode, columns not listed use model_type
+objective_model_types = {}
+n_workers = 8
+
+# Surrogate of the last iteration ('multi' and 'parallel' mode), if the file exists and was trained on a subset
+# of this dataset with the same settings, only the new binders are added with update() instead of training again.
+# Cross-validation runs again from scratch after full_refit_every updates
+surrogate_path = None
+full_refit_every = 5
+
+# Number of mutants embedded and scored at once
+chunk_size = 10000
 
+# 'random' samples random single mutants like ProteusAI's search with explore=1.0,
+# 'streaming' scores every mutant with up to max_order mutations chunk by chunk and keeps
+# only the top_k candidates per acquisition score plus the predicted Pareto set
+search_mode = 'random'
+max_order = 1
+top_k = 100
+
+# Penalise near-identical mutants when picking the highest uncertainty binders for the next fold round,
+# 'penalty' (local penalisation) or 'dpp' (determinantal), None keeps the plain top-N
+batch_selection = None
+length_scale = 3.0
+
+# Ensure the output directory exists
+output_dir = f'bo_results/{x_type}_{model_type}_{acq_fn}/'
+os.makedirs(output_dir, exist_ok=True)
+
+# Embedding cache shared by every library in this run and by later iterations
+embedding_cache_dir = 'data/embedding_cache'
+embedding_cache = EmbeddingCache(cache_dir=embedding_cache_dir)
+
+# Embed the binder sequences once, only sequences never seen before are computed
 start_time = time.time()
-# Get the first target column, task, and model
+embedding_cache.add(df['binder_seq'], x_type)
+elapsed = time.time() - start_time
+timepoints.append({'Step': 'Compute Embeddings', 'Time (seconds)': elapsed})
+print(f"Embeddings computed in {elapsed:.2f} seconds.")
+
+# Get the first target column and task
 first_y_col = y_cols[0]
 first_task = tasks[0]
-first_model = models[first_y_col]
 
-# Perform a search for the first target column to find new mutations and their predicted values
-search_out = first_model.search(optim_problem=first_task, acq_fn='ucb', explore=1.0) # explore 1.0 will test all mutations
+if training_mode in ['multi', 'parallel']:
+    start_time = time.time()
+    train_df = df.dropna(subset=y_cols)
+    X = embedding_cache.get(train_df['binder_seq'], x_type)
+    model_types = [objective_model_types.get(y_col, model_type) for y_col in y_cols] if training_mode == 'parallel' else model_type
+    saved = None
+    if surrogate_path is not None and os.path.exists(surrogate_path):
+        with open(surrogate_path, 'rb') as file:
+            saved = pickle.load(file)
+        # Binders dropped from the dataset or other settings need a new surrogate
+        if (saved['y_cols'], saved['model_types'], saved['x_type']) != (y_cols, model_types, x_type) or \
+                not set(saved['sequences']) <= set(train_df['binder_seq']):
+            saved = None
 
-# Save the search results to a CSV file
-search_out.to_csv(f'bo_results/proteus_esm2_ridge_ucb_{first_y_col}_25_1.csv')
+    if saved is not None:
+        surrogate = saved['surrogate']
+        new = ~train_df['binder_seq'].isin(set(saved['sequences'])).to_numpy()
+        surrogate.update(X[new], train_df[y_cols].to_numpy()[new])
+        train_sequences = saved['sequences'] + train_df['binder_seq'][new].tolist()
+        print(f"Surrogate of {surrogate_path} updated with {new.sum()} new binders.")
+    elif training_mode == 'multi':
+        # Train one surrogate for all target columns, reusing the same k-fold splits
+        surrogate = MultiObjectiveSurrogate(model_type=model_type, k_folds=5, full_refit_every=full_refit_every)
+        surrogate.fit(X, train_df[y_cols].to_numpy())
+        train_sequences = train_df['binder_seq'].tolist()
+    else:
+        # Train the surrogates of all target columns concurrently, timing records are kept per worker
+        surrogate = PerObjectiveSurrogates(model_types, k_folds=5, n_workers=n_workers, full_refit_every=full_refit_every)
+        surrogate.fit(X, train_df[y_cols].to_numpy(), y_cols=y_cols)
+        timepoints.extend(surrogate.timepoints)
+        train_sequences = train_df['binder_seq'].tolist()
 
+    if surrogate_path is not None:
+        tmp_path = surrogate_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump({'surrogate': surrogate, 'sequences': train_sequences, 'y_cols': y_cols,
+                         'model_types': model_types, 'x_type': x_type}, file)
+        os.replace(tmp_path, surrogate_path)
+    elapsed = time.time() - start_time
+    timepoints.append({'Step': 'Train Multi-Objective Model', 'Time (seconds)': elapsed})
+    print(f"Models for all targets trained in {elapsed:.2f} seconds.")
 
-elapsed = time.time() - start_time
-timepoints.append({'Step': f'Search for {first_y_col}', 'Time (seconds)': elapsed})
-print(f"Search completed and results saved in {elapsed:.2f} seconds.")
+    start_time = time.time()
+    mo_acquisition = None
+    if mo_acq_fn is not None:
+        # Honours the min/max direction of every target column
+        mo_acquisition = MultiObjectiveAcquisition(train_df[y_cols].to_numpy(), tasks, method=mo_acq_fn)
 
-# Create a list of predicted proteins (sequences) from the search results
-predicted_proteins = [pai.Protein(seq=row.sequence, name=row['name']) for i, row in search_out.iterrows()]
+    if search_mode == 'streaming':
+        # Exhaustive scan, all scored mutants are appended to a parquet file
+        top, front = streaming_search(train_df['name'], train_df['binder_seq'], surrogate, y_cols, tasks,
+                                      embedding_cache, x_type, acq_fn=acq_fn, max_order=max_order,
+                                      chunk_size=chunk_size, top_k=top_k,
+                                      out_file=os.path.join(output_dir, f'all_mutants_{x_type}_{model_type}_{acq_fn}_25_1.parquet'),
+                                      mo_acquisition=mo_acquisition)
+        search_out = pd.concat([*top.values(), front], ignore_index=True).drop_duplicates(subset='sequence')
+    else:
+        # Propose random single mutants of the binders (same sampling as explore=1.0)
+        search_out = random_mutants(train_df['name'], train_df['binder_seq'], max_eval=10000)
 
+        # Predictions, uncertainties and acquisition scores for all targets, each mutant is embedded once
+        search_out = search_out.assign(**score_candidates(search_out['sequence'], surrogate, y_cols, tasks,
+                                                          embedding_cache, x_type, acq_fn=acq_fn, chunk_size=chunk_size,
+                                                          mo_acquisition=mo_acquisition))
 
-start_time = time.time()
-# For each target column (except first_y_col)
-for y_col in y_cols[1:]:
-    model = models[y_col]
+    # Sort by the joint acquisition score, or by the first target column's like ProteusAI's search
+    sort_col = 'acq_score_moo' if mo_acquisition is not None else 'acq_score'
+    search_out = search_out.sort_values(by=sort_col, ascending=False).reset_index(drop=True)
+    extra = [] if sort_col == 'acq_score' else [sort_col]
+    search_out[['name', 'sequence', 'y_predicted', 'y_sigma', 'acq_score'] + extra].to_csv(f'bo_results/proteus_{x_type}_{model_type}_{acq_fn}_{first_y_col}_25_1.csv')
 
-    # Use the predict function to get predictions, uncertainties, and acquisition scores
-    val_data, y_val_pred, y_val_sigma, y_val, sorted_acq_score = model.predict(predicted_proteins, acq_fn='ucb')
+    elapsed = time.time() - start_time
+    timepoints.append({'Step': f'Search for {first_y_col}', 'Time (seconds)': elapsed})
+    print(f"Search and predictions for all targets completed in {elapsed:.2f} seconds.")
 
-    # Add predictions, uncertainties, and acquisition scores to the search_out DataFrame
-    search_out[f'predicted_{y_col}'] = y_val_pred
-    search_out[f'uncertainty_{y_col}'] = y_val_sigma
-    search_out[f'acq_Score_{y_col}'] = sorted_acq_score
+else:
+    # ProteusAI libraries load from a file, write the training columns once instead of
+    # reading the full dataset again for every target column
+    library_source = os.path.join(output_dir, f'training_data_{x_type}_{model_type}_{acq_fn}_25_1.csv')
+    df[['name', 'binder_seq'] + y_cols].to_csv(library_source, index=False)
 
-elapsed = time.time() - start_time
-timepoints.append({'Step': f'Predict for all targets', 'Time (seconds)': elapsed})
-print(f"Predictions for all targets completed in {elapsed:.2f} seconds.")
+    # Train models for each target column
+    for i, y_col in enumerate(y_cols):
+        start_time = time.time()
+        # Create a library and model for each target column
+        lib = pai.Library(source=library_source, names_col='name', seqs_col='binder_seq', y_col=y_col, y_type='num')
+        if x_type in ['esm2', 'esm1v']:
+            # Serve the library from the cache, so compute() finds every representation on disk
+            embedding_cache.export(lib, x_type)
+            lib.compute(method=x_type)
+        libraries[y_col] = lib
+        model = pai.Model(library=lib, x=x_type, model_type=model_type, k_folds=5)
+        models[y_col] = model
+        model.train()  # Train the model
+        elapsed = time.time() - start_time
+        timepoints.append({'Step': f'Train Model for each target', 'Time (seconds)': elapsed})
+        print(f"Model trained in {elapsed:.2f} seconds.")
 
+    start_time = time.time()
+    first_model = models[first_y_col]
+
+    # Perform a search for the first target column to find new mutations and their predicted values
+    search_out = first_model.search(optim_problem=first_task, acq_fn=acq_fn, explore=1.0) # explore 1.0 will test all mutations
+
+    # Save the search results to a CSV file
+    search_out.to_csv(f'bo_results/proteus_{x_type}_{model_type}_{acq_fn}_{first_y_col}_25_1.csv')
+
+    elapsed = time.time() - start_time
+    timepoints.append({'Step': f'Search for {first_y_col}', 'Time (seconds)': elapsed})
+    print(f"Search completed and results saved in {elapsed:.2f} seconds.")
+
+    start_time = time.time()
+    # Run the models of the other target columns on one shared embedding matrix of the mutants,
+    # the scores stay aligned with the rows of search_out
+    other_models = ProteusSurrogates([models[y_col] for y_col in y_cols[1:]])
+    search_out = search_out.assign(**score_candidates(search_out['sequence'], other_models, y_cols[1:], tasks[1:],
+                                                      embedding_cache, x_type, acq_fn=acq_fn, chunk_size=chunk_size,
+                                                      first_as_search=False))
+
+    elapsed = time.time() - start_time
+    timepoints.append({'Step': f'Predict for all targets', 'Time (seconds)': elapsed})
+    print(f"Predictions for all targets completed in {elapsed:.2f} seconds.")
 
-# Ensure the output directory exists
-output_dir = f'bo_results/esm2_ridge_ucb/'
-os.makedirs(output_dir, exist_ok=True)
 
-# Save the combined predictions to a CSV file
-search_out.to_csv('bo_results/esm2_ridge_ucb/proteus_esm2_ridge_ucb_25_1.csv')
+# Save the combined predictions to a CSV file. The acq_Score_<column> values come from score_candidates,
+# which negates 'min' objectives so a higher score is always better: for 'min' targets they have the
+# opposite sign of ProteusAI's model.predict output in CSVs written before batch scoring
+search_out.to_csv(os.path.join(output_dir, f'proteus_{x_type}_{model_type}_{acq_fn}_25_1.csv'))
+if store_dir is not None:
+    store.write('predictions', search_out, iteration, name=f'proteus_{x_type}_{model_type}_{acq_fn}')
 
 # Analyze the top 300 rows by uncertainty using UncertaintyAnalyzer
 start_time = time.time()
@@ -116,14 +264,22 @@ highest_uncertainty_dir = os.path.join(output_dir, "highest_uncertainty/")
 os.makedirs(highest_uncertainty_dir, exist_ok=True)
 
 # Save highest uncertainty results
+selected_file = os.path.join(highest_uncertainty_dir, f'proteus_sigma_100_{x_type}_{model_type}_{acq_fn}_25_1.csv')
 uncertainty_analyzer = UncertaintyAnalyzer(
-    input_file='bo_results/esm2_ridge_ucb/proteus_esm2_ridge_ucb_25_1.csv',
-    output_file='bo_results/esm2_ridge_ucb/highest_uncertainty/proteus_sigma_100_esm2_ridge_ucb_25_1.csv',
-    top_n=100
+    input_file=os.path.join(output_dir, f'proteus_{x_type}_{model_type}_{acq_fn}_25_1.csv'),
+    output_file=selected_file,
+    top_n=100,
+    diverse=batch_selection is not None,
+    method=batch_selection or 'penalty',
+    length_scale=length_scale
 )
 uncertainty_analyzer.load_data()
 uncertainty_analyzer.calculate_total_uncertainty()
 uncertainty_analyzer.save_top_binders()
+# Of all scored mutants only the selected ones are kept in the embedding cache, they are folded and
+# join the training data of the next round
+if os.path.exists(selected_file):
+    embedding_cache.add(pd.read_csv(selected_file)['sequence'], x_type)
 elapsed = time.time() - start_time
 timepoints.append({'Step': 'Uncertainty Analysis', 'Time (seconds)': elapsed})
 print(f"Uncertainty analysis completed in {elapsed:.2f} seconds.")
@@ -142,5 +298,5 @@ execution_time_dir = os.path.join(output_dir, "execution_time/")
 os.makedirs(execution_time_dir, exist_ok=True)
 
 # Save execution time
-timepoints_df.to_csv('bo_results/esm2_ridge_ucb/execution_time/execution_time_esm2_ridge_ucb_25_1.csv')
+timepoints_df.to_csv(os.path.join(execution_time_dir, f'execution_time_{x_type}_{model_type}_{acq_fn}_25_1.csv'))
 print("Timepoints saved to csv file")
\ No newline at end of file
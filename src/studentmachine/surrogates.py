@@ -0,0 +1,510 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold
+
+
+def r2_scores(y_true, y_pred):
+    """Coefficient of determination for every objective column at once."""
+    ss_res = np.sum((y_true - y_pred) ** 2, axis=0)
+    ss_tot = np.sum((y_true - y_true.mean(axis=0)) ** 2, axis=0)
+    return 1 - ss_res / np.where(ss_tot == 0, 1, ss_tot)
+
+
+def ridge_solve(X, Y, alpha=1.0):
+    """
+    Closed-form ridge regression with intercept for all objective columns in one solve.
+
+    Uses the primal system when there are fewer features than samples and the dual
+    (kernel) system otherwise, so esm2 features (1280) on a few hundred binders stay cheap.
+
+    Args:
+        X (np.ndarray): Features of shape (n_samples, n_features).
+        Y (np.ndarray): Targets of shape (n_samples, n_objectives).
+        alpha (float): Regularization strength (same default as sklearn's Ridge).
+
+    Returns:
+        tuple: Coefficients of shape (n_features, n_objectives) and intercepts of shape (n_objectives,).
+    """
+    x_mean = X.mean(axis=0)
+    y_mean = Y.mean(axis=0)
+    Xc = X - x_mean
+    Yc = Y - y_mean
+    n, d = Xc.shape
+    if d <= n:
+        A = Xc.T @ Xc
+        A[np.diag_indices_from(A)] += alpha
+        W = cho_solve(cho_factor(A), Xc.T @ Yc)
+    else:
+        K = Xc @ Xc.T
+        K[np.diag_indices_from(K)] += alpha
+        W = Xc.T @ cho_solve(cho_factor(K), Yc)
+    return W, y_mean - x_mean @ W
+
+
+def ridge_state(X, Y, alpha=1.0):
+    """
+    Factorized ridge fit that new rows can be added to, see ridge_update.
+
+    Like ridge_solve, the primal form is used when there are fewer features than samples: the
+    inverse of the regularized centered Gram matrix and running sums. Otherwise the dual form:
+    the Cholesky factor of X X^T + alpha I, with the intercept as the multiplier of the
+    constraint sum(a) = 0, which gives the same solution as centering.
+
+    Returns:
+        tuple: The state, tagged 'primal' or 'dual'.
+    """
+    n, d = X.shape
+    if d <= n:
+        Xc = X - X.mean(axis=0)
+        A = Xc.T @ Xc
+        A[np.diag_indices_from(A)] += alpha
+        P = cho_solve(cho_factor(A), np.eye(d))
+        return 'primal', n, X.sum(axis=0), Y.sum(axis=0), X.T @ Y, P
+    G = X @ X.T
+    G[np.diag_indices_from(G)] += alpha
+    return 'dual', alpha, X, Y, np.linalg.cholesky(G)
+
+
+def _dual_coefficients(X, Y, L):
+    # Solve [G + alpha I, 1; 1^T, 0] [a; b] = [Y; 0] with the Cholesky factor of G + alpha I
+    a = cho_solve((L, True), Y)
+    c = cho_solve((L, True), np.ones(len(X)))
+    b = a.sum(axis=0) / c.sum()
+    return X.T @ (a - np.outer(c, b)), b
+
+
+def ridge_update(state, X_new, Y_new):
+    """
+    Add rows to a ridge fit without solving it from scratch.
+
+    In the primal form adding k rows changes the centered Gram matrix by X_new^T X_new plus two
+    rank-one terms from the shift of the feature mean, a rank-(k + 2) Woodbury update of its
+    inverse costs O(d^2 k). In the dual form the Cholesky factor is extended by k rows in
+    O(n^2 k + n k d).
+
+    Args:
+        state (tuple): Output of ridge_state or of an earlier ridge_update.
+        X_new (np.ndarray): New features of shape (k, n_features).
+        Y_new (np.ndarray): New targets of shape (k, n_objectives).
+
+    Returns:
+        tuple: The updated state and the new coefficients and intercepts, as returned by ridge_solve.
+    """
+    if state[0] == 'dual':
+        _, alpha, X, Y, L = state
+        B = solve_triangular(L, X @ X_new.T, lower=True)
+        C = X_new @ X_new.T - B.T @ B
+        C[np.diag_indices_from(C)] += alpha
+        L = np.block([[L, np.zeros((len(L), len(X_new)))], [B.T, np.linalg.cholesky(C)]])
+        X = np.vstack([X, X_new])
+        Y = np.vstack([Y, Y_new])
+        return ('dual', alpha, X, Y, L), *_dual_coefficients(X, Y, L)
+
+    _, n, x_sum, y_sum, XtY, P = state
+    n_total = n + len(X_new)
+    x_sum_total = x_sum + X_new.sum(axis=0)
+    y_sum_total = y_sum + Y_new.sum(axis=0)
+    XtY = XtY + X_new.T @ Y_new
+    x_mean, x_mean_total = x_sum / n, x_sum_total / n_total
+
+    U = np.column_stack([X_new.T, x_mean, x_mean_total])
+    PU = P @ U
+    S = U.T @ PU
+    S[np.diag_indices_from(S)] += np.concatenate([np.ones(len(X_new)), [1 / n, -1 / n_total]])
+    P = P - PU @ np.linalg.solve(S, PU.T)
+
+    y_mean = y_sum_total / n_total
+    W = P @ (XtY - n_total * np.outer(x_mean_total, y_mean))
+    return ('primal', n_total, x_sum_total, y_sum_total, XtY, P), W, y_mean - x_mean_total @ W
+
+
+def rbf_kernel(A, B, lengthscale):
+    """Squared exponential kernel between the rows of A and B."""
+    sq_dist = (A ** 2).sum(axis=1)[:, None] + (B ** 2).sum(axis=1)[None, :] - 2 * A @ B.T
+    return np.exp(-0.5 * np.maximum(sq_dist, 0) / lengthscale ** 2)
+
+
+class BatchedGP:
+    def __init__(self, lengthscale=None, noise=None):
+        """
+        Exact GP regression sharing one RBF kernel (and one Cholesky factor) across all
+        objective columns. Targets are standardized per column.
+
+        Args:
+            lengthscale (float): RBF lengthscale. Default None, chosen by marginal likelihood.
+            noise (float): Noise variance on standardized targets. Default None, chosen by marginal likelihood.
+        """
+        self.lengthscale = lengthscale
+        self.noise = noise
+
+    def _factor(self, X, lengthscale, noise):
+        K = rbf_kernel(X, X, lengthscale)
+        K[np.diag_indices_from(K)] += noise
+        return np.linalg.cholesky(K)
+
+    def fit(self, X, Y):
+        self.X = X
+        self.y_mean = Y.mean(axis=0)
+        self.y_std = Y.std(axis=0)
+        self.y_std[self.y_std == 0] = 1
+        Z = (Y - self.y_mean) / self.y_std
+
+        # Grid search on the summed log marginal likelihood of all objectives
+        if self.lengthscale is None or self.noise is None:
+            sq_dist = (X ** 2).sum(axis=1)[:, None] + (X ** 2).sum(axis=1)[None, :] - 2 * X @ X.T
+            median = np.sqrt(np.median(np.maximum(sq_dist[np.triu_indices(len(X), k=1)], 0))) if len(X) > 1 else 1.0
+            lengthscales = [self.lengthscale] if self.lengthscale else [median * f for f in (0.5, 1.0, 2.0)]
+            noises = [self.noise] if self.noise else [1e-3, 1e-2, 1e-1, 1.0]
+            best = None
+            for lengthscale in lengthscales:
+                for noise in noises:
+                    L = self._factor(X, lengthscale, noise)
+                    a = cho_solve((L, True), Z)
+                    lml = -0.5 * np.sum(Z * a) - Z.shape[1] * np.sum(np.log(np.diag(L)))
+                    if best is None or lml > best[0]:
+                        best = (lml, lengthscale, noise)
+            _, self.lengthscale, self.noise = best
+
+        self.L = self._factor(X, self.lengthscale, self.noise)
+        self.Z = Z
+        self.alpha = cho_solve((self.L, True), Z)
+        return self
+
+    def update(self, X, Y):
+        """
+        Add observations by extending the cached Cholesky factor with their rows.
+
+        The kernel hyperparameters and the target standardization of the last fit are kept, so
+        the cost is O(n^2 k) for k new points instead of O(n^3).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        Z = (np.asarray(Y, dtype=np.float64).reshape(len(X), -1) - self.y_mean) / self.y_std
+        B = solve_triangular(self.L, rbf_kernel(self.X, X, self.lengthscale), lower=True)
+        K = rbf_kernel(X, X, self.lengthscale)
+        K[np.diag_indices_from(K)] += self.noise
+        L_new = np.linalg.cholesky(K - B.T @ B)
+        self.L = np.block([[self.L, np.zeros((len(self.L), len(X)))], [B.T, L_new]])
+        self.X = np.vstack([self.X, X])
+        self.Z = np.vstack([self.Z, Z])
+        self.alpha = cho_solve((self.L, True), self.Z)
+        return self
+
+    def predict(self, X):
+        Ks = rbf_kernel(X, self.X, self.lengthscale)
+        mean = Ks @ self.alpha
+        v = solve_triangular(self.L, Ks.T, lower=True)
+        var = np.maximum(1 - np.sum(v ** 2, axis=0), 0)
+        sigma = np.sqrt(var)[:, None] * self.y_std
+        return mean * self.y_std + self.y_mean, sigma
+
+
+class MultiObjectiveSurrogate:
+    model_types = ['ridge', 'rf', 'gp']
+
+    def __init__(self, model_type='ridge', k_folds=5, alpha=1.0, n_estimators=100, seed=42, n_jobs=-1,
+                 full_refit_every=None):
+        """
+        Initialize a surrogate that fits all objective columns against one shared feature matrix.
+
+        'ridge' and 'rf' train one model per fold (the same k-fold splits for every objective)
+        and use the ensemble spread as uncertainty, like ProteusAI does. 'gp' uses the same
+        folds for validation only and takes its uncertainty from the GP posterior.
+
+        New observations can be added with update() instead of training from scratch, see there.
+
+        Args:
+            model_type (str): Surrogate type, one of 'ridge', 'rf' or 'gp'.
+            k_folds (int): Number of cross-validation folds.
+            alpha (float): Ridge regularization strength.
+            n_estimators (int): Number of trees per fold for 'rf'.
+            seed (int): Random seed for the fold splits and forests.
+            n_jobs (int): Number of cores used by each forest. Default -1 for all cores.
+            full_refit_every (int): Number of update() calls after which the surrogate is trained
+                from scratch with cross-validation again. Default None, never.
+        """
+        if model_type not in self.model_types:
+            raise ValueError(f"Model type '{model_type}' has not been implemented yet")
+        self.model_type = model_type
+        self.k_folds = k_folds
+        self.alpha = alpha
+        self.n_estimators = n_estimators
+        self.seed = seed
+        self.n_jobs = n_jobs
+        self.full_refit_every = full_refit_every
+        self.models = []
+        self.val_r2 = None
+        self.update_r2 = None
+        self.n_updates = 0
+
+    def _fit_one(self, X, Y):
+        """Fit a single model of the configured type on all objectives."""
+        if self.model_type == 'ridge':
+            return ridge_solve(X, Y, self.alpha)
+        elif self.model_type == 'rf':
+            model = RandomForestRegressor(n_estimators=self.n_estimators, random_state=self.seed, n_jobs=self.n_jobs)
+            return model.fit(X, Y if Y.shape[1] > 1 else Y[:, 0])
+        else:
+            return BatchedGP().fit(X, Y)
+
+    def _predict_one(self, model, X):
+        if self.model_type == 'ridge':
+            W, b = model
+            return X @ W + b
+        elif self.model_type == 'rf':
+            return model.predict(X).reshape(len(X), -1)
+        else:
+            return model.predict(X)[0]
+
+    def fit(self, X, Y):
+        """
+        Train the surrogate for all objectives in one pass.
+
+        Args:
+            X (np.ndarray): Shared feature matrix of shape (n_samples, n_features).
+            Y (np.ndarray): Objective values of shape (n_samples, n_objectives).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+        self.X_train = X
+        self.Y_train = Y
+
+        # Same splits for every objective
+        kf = KFold(n_splits=self.k_folds, shuffle=True, random_state=self.seed)
+        self.splits = list(kf.split(X))
+
+        fold_r2 = []
+        self.models = []
+        for train_index, val_index in self.splits:
+            model = self._fit_one(X[train_index], Y[train_index])
+            fold_r2.append(r2_scores(Y[val_index], self._predict_one(model, X[val_index])))
+            self.models.append(model)
+        self.val_r2 = np.mean(fold_r2, axis=0)
+
+        # The GP ensemble is replaced by a single GP on all data
+        if self.model_type == 'gp':
+            self.models = [self._fit_one(X, Y)]
+
+        # Ridge statistics for update() are built when first needed
+        self.ridge_states = [None] * len(self.models)
+        self.n_updates = 0
+
+        print(f"Training completed:\nval_r2:\t{np.round(self.val_r2, 3).tolist()}")
+        return self
+
+    def update(self, X_new, Y_new):
+        """
+        Add new observations without training from scratch.
+
+        'ridge' folds get a rank-k update of their solution (see ridge_update), 'rf' folds grow
+        new trees on their updated training rows while the old trees are kept (the number of
+        new trees follows the share of new rows), 'gp' extends its Cholesky factor with the
+        hyperparameters of the last fit. Every new point is held out by one fold, in turn, so
+        the folds stay disjoint. Cross-validation is not run again: val_r2 stays that of the
+        last fit and update_r2 holds the score of the surrogate on the new points before they
+        were added. After full_refit_every updates the surrogate is trained from scratch.
+
+        Args:
+            X_new (np.ndarray): Features of shape (k, n_features).
+            Y_new (np.ndarray): Objective values of shape (k, n_objectives).
+        """
+        X_new = np.asarray(X_new, dtype=np.float64)
+        Y_new = np.asarray(Y_new, dtype=np.float64).reshape(len(X_new), -1)
+        # A single new point has no R², the score of an earlier update must not be reported for it
+        self.update_r2 = None
+        if len(X_new) == 0:
+            return self
+        X = np.vstack([self.X_train, X_new])
+        Y = np.vstack([self.Y_train, Y_new])
+        if len(X_new) > 1:
+            self.update_r2 = r2_scores(Y_new, self.predict(X_new)[0])
+        self.n_updates += 1
+        if self.full_refit_every is not None and self.n_updates >= self.full_refit_every:
+            print(f"{self.n_updates} updates since the last fit, training from scratch")
+            return self.fit(X, Y)
+
+        n_old = len(self.X_train)
+        folds = (n_old + np.arange(len(X_new))) % len(self.splits)
+        new_index = n_old + np.arange(len(X_new))
+        if self.model_type == 'ridge':
+            for f, (train_index, _) in enumerate(self.splits):
+                if self.ridge_states[f] is None:
+                    self.ridge_states[f] = ridge_state(self.X_train[train_index], self.Y_train[train_index], self.alpha)
+        self.splits = [(np.concatenate([train_index, new_index[folds != f]]), np.concatenate([val_index, new_index[folds == f]]))
+                       for f, (train_index, val_index) in enumerate(self.splits)]
+
+        if self.model_type == 'ridge':
+            for f in range(len(self.models)):
+                added = folds != f
+                if added.any():
+                    self.ridge_states[f], W, b = ridge_update(self.ridge_states[f], X_new[added], Y_new[added])
+                    self.models[f] = (W, b)
+        elif self.model_type == 'rf':
+            for f, (train_index, _) in enumerate(self.splits):
+                n_added = int(np.sum(folds != f))
+                if n_added:
+                    model = self.models[f]
+                    n_trees = max(1, int(np.ceil(self.n_estimators * n_added / len(train_index))))
+                    model.set_params(warm_start=True, n_estimators=model.n_estimators + n_trees)
+                    model.fit(X[train_index], Y[train_index] if Y.shape[1] > 1 else Y[train_index, 0])
+        else:
+            self.models[0].update(X_new, Y_new)
+
+        self.X_train = X
+        self.Y_train = Y
+        if self.update_r2 is not None:
+            print(f"Updated with {len(X_new)} points:\nupdate_r2:\t{np.round(self.update_r2, 3).tolist()}")
+        return self
+
+    def predict(self, X, batch_size=10000):
+        """
+        Predict all objectives for a feature matrix.
+
+        Args:
+            X (np.ndarray): Feature matrix of shape (n_samples, n_features).
+            batch_size (int): Number of rows predicted at once.
+
+        Returns:
+            tuple: Means and sigmas, both of shape (n_samples, n_objectives).
+        """
+        n_obj = self.Y_train.shape[1]
+        mean = np.empty((len(X), n_obj))
+        sigma = np.empty((len(X), n_obj))
+        for i in range(0, len(X), batch_size):
+            x = np.asarray(X[i:i + batch_size], dtype=np.float64)
+            if self.model_type == 'gp':
+                mean[i:i + len(x)], sigma[i:i + len(x)] = self.models[0].predict(x)
+            elif self.model_type == 'ridge':
+                # One matrix product for all folds and objectives
+                W = np.stack([W for W, _ in self.models], axis=1).reshape(x.shape[1], -1)
+                b = np.stack([b for _, b in self.models]).reshape(-1)
+                preds = (x @ W + b).reshape(len(x), len(self.models), n_obj)
+                mean[i:i + len(x)] = preds.mean(axis=1)
+                sigma[i:i + len(x)] = preds.std(axis=1)
+            else:
+                preds = np.stack([self._predict_one(model, x) for model in self.models], axis=1)
+                mean[i:i + len(x)] = preds.mean(axis=1)
+                sigma[i:i + len(x)] = preds.std(axis=1)
+        return mean, sigma
+
+    def y_best(self, tasks):
+        """Best observed value of every objective, in the direction given by tasks ('min' or 'max')."""
+        return np.array([self.Y_train[:, j].max() if task == 'max' else self.Y_train[:, j].min()
+                         for j, task in enumerate(tasks)])
+
+
+def _train_objective(shm_name, shape, dtype, y, y_col, model_type, k_folds, seed):
+    """Worker: train the surrogate of one objective on the shared feature matrix."""
+    start_time = time.time()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        X = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        surrogate = MultiObjectiveSurrogate(model_type=model_type, k_folds=k_folds, seed=seed, n_jobs=1)
+        surrogate.fit(X, y.reshape(-1, 1))
+        # Nothing returned to the main process may point into the shared buffer
+        surrogate.X_train = None
+        if model_type == 'gp':
+            surrogate.models[0].X = surrogate.models[0].X.copy()
+        del X
+    finally:
+        shm.close()
+    elapsed = time.time() - start_time
+    timepoint = {'Step': f'Train Model for {y_col}', 'Worker': os.getpid(), 'Time (seconds)': elapsed}
+    return surrogate, timepoint
+
+
+class PerObjectiveSurrogates:
+    def __init__(self, model_types, k_folds=5, n_workers=None, seed=42, full_refit_every=None):
+        """
+        Initialize one surrogate per objective column, trained concurrently in a process pool.
+
+        Used when the surrogates cannot be merged into one MultiObjectiveSurrogate, e.g. with
+        mixed 'rf' and 'gp' model types. The feature matrix is placed in shared memory once,
+        so it is not pickled for every task.
+
+        Args:
+            model_types (list): Surrogate type for every objective column.
+            k_folds (int): Number of cross-validation folds.
+            n_workers (int): Number of worker processes. Default None for one per core.
+            seed (int): Random seed.
+            full_refit_every (int): Number of update() calls after which all surrogates are trained
+                from scratch in the pool again. Default None, never.
+        """
+        self.model_types = list(model_types)
+        self.k_folds = k_folds
+        self.n_workers = n_workers
+        self.seed = seed
+        self.full_refit_every = full_refit_every
+        self.n_updates = 0
+        self.surrogates = []
+        self.timepoints = []
+
+    def fit(self, X, Y, y_cols=None):
+        """
+        Train the surrogates of all objectives in parallel.
+
+        Args:
+            X (np.ndarray): Shared feature matrix of shape (n_samples, n_features).
+            Y (np.ndarray): Objective values of shape (n_samples, n_objectives).
+            y_cols (list): Objective names used in the timing records. Default None.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+        if y_cols is None:
+            y_cols = [f'objective_{j}' for j in range(Y.shape[1])]
+        self.Y_train = Y
+
+        shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [executor.submit(_train_objective, shm.name, X.shape, X.dtype, Y[:, j], y_col,
+                                           model_type, self.k_folds, self.seed)
+                           for j, (y_col, model_type) in enumerate(zip(y_cols, self.model_types))]
+                results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+        self.surrogates = [surrogate for surrogate, _ in results]
+        self.timepoints = [timepoint for _, timepoint in results]
+        self.val_r2 = np.concatenate([surrogate.val_r2 for surrogate in self.surrogates])
+        # The workers dropped their view of the shared features, update() needs them
+        for surrogate in self.surrogates:
+            surrogate.X_train = X
+        self.y_cols = y_cols
+        self.n_updates = 0
+        return self
+
+    def update(self, X_new, Y_new):
+        """
+        Add new observations to every surrogate, see MultiObjectiveSurrogate.update.
+
+        After full_refit_every updates all surrogates are trained from scratch in the pool.
+        """
+        X_new = np.asarray(X_new, dtype=np.float64)
+        Y_new = np.asarray(Y_new, dtype=np.float64).reshape(len(X_new), -1)
+        if len(X_new) == 0:
+            return self
+        self.n_updates += 1
+        if self.full_refit_every is not None and self.n_updates >= self.full_refit_every:
+            X = np.vstack([self.surrogates[0].X_train, X_new])
+            return self.fit(X, np.vstack([self.Y_train, Y_new]), y_cols=self.y_cols)
+        for j, surrogate in enumerate(self.surrogates):
+            surrogate.update(X_new, Y_new[:, [j]])
+        self.Y_train = np.vstack([self.Y_train, Y_new])
+        return self
+
+    def predict(self, X, batch_size=10000):
+        """Predict all objectives, returns means and sigmas of shape (n_samples, n_objectives)."""
+        preds = [surrogate.predict(X, batch_size=batch_size) for surrogate in self.surrogates]
+        return np.hstack([mean for mean, _ in preds]), np.hstack([sigma for _, sigma in preds])
+
+    def y_best(self, tasks):
+        """Best observed value of every objective, in the direction given by tasks ('min' or 'max')."""
+        return np.array([self.Y_train[:, j].max() if task == 'max' else self.Y_train[:, j].min()
+                         for j, task in enumerate(tasks)])
@@ -1,24 +1,35 @@
 import pandas as pd
 import os
+from batch_selection import select_batch
 
 class UncertaintyAnalyzer:
-    def __init__(self, input_file, output_file, top_n=300):
+    def __init__(self, input_file, output_file, top_n=300, diverse=False, method='penalty', length_scale=3.0):
         """
         Initialize the analyzer with input and output file paths and the number of top rows to select.
 
         Args:
-            input_file (str): Path to the input CSV file.
+            input_file (str): Path to the input CSV file, or a Parquet file or dataset folder.
             output_file (str): Path to save the output CSV file.
             top_n (int): Number of top rows to select based on total uncertainty.
+            diverse (bool): Penalise near-identical sequences, so the selection is not made
+                up of mutants of the same parent. See batch_selection.select_batch.
+            method (str): 'penalty' or 'dpp', used when diverse is True.
+            length_scale (float): Number of mutations over which the redundancy penalty decays.
         """
         self.input_file = input_file
         self.output_file = output_file
         self.top_n = top_n
+        self.diverse = diverse
+        self.method = method
+        self.length_scale = length_scale
         self.df = None
 
     def load_data(self):
-        """Load the dataset from the specified CSV file."""
-        self.df = pd.read_csv(self.input_file)
+        """Load the dataset from the specified CSV file (or Parquet file or dataset folder)."""
+        if self.input_file.endswith('.parquet') or os.path.isdir(self.input_file):
+            self.df = pd.read_parquet(self.input_file)
+        else:
+            self.df = pd.read_csv(self.input_file)
         print(f"Data loaded from {self.input_file}")
 
     def calculate_total_uncertainty(self):
@@ -32,8 +43,13 @@ class UncertaintyAnalyzer:
     def get_top_n_by_uncertainty(self):
         """Sort the data by total uncertainty and select the top N rows."""
         if 'total_uncertainty' in self.df.columns:
-            df_sorted = self.df.sort_values(by='total_uncertainty', ascending=False)
-            top_binders = df_sorted.head(self.top_n)
+            if self.diverse:
+                selected = select_batch(self.df['sequence'], self.df['total_uncertainty'].to_numpy(), self.top_n,
+                                        method=self.method, length_scale=self.length_scale)
+                top_binders = self.df.iloc[selected]
+            else:
+                df_sorted = self.df.sort_values(by='total_uncertainty', ascending=False)
+                top_binders = df_sorted.head(self.top_n)
             print(f"Top {self.top_n} rows by uncertainty selected.")
             return top_binders
         else: